@@ -0,0 +1,95 @@
+"""콜드 스타트: `import main` 시간과 프로세스 시작부터 첫 응답까지의 시간 (time-to-first-request).
+
+1) python -X importtime -c "import main" 을 --runs 번 실행해 main 의 누적 임포트 시간 중앙값과
+   가장 무거운 최상위 임포트를 보고하고, 임포트 직후 이미 올라온 무거운 SDK 를 나열한다.
+2) uvicorn main:app 을 새 프로세스로 띄워 /ping 이 처음 200 을 돌려줄 때까지의 시간과,
+   이어서 보낸 첫 /pro-responses(저장소 클라이언트 필요) 요청의 지연을 CLIENT_WARMUP=0/1 로 잰다.
+   저장소는 SQLite(:memory:), OpenAI 키는 가짜 값을 쓴다 (네트워크 호출 없음).
+실행: python benchmarks/bench_cold_start.py [--runs 5] [--port 8790]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("openai", "supabase", "httpx", "pyarrow", "openpyxl", "PyPDF2", "pandas")
+
+
+def env(**extra):
+    return {**os.environ, "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": ":memory:",
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake"), **extra}
+
+
+def import_profile():
+    """(main 누적 임포트 시간 us, [(누적 us, 최상위 모듈)])"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                          cwd=ROOT, env=env(), capture_output=True, text=True, check=True)
+    total, top = 0, []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if name.strip() == "main" and depth == 0:
+            total = int(cumulative)
+        elif depth == 1:
+            top.append((int(cumulative), name.strip()))
+    return total, sorted(top, reverse=True)
+
+
+def loaded_heavy():
+    code = f"import sys, main; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env(), capture_output=True, text=True,
+                          check=True)
+    return proc.stdout.strip() or "-"
+
+
+def first_request(port, warmup):
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env(CLIENT_WARMUP=warmup), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as http:
+            while True:
+                try:
+                    if http.get("/ping").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            ttfr = time.perf_counter() - start
+            t = time.perf_counter()
+            http.post("/pro-responses", json={"user_id": "bench", "response": {}}).raise_for_status()
+            return ttfr, time.perf_counter() - t
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    print(f"import main: median {statistics.median(p[0] for p in profiles) / 1000:.0f} ms ({args.runs} runs)")
+    for cumulative, name in profiles[-1][1][:8]:
+        print(f"  {name:28s} {cumulative / 1000:8.1f} ms")
+    print(f"heavy SDKs loaded by import: {loaded_heavy()}")
+
+    print(f"\n{'CLIENT_WARMUP':>13s} | {'first /ping ms':>14s} | {'first /pro-responses ms':>23s}")
+    for warmup in ("0", "1"):
+        runs = [first_request(args.port, warmup) for _ in range(args.runs)]
+        print(f"{warmup:>13s} | {statistics.median(r[0] for r in runs) * 1000:14.0f} | "
+              f"{statistics.median(r[1] for r in runs) * 1000:23.1f}")
+
+
+if __name__ == "__main__":
+    main_()
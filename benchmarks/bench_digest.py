@@ -0,0 +1,49 @@
+"""/health-report 프롬프트 크기 비교: raw(원본 JSON) 모드 vs digest(사전 집계) 모드.
+
+tiktoken 이 설치되어 있으면 o200k_base 기준 토큰 수를, 없으면 문자 수를 보고한다.
+실행: python benchmarks/bench_digest.py
+"""
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main  # noqa: E402
+
+try:
+    import tiktoken
+    _enc = tiktoken.get_encoding("o200k_base")
+
+    def size(text):
+        return len(_enc.encode(text))
+    UNIT = "tokens"
+except ImportError:
+    def size(text):
+        return len(text)
+    UNIT = "chars"
+
+
+def measure(sources):
+    row = []
+    for digest in (False, True):
+        start = time.perf_counter()
+        prompt = main._build_report_prompt([(label, lambda t=text: t) for label, text in sources], digest)
+        row.append((size(prompt), (time.perf_counter() - start) * 1000))
+    return row
+
+
+def main_():
+    paths = sorted(glob.glob(os.path.join(ROOT, "fhir", "*.json")))
+    sources = [(os.path.basename(p), main._read_text_file(p)) for p in paths]
+    print(f"{'input':45s} {'raw ' + UNIT:>12s} {'digest ' + UNIT:>14s} {'ratio':>7s} {'digest ms':>10s}")
+    cases = [(label, [(label, text)]) for label, text in sources] + [("fhir/* (전체)", sources)]
+    for label, src in cases:
+        (raw, _), (dig, ms) = measure(src)
+        print(f"{label:45s} {raw:12d} {dig:14d} {raw / dig:6.1f}x {ms:10.1f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,108 @@
+"""/export-data 출력 형식별 첫 바이트 시간, 최대 메모리(tracemalloc), 크기, 로드 시간 측정.
+
+합성 코호트(사용자 N명, 테이블별 사용자당 0~4행)를 fake Supabase 에 넣고
+형식별 스트림을 소비하면서 첫 데이터 청크까지의 시간과 파이프라인이 할당한 최대 메모리를 잰다.
+fake DB 자체가 점유하는 메모리는 측정 전에 할당되므로 제외되고, 모아 둔 출력 바이트는 포함된다.
+load 는 분석 쪽에서 pandas 로 읽어 EHR 행을 dict 로 복원하기까지의 시간이다.
+
+실행: python benchmarks/bench_export.py [--users 1000 2000 4000] [--formats csv parquet arrow]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import export_columnar  # noqa: E402
+import export_stream  # noqa: E402
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+
+
+def build_cohort(n_users, seed=0):
+    rng = random.Random(seed)
+    db = FakeSupabase()
+    db.tables["users"] = [{"id": i + 1, "name_hash": f"user-{i:07d}"} for i in range(n_users)]
+    db.tables["pro_responses"] = [
+        {"id": i + 1, "user_id": f"user-{i:07d}", "response": {"q1": rng.randint(1, 5), "q2": "응답"}}
+        for i in range(n_users)
+    ]
+    for _, table in export_stream.EHR_TABLES:
+        rows = db.tables[table] = []
+        for uid in range(1, n_users + 1):
+            for _ in range(rng.randint(0, 4)):
+                rows.append({"id": len(rows) + 1, "user_id": uid, "resource_id": uid * 100 + len(rows),
+                             "age": rng.randint(1, 90), "medication_code": f"{rng.randint(0, 999999):06d}",
+                             "medication_name": "약품", "pharmacy_name": "온누리약국",
+                             "when_prepared": "2024-01-01", "days_supply": rng.randint(1, 30),
+                             "vaccine_name": "인플루엔자", "occurrence_date": "2023-10-01", "dose_number": 1,
+                             "claim_type": "외래", "created_date": "2024-02-01",
+                             "copay_amount": rng.randint(1000, 50000), "benefit_amount": rng.randint(0, 90000)})
+    return db
+
+
+def stream(db, fmt):
+    if fmt == "csv":
+        # BOM 만 있는 첫 청크는 건너뛴다
+        chunks = export_stream.iter_wide_csv(db)
+        yield next(chunks) + next(chunks, b"")
+        yield from chunks
+    else:
+        yield from export_columnar.iter_columnar(db, fmt)
+
+
+def load(fmt, data):
+    """분석 쪽 로드: DataFrame 과 EHR 행(dict)까지 복원"""
+    if fmt == "csv":
+        df = pd.read_csv(io.BytesIO(data), encoding="utf-8-sig", dtype=str, keep_default_na=False)
+        cells = [json.loads(v) for col in df.columns[2:] for v in df[col] if v]
+        return len(df), len(cells)
+    if fmt == "parquet":
+        df = pd.read_parquet(io.BytesIO(data))
+    else:
+        df = pa.ipc.open_stream(data).read_all().to_pandas()
+    return len(df), len(df)
+
+
+def measure(db, fmt):
+    tracemalloc.start()
+    start = time.perf_counter()
+    ttfb = None
+    out = []
+    for chunk in stream(db, fmt):
+        if ttfb is None:
+            ttfb = time.perf_counter() - start
+        out.append(chunk)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    data = b"".join(out)
+    start = time.perf_counter()
+    load(fmt, data)
+    return ttfb, elapsed, peak, len(data), time.perf_counter() - start
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 2000, 4000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet", "arrow"])
+    args = parser.parse_args()
+    print(f"{'users':>7s} {'format':>8s} {'size(MB)':>9s} {'first data(s)':>14s} {'total(s)':>9s} "
+          f"{'peak alloc(MB)':>15s} {'load(s)':>8s}")
+    for n in args.users:
+        db = build_cohort(n)
+        for fmt in args.formats:
+            ttfb, elapsed, peak, size, load_s = measure(db, fmt)
+            print(f"{n:7d} {fmt:>8s} {size / 1e6:9.2f} {ttfb:14.2f} {elapsed:9.2f} {peak / 1e6:15.1f} {load_s:8.3f}")
+
+
+if __name__ == "__main__":
+    main_()
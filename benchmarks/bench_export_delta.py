@@ -0,0 +1,88 @@
+"""/export-data 전체 내보내기 vs 증분(delta) 내보내기: 하루치 변경만 가져올 때의 크기, 행 수, 시간.
+
+bench_export 의 합성 코호트(사용자 N명)를 모두 예전 변경 번호로 두고 커서를 잡은 뒤,
+--new 비율의 신규 사용자(응답 + EHR 행)와 --changed 비율의 기존 EHR 행 수정을 새 변경 번호로 기록한다.
+전체 내보내기(csv, parquet)와 그 커서 이후의 delta(ndjson, parquet)를 소비하면서 시간과 크기를 잰다.
+--latency 는 fake Supabase 요청당 지연(초)이다.
+
+실행: python benchmarks/bench_export_delta.py [--users 2000 8000] [--new 0.01] [--changed 0.02] [--latency 0]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import export_columnar  # noqa: E402
+import export_delta  # noqa: E402
+import export_stream  # noqa: E402
+from bench_export import build_cohort  # noqa: E402
+
+
+def seed(n_users, new, changed, latency):
+    """(db, 커서) - 커서 이후에 신규 사용자와 수정된 행이 생긴 코호트"""
+    db = build_cohort(n_users)
+    old = export_delta.next_change_seq()
+    for table in export_delta.CHANGE_TABLES:
+        for row in db.tables[table]:
+            row["change_seq"] = old
+    cursor = export_delta.next_change_seq()
+
+    rng = random.Random(1)
+    fresh = build_cohort(max(1, int(n_users * new)), seed=1)
+    offset = len(db.tables["users"])
+    for user in fresh.tables["users"]:
+        db.tables["users"].append({"id": user["id"] + offset, "name_hash": f"new-{user['name_hash']}"})
+    for row in fresh.tables["pro_responses"]:
+        db.tables["pro_responses"].append({**row, "id": row["id"] + offset, "user_id": f"new-{row['user_id']}",
+                                           "change_seq": export_delta.next_change_seq()})
+    for _, table in export_stream.EHR_TABLES:
+        rows = db.tables[table]
+        for row in rng.sample(rows, int(len(rows) * changed)):
+            row["days_supply"] = rng.randint(1, 30)
+            row["change_seq"] = export_delta.next_change_seq()
+        base = len(rows)
+        for row in fresh.tables[table]:
+            rows.append({**row, "id": row["id"] + base, "user_id": row["user_id"] + offset,
+                         "change_seq": export_delta.next_change_seq()})
+    db.latency = latency
+    return db, cursor
+
+
+def measure(chunks):
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in chunks)
+    return size, time.perf_counter() - start
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[2000, 8000])
+    parser.add_argument("--new", type=float, default=0.01)
+    parser.add_argument("--changed", type=float, default=0.02)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    print(f"{'users':>7s} {'export':>16s} {'rows':>8s} {'size(MB)':>9s} {'time(s)':>8s} {'round trips':>11s}")
+    for n in args.users:
+        db, cursor = seed(n, args.new, args.changed, args.latency)
+        until = export_delta.next_change_seq()
+        total_rows = sum(len(db.tables[t]) for t in export_delta.CHANGE_TABLES)
+        delta_rows = sum(len(rows) for _, rows in export_delta.iter_changes(db, cursor, until))
+        cases = [
+            ("full csv", total_rows, lambda: export_stream.iter_wide_csv(db)),
+            ("full parquet", total_rows, lambda: export_columnar.iter_columnar(db, "parquet")),
+            ("delta ndjson", delta_rows, lambda: export_delta.iter_ndjson(db, cursor, until)),
+            ("delta parquet", delta_rows, lambda: export_columnar.iter_columnar_delta(db, "parquet", cursor, until)),
+        ]
+        for label, rows, run in cases:
+            db.reset_counters()
+            size, elapsed = measure(run())
+            print(f"{n:7d} {label:>16s} {rows:8d} {size / 1e6:9.3f} {elapsed:8.3f} {db.round_trips:11d}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,119 @@
+"""/export-data Excel 출력: pandas + openpyxl(BytesIO) vs write-only 스트리밍(임시 파일).
+
+medication_dispenses 를 N행(나머지 EHR 테이블은 N/10행) 넣은 fake Supabase 로
+워크북 생성 시간과 최대 메모리를 비교한다. 기존 방식은 행을 모두 리스트로 모은 뒤
+DataFrame 4개를 만들어 메모리 버퍼에 쓰던 이전 구현 그대로다.
+
+측정마다 별도 프로세스를 띄우고, fake DB 를 채운 뒤 최대 RSS 기록을 초기화해서
+(/proc/self/clear_refs) 생성 과정에서 늘어난 RSS 만 잰다. (Linux 전용)
+
+실행: python benchmarks/bench_export_excel.py [--rows 1000 10000 100000]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd  # noqa: E402
+
+import export_excel  # noqa: E402
+import export_stream  # noqa: E402
+from bench_upload_memory import vm_hwm_kb, vm_rss_kb  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+
+ROWS_PER_USER = 50
+
+
+def build_cohort(n_rows, seed=0):
+    rng = random.Random(seed)
+    n_users = max(1, n_rows // ROWS_PER_USER)
+    db = FakeSupabase()
+    db.tables["users"] = [{"id": i + 1, "name_hash": f"user-{i:07d}"} for i in range(n_users)]
+    db.tables["pro_responses"] = [
+        {"id": i + 1, "user_id": f"user-{i:07d}", "response": {"q1": rng.randint(1, 5)}, "created_at": "2024-03-01"}
+        for i in range(n_users)
+    ]
+    sizes = {"medication_dispenses": n_rows, "immunizations": n_rows // 10, "treatment_claims": n_rows // 10}
+    for table, size in sizes.items():
+        db.tables[table] = [
+            {"id": i + 1, "user_id": i % n_users + 1, "resource_id": i + 1, "medication_code": "642101190",
+             "medication_name": "타이레놀정500밀리그람", "pharmacy_name": "온누리약국",
+             "when_prepared": "2024-01-01", "days_supply": rng.randint(1, 30), "age": rng.randint(1, 90)}
+            for i in range(size)
+        ]
+    return db
+
+
+def legacy_excel(db):
+    """이전 구현: 전체 행 수집 -> DataFrame 4개 -> openpyxl -> BytesIO"""
+    pro_rows = list(export_stream.iter_rows(db, "pro_responses"))
+    ehr = {table: [] for _, table in export_stream.EHR_TABLES}
+    for batch in export_stream.iter_user_batches(db):
+        for _, _, groups in batch:
+            for table, rows in groups.items():
+                ehr[table].extend(rows)
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        pd.DataFrame(pro_rows).to_excel(writer, index=False, sheet_name="PRO Responses")
+        pd.DataFrame(ehr["immunizations"]).to_excel(writer, index=False, sheet_name="Immunizations")
+        pd.DataFrame(ehr["medication_dispenses"]).to_excel(writer, index=False, sheet_name="MedicationDispenses")
+        pd.DataFrame(ehr["treatment_claims"]).to_excel(writer, index=False, sheet_name="TreatmentClaims")
+    return len(buf.getvalue())
+
+
+def streaming_excel(db):
+    path = export_excel.build_workbook(db)
+    size = 0
+    for chunk in export_excel.iter_file(path):
+        size += len(chunk)
+    return size
+
+
+WRITERS = {"pandas": legacy_excel, "streaming": streaming_excel}
+
+
+def child(writer, n_rows):
+    # fake DB 는 쿼리마다 테이블 전체를 훑으므로 페이지를 크게 잡아 fake 비용을 줄인다
+    export_stream.EXPORT_PAGE_SIZE = 10000
+    db = build_cohort(n_rows)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    base = vm_rss_kb(os.getpid())
+    start = time.perf_counter()
+    size = WRITERS[writer](db)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"elapsed": elapsed, "peak_kb": vm_hwm_kb(os.getpid()) - base, "size": size}))
+
+
+def measure(writer, n_rows):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", writer, str(n_rows)],
+                         check=True, capture_output=True, text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    return result["elapsed"], result["peak_kb"] * 1024, result["size"]
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--child", nargs=2, metavar=("WRITER", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+    print(f"{'rows':>7s} {'writer':>10s} {'wall(s)':>8s} {'peak RSS(MB)':>13s} {'xlsx(MB)':>9s}")
+    for n in args.rows:
+        for name in WRITERS:
+            elapsed, peak, size = measure(name, n)
+            print(f"{n:7d} {name:>10s} {elapsed:8.2f} {peak / 1e6:13.1f} {size / 1e6:9.2f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,147 @@
+"""느린(멈춘) 클라이언트가 /export-data 를 받을 때 서버 프로세스의 메모리 증가량.
+
+bench_export 의 합성 코호트(사용자 N명)를 fake Supabase 에 넣고 main.app 을 같은 프로세스의
+uvicorn 스레드로 띄운다. 클라이언트는 첫 청크만 받은 뒤 --stall 초 동안 읽지 않다가 나머지를
+--read-chunk 바이트씩 --delay 초 간격으로 읽는다 (기본값은 내보내기 생성보다 느린 클라이언트).
+형식별로 iter_io 버퍼를 기본값(IO_STREAM_BUFFER)과 무제한(0, 이전 동작)으로 바꿔 가며, 응답을
+받는 동안 다음 두 값을 잰다.
+
+- read-ahead: 내보내기 제너레이터가 만든 바이트 - 클라이언트가 받은 바이트의 최댓값. iter_io 큐,
+  전송 버퍼, 커널 소켓 버퍼에 쌓여 있는 양이다.
+- RSS growth: 프로세스 RSS 의 최대 증가량 (/proc/self/statm 을 20ms 마다 읽는다. tracemalloc 은
+  생성 속도를 클라이언트보다 느리게 만들어 버퍼링이 드러나지 않으므로 쓰지 않는다). 내보내기 자체의
+  작업 메모리도 포함한다. RSS 는 한 번 늘면 잘 줄지 않으므로 경우마다 새 프로세스에서 잰다.
+
+실행: python benchmarks/bench_export_slow_client.py [--users 10000] [--formats csv parquet] [--delay 0.1]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ.setdefault("CLIENT_WARMUP", "0")
+
+import clients  # noqa: E402
+import httpx  # noqa: E402
+import main  # noqa: E402
+import uvicorn  # noqa: E402
+from bench_export import build_cohort  # noqa: E402
+
+PARAMS = {"csv": {"is_csv": "true"}, "parquet": {"format": "parquet"}, "arrow": {"format": "arrow"}}
+
+
+def serve(port):
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+_PAGE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * _PAGE
+
+
+produced = [0]
+
+
+def counting(gen_func):
+    """내보내기 제너레이터가 만든 바이트를 produced 에 더한다"""
+    def wrapper(*args, **kwargs):
+        for chunk in gen_func(*args, **kwargs):
+            produced[0] += len(chunk)
+            yield chunk
+    return wrapper
+
+
+def download(port, fmt, stall, read_chunk, delay):
+    """(받은 바이트 수, 걸린 시간, 최대 read-ahead MB, RSS 최대 증가 MB)"""
+    base = rss()
+    peak = [base]
+    ahead = [0]
+    size = 0
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.02):
+            peak[0] = max(peak[0], rss())
+            ahead[0] = max(ahead[0], produced[0] - size)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as http:
+            start = time.perf_counter()
+            with http.stream("GET", "/export-data", params=PARAMS[fmt]) as response:
+                response.raise_for_status()
+                for i, chunk in enumerate(response.iter_raw(read_chunk)):
+                    size += len(chunk)
+                    time.sleep(stall if i == 0 else delay)
+            elapsed = time.perf_counter() - start
+    finally:
+        done.set()
+        sampler.join()
+    return size, elapsed, ahead[0] / 1e6, (peak[0] - base) / 1e6
+
+
+def run_case(args, n, fmt, buffer):
+    """새 프로세스에서 한 경우를 재고 download 의 결과를 돌려준다"""
+    import export_columnar
+    import export_stream
+    clients.IO_STREAM_BUFFER = buffer
+    export_stream.iter_wide_csv = counting(export_stream.iter_wide_csv)
+    export_columnar.iter_columnar = counting(export_columnar.iter_columnar)
+    main.supabase = build_cohort(n)
+    server, thread = serve(args.port)
+    try:
+        return download(args.port, fmt, args.stall, args.read_chunk, args.delay)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[10000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet"])
+    parser.add_argument("--stall", type=float, default=3.0, help="첫 청크 뒤 읽지 않는 시간(초)")
+    parser.add_argument("--read-chunk", type=int, default=64 * 1024)
+    parser.add_argument("--delay", type=float, default=0.1, help="이후 청크 사이 대기(초)")
+    parser.add_argument("--port", type=int, default=8792)
+    parser.add_argument("--case", nargs=3, metavar=("USERS", "FORMAT", "BUFFER"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        n, fmt, buffer = args.case
+        print(*run_case(args, int(n), fmt, int(buffer)))
+        return
+
+    default_buffer = clients.IO_STREAM_BUFFER
+    common = ["--stall", str(args.stall), "--read-chunk", str(args.read_chunk),
+              "--delay", str(args.delay), "--port", str(args.port)]
+    print(f"{'users':>7s} {'format':>8s} {'buffer':>9s} {'size(MB)':>9s} {'time(s)':>8s} {'read-ahead(MB)':>15s} {'RSS growth(MB)':>15s}")
+    for n in args.users:
+        for fmt in args.formats:
+            for label, buffer in ((str(default_buffer), default_buffer), ("unbounded", 0)):
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), *common,
+                                      "--case", str(n), fmt, str(buffer)],
+                                     check=True, capture_output=True, text=True).stdout
+                size, elapsed, ahead, growth = map(float, out.split()[-4:])
+                print(f"{n:7d} {fmt:>8s} {label:>9s} {size / 1e6:9.2f} {elapsed:8.2f} {ahead:15.1f} {growth:15.1f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,67 @@
+"""FHIR 리소스 추출 처리량: 리소스별 extract vs 묶음 extract_batch (타입별 resources/s).
+
+번들된 픽스처(payload.json, fhir/*.json)의 리소스를 --repeat 번 복제해 추출만 잰다 (DB 없음).
+실행: python benchmarks/bench_extract.py [--repeat 200] [--batch 200]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fhir_extract  # noqa: E402
+import fhir_summary  # noqa: E402
+
+
+def load_resources():
+    resources = []
+    for path in [os.path.join(ROOT, "payload.json")] + sorted(glob.glob(os.path.join(ROOT, "fhir", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            resources += list(fhir_summary.iter_resources(json.load(f)))
+    return resources
+
+
+def best_of(fn, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=200, help="extract_batch 한 번에 넘기는 리소스 수")
+    args = parser.parse_args()
+
+    resources = load_resources()
+    print(f"{'resourceType':22s} {'count':>8s} | {'single res/s':>13s} | {'batch res/s':>12s} | {'speedup':>7s}")
+    for resource_type, extractor in fhir_extract.EXTRACTORS.items():
+        items = [r for r in resources if r.get("resourceType") == resource_type] * args.repeat
+        if not items:
+            continue
+
+        def single():
+            for res in items:
+                extractor.extract(res).to_row()
+
+        def batch():
+            for i in range(0, len(items), args.batch):
+                for record in extractor.extract_batch(items[i:i + args.batch]):
+                    record.to_row()
+
+        t_single = best_of(single)
+        t_batch = best_of(batch)
+        print(f"{resource_type:22s} {len(items):8d} | {len(items) / t_single:13,.0f} | "
+              f"{len(items) / t_batch:12,.0f} | {t_single / t_batch:6.2f}x")
+
+
+if __name__ == "__main__":
+    main_()
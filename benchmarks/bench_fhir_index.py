@@ -0,0 +1,58 @@
+"""/health-report(업로드 없음)의 입력 준비 시간: 요청마다 fhir/* 를 읽고 파싱 vs 상주 인덱스(fhir_index).
+
+요청 한 번에 해당하는 캐시 키 계산 + 프롬프트 구성(digest/raw)을 --repeat 번 반복해 평균을 잰다.
+LLM 호출은 하지 않는다. 인덱스는 환자 한 명 선택과 리소스 타입 필터도 함께 잰다.
+실행: python benchmarks/bench_fhir_index.py [--repeat 50]
+"""
+import argparse
+import functools
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fhir_index  # noqa: E402
+import main  # noqa: E402
+
+
+def per_request(select, digest, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        sources = select()
+        main._report_cache_key(sources, digest, "2025년 01월 01일")
+        main._build_report_prompt(sources, digest)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    directory = os.path.join(ROOT, "fhir")
+    index = fhir_index.FhirIndex(directory)
+    start = time.perf_counter()
+    index.refresh()
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms ({len(index.patients())} files)")
+    patient = index.patients()[0]["patient"]
+
+    def files():
+        paths = glob.glob(os.path.join(directory, "*"))
+        return [(os.path.basename(p), functools.partial(main._read_text_file, p)) for p in paths]
+
+    cases = [
+        ("glob + read + parse (전체)", files),
+        ("index (전체)", index.select),
+        (f"index patient={patient}", lambda: index.select(patient)),
+        (f"index patient={patient} MedicationDispense", lambda: index.select(patient, ["MedicationDispense"])),
+    ]
+    print(f"{'source':45s} {'digest ms/req':>14s} {'raw ms/req':>11s}")
+    for label, select in cases:
+        print(f"{label:45s} {per_request(select, True, args.repeat):14.2f} {per_request(select, False, args.repeat):11.2f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,73 @@
+"""/ingest-fhir 번들당 Supabase 왕복(round trip) 수 비교: 리소스별 적재 vs 일괄 적재.
+
+번들마다 첫 업로드(빈 DB), 적재 캐시가 채워진 상태의 재업로드, 캐시를 비운 뒤(재시작 직후)의
+재업로드를 각각 잰다.
+
+실행: python benchmarks/bench_ingest.py
+"""
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fast_json  # noqa: E402
+import main  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+
+
+def load_bundles():
+    bundles = []
+    with open(os.path.join(ROOT, "payload.json"), encoding="utf-8") as f:
+        payload = json.load(f)
+    bundles.append(("payload.json", payload))
+    for i, path in enumerate(sorted(glob.glob(os.path.join(ROOT, "fhir", "*.json")))):
+        with open(path, encoding="utf-8") as f:
+            resource = json.load(f)
+        bundles.append((os.path.basename(path), {"name_hash": f"bench-{i}", "resource": resource}))
+    return bundles
+
+
+def run(body, bulk):
+    fake = FakeSupabase()
+    main.supabase = fake
+    main.ingest_index.clear()
+    request = main.FHIRIngestRequest(**body)
+    timings = []
+    trips = []
+    results = None
+    # 첫 업로드(빈 DB), 캐시 적중 재업로드, 캐시 비운 뒤 재업로드
+    for cold in (False, False, True):
+        if cold:
+            main.ingest_index.clear()
+        fake.reset_counters()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            resp = fast_json.loads(asyncio.run(main.ingest_fhir(request, bulk=bulk, run_async=False)).body)
+        timings.append(time.perf_counter() - start)
+        trips.append(fake.round_trips)
+        results = results or resp["results"]
+        assert resp["results"] == results, "재업로드 results 불일치"
+    return trips, timings, [(r["resource_type"], r["resource_id"]) for r in results]
+
+
+def main_():
+    print(f"{'bundle':45s} {'res':>4s} | {'per-resource (1st/re/cold)':>26s} | {'bulk (1st/re/cold)':>20s}")
+    for name, body in load_bundles():
+        n = len(main._split_resources(body["resource"]))
+        per_trips, _, per_results = run(body, bulk=False)
+        bulk_trips, _, bulk_results = run(body, bulk=True)
+        assert per_results == bulk_results, f"{name}: results 불일치"
+        print(f"{name:45s} {n:4d} | {' / '.join(f'{t:6d}' for t in per_trips):>26s} | "
+              f"{' / '.join(f'{t:4d}' for t in bulk_trips):>20s}")
+
+
+if __name__ == "__main__":
+    main_()
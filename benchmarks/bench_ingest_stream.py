@@ -0,0 +1,76 @@
+"""대용량 번들 적재 시 서버 최대 RSS 비교: /ingest-fhir?bulk=true vs /ingest-fhir/stream.
+
+payload.json 의 publicData 를 반복해 번들을 만들고(리소스 id 는 고유하게 변경),
+fake DB 가 행을 보관하지 않는 서버(--discard-writes)에 보내 VmHWM 을 측정한다.
+실행: python benchmarks/bench_ingest_stream.py [--sizes 5 20 50]   (Linux 전용)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+sys.path.insert(0, HERE)
+from bench_upload_memory import vm_hwm_kb, vm_rss_kb  # noqa: E402
+
+
+def bundle_chunks(size_mb):
+    """size_mb 크기의 /ingest-fhir 요청 본문을 청크 단위로 생성 (클라이언트 메모리도 일정)"""
+    with open(os.path.join(ROOT, "payload.json"), encoding="utf-8") as f:
+        payload = json.load(f)
+    items = payload["resource"]["publicData"]
+    target = size_mb * 1024 * 1024
+    yield b'{"name_hash": "bench-stream", "resource": {"publicData": ['
+    written, n = 0, 0
+    while written < target:
+        for item in items:
+            res = dict(item["resource"], id=f"{item['resource'].get('id')}-{n}")
+            chunk = (b"," if n else b"") + json.dumps({"resource": res}, ensure_ascii=False).encode("utf-8")
+            written += len(chunk)
+            n += 1
+            yield chunk
+    yield b"]}}"
+
+
+def run(path, size_mb, port):
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "serve_fake.py"), "--port", str(port),
+                             "--discard-writes"], env=dict(os.environ, MAX_REQUEST_BYTES=str(1 << 34)),
+                            stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/ping")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        base = vm_rss_kb(proc.pid)
+        start = time.perf_counter()
+        r = httpx.post(f"http://127.0.0.1:{port}{path}", content=bundle_chunks(size_mb),
+                       headers={"content-type": "application/json"}, timeout=None)
+        elapsed = time.perf_counter() - start
+        return base, vm_hwm_kb(proc.pid), elapsed, r.status_code
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=float, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+    print(f"{'endpoint':28s} {'bundle(MB)':>10s} {'base RSS(MB)':>13s} {'peak RSS(MB)':>13s} {'wall(s)':>8s} status")
+    for size in args.sizes:
+        for path in ("/ingest-fhir?bulk=true", "/ingest-fhir/stream"):
+            base, peak, elapsed, status = run(path, size, args.port)
+            print(f"{path:28s} {size:10.0f} {base / 1024:13.1f} {peak / 1024:13.1f} {elapsed:8.2f} {status}")
+
+
+if __name__ == "__main__":
+    main_()
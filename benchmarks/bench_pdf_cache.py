@@ -0,0 +1,87 @@
+"""PDF 여러 개 추출: 파일마다 /extract 요청 vs /extract/batch 한 번, 결과 캐시 끔/켬.
+
+uvicorn main:app 을 새 프로세스로 띄우고 pbh1.pdf/pbh2.pdf 를 번갈아 --files 개 보낸다
+(가져오기 도구가 같은 파일을 다시 올리는 상황). 캐시를 끄면(PDF_CACHE_MAX_BYTES=0) 매번
+복호화·파싱하고, 켜면 처음 한 번만 파싱한다. 각 경우 --repeat 번 반복한 전체 시간의 중앙값을 잰다.
+저장소는 SQLite(:memory:), OpenAI 키는 가짜 값을 쓴다.
+실행: python benchmarks/bench_pdf_cache.py [--files 20] [--repeat 3] [--port 8791]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "0000"
+
+
+def load(name):
+    with open(os.path.join(ROOT, name), "rb") as f:
+        return f.read()
+
+
+def per_file(http, files):
+    for name, data in files:
+        http.post("/extract", files={"file": (name, data)}, data={"password": PASSWORD}).raise_for_status()
+
+
+def batch(http, files):
+    response = http.post("/extract/batch", files=[("files", f) for f in files], data={"passwords": [PASSWORD]})
+    response.raise_for_status()
+    assert response.json()["counts"] == {"done": len(files)}
+
+
+def run(port, cache_bytes, files, repeat):
+    env = {**os.environ, "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": ":memory:", "CLIENT_WARMUP": "0",
+           "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake"), "PDF_CACHE_MAX_BYTES": str(cache_bytes)}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=120) as http:
+            while True:
+                try:
+                    if http.get("/ping").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.05)
+            # PyPDF2 임포트 등 첫 요청 비용은 제외
+            per_file(http, files[:1])
+            out = {}
+            for label, send in (("per-file /extract", per_file), ("/extract/batch", batch)):
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    send(http, files)
+                    times.append(time.perf_counter() - start)
+                out[label] = statistics.median(times)
+            out["hit_rate"] = http.get("/debug/pdf-cache").json()["hit_rate"]
+            return out
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8791)
+    args = parser.parse_args()
+    names = ("pbh1.pdf", "pbh2.pdf")
+    files = [(names[i % 2], load(names[i % 2])) for i in range(args.files)]
+    print(f"{args.files} files")
+    print(f"{'cache':>9s} {'per-file /extract (ms)':>23s} {'/extract/batch (ms)':>20s} {'hit rate':>9s}")
+    for label, cache_bytes in (("off", 0), ("64MB", 64 * 1024 * 1024)):
+        result = run(args.port, cache_bytes, files, args.repeat)
+        print(f"{label:>9s} {result['per-file /extract'] * 1000:23.0f} {result['/extract/batch'] * 1000:20.0f} "
+              f"{result['hit_rate']:9.2f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,78 @@
+"""/extract PDF 텍스트 추출 시간: 워커 프로세스 수 1, 2, 4, 8 비교.
+
+번들된 pbh1.pdf/pbh2.pdf 는 1페이지짜리라 그대로 측정하고, 같은 페이지를 복제해
+비밀번호(0000)로 암호화한 다중 페이지 문서도 만들어 함께 측정한다.
+실행: python benchmarks/bench_pdf_extract.py [--pages 64] [--repeat 3]
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PyPDF2 import PdfReader, PdfWriter  # noqa: E402
+
+import pdf_extract  # noqa: E402
+
+PASSWORD = "0000"
+
+
+def load(name):
+    with open(os.path.join(ROOT, name), "rb") as f:
+        return f.read()
+
+
+def synthesize(pages):
+    """pbh1/pbh2 의 페이지를 번갈아 복제한 암호화 PDF"""
+    sources = []
+    for name in ("pbh1.pdf", "pbh2.pdf"):
+        reader = PdfReader(io.BytesIO(load(name)))
+        reader.decrypt(PASSWORD)
+        sources.extend(reader.pages)
+    writer = PdfWriter()
+    for i in range(pages):
+        writer.add_page(sources[i % len(sources)])
+    writer.encrypt(PASSWORD)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+async def timed(content, workers, repeat):
+    best = None
+    text = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = await pdf_extract.extract_text(content, PASSWORD, workers=workers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(text)
+
+
+async def run(args):
+    docs = [("pbh1.pdf", load("pbh1.pdf")), ("pbh2.pdf", load("pbh2.pdf")),
+            (f"synthetic {args.pages}p", synthesize(args.pages))]
+    worker_counts = (1, 2, 4, 8)
+    print(f"cpu_count={os.cpu_count()}  (best of {args.repeat}, ms)")
+    print(f"{'document':20s}" + "".join(f"{f'{w} worker':>12s}" for w in worker_counts))
+    for name, content in docs:
+        # 프로세스 풀 기동 비용은 측정에서 제외
+        for w in worker_counts:
+            await pdf_extract.extract_text(content, PASSWORD, workers=w)
+        cells = []
+        for w in worker_counts:
+            elapsed, _ = await timed(content, w, args.repeat)
+            cells.append(f"{elapsed * 1000:12.1f}")
+        print(f"{name:20s}" + "".join(cells))
+    pdf_extract.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""동시 /health-report, /ingest-fhir 부하 중 /ping p50/p99 지연 측정.
+
+블로킹 SDK 호출이 이벤트 루프를 막으면 /ping 지연이 LLM 지연만큼 튄다.
+실행: python benchmarks/bench_ping_latency.py [--llm-latency 2.0] [--db-latency 0.02] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def ping_loop(http, stop, samples, interval=0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = await http.get("/ping")
+        r.raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def measure(http, load_factory, duration):
+    samples = []
+    stop = asyncio.Event()
+    pinger = asyncio.create_task(ping_loop(http, stop, samples))
+    load = [asyncio.create_task(c) for c in load_factory()]
+    if load:
+        await asyncio.gather(*load)
+    else:
+        await asyncio.sleep(duration)
+    stop.set()
+    await pinger
+    return samples
+
+
+async def run(args):
+    main.supabase = FakeSupabase(latency=args.db_latency)
+    main.client = FakeOpenAI(latency=args.llm_latency)
+    with open(os.path.join(ROOT, "payload.json"), encoding="utf-8") as f:
+        payload = json.load(f)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        def load():
+            tasks = []
+            for i in range(args.concurrency):
+                tasks.append(http.post("/health-report"))
+                body = dict(payload, name_hash=f"bench-{i}")
+                tasks.append(http.post("/ingest-fhir", json=body, params={"bulk": "true"}))
+            return tasks
+
+        # 매핑 단계의 print 출력은 측정에서 제외
+        with contextlib.redirect_stdout(io.StringIO()):
+            idle = await measure(http, lambda: [], args.llm_latency)
+            busy = await measure(http, load, None)
+
+    print(f"{'':10s} {'n':>5s} {'p50(ms)':>9s} {'p99(ms)':>9s} {'max(ms)':>9s}")
+    for name, s in (("idle", idle), ("loaded", busy)):
+        print(f"{name:10s} {len(s):5d} {statistics.median(s):9.2f} {percentile(s, 99):9.2f} {max(s):9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--db-latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(run(parser.parse_args()))
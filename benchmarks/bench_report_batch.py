@@ -0,0 +1,92 @@
+"""보고서 일괄 생성: 동시성별 코호트 전체 시간 (워커 수에 반비례해야 한다).
+
+FakeSupabase 에 fhir/*.json 번들을 돌려 가며 --users 명을 적재한 뒤, 저장된 fhir_resources 로
+보고서를 만든다. LLM 은 FakeOpenAI(--latency 초)이고 --error-rate 비율의 호출은 503 으로
+실패해 재시도 경로도 함께 잰다. --rpm/--tpm 을 주면 레이트 리밋에 걸린 대기 시간도 보고한다.
+실행: python benchmarks/bench_report_batch.py [--users 32] [--latency 0.5] [--concurrency 1,2,4,8,16]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main  # noqa: E402
+import report_batch  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+
+
+class TransientError(Exception):
+    status_code = 503
+
+
+def seed(users):
+    main.supabase = FakeSupabase()
+    main.ingest_index.clear()
+    bundles = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "fhir", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            bundles.append(main._split_resources(json.load(f)))
+    hashes = [f"bench-{i}" for i in range(users)]
+    for i, name_hash in enumerate(hashes):
+        main._ingest_bulk(main._get_or_create_user(name_hash, None), bundles[i % len(bundles)])
+    return hashes
+
+
+async def run(hashes, concurrency, rpm, tpm):
+    runner = report_batch.ReportBatchRunner(
+        main._prepare_batch_report, main._complete_batch_report,
+        concurrency=concurrency, limiter=report_batch.RateLimiter(rpm, tpm),
+    )
+    runner.start()
+    start = time.perf_counter()
+    job = runner.submit([report_batch.BatchItem(h, name_hash=h) for h in hashes])
+    while job.status != "done":
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await runner.stop()
+    return elapsed, runner.stats()
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="LLM 호출당 지연(초)")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="일시적 오류(503)로 실패하는 호출 비율")
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--tpm", type=int, default=0)
+    args = parser.parse_args()
+
+    report_batch.REPORT_BATCH_BACKOFF_BASE = args.latency / 2
+    fake = FakeOpenAI(latency=args.latency)
+    create = fake.chat.completions.create
+    rng = random.Random(0)
+
+    def flaky_create(**kwargs):
+        if rng.random() < args.error_rate:
+            raise TransientError("fake 503")
+        return create(**kwargs)
+    fake.chat.completions.create = flaky_create
+    main.client = fake
+
+    hashes = seed(args.users)
+    print(f"{args.users} users, LLM {args.latency}s/call, error rate {args.error_rate}, rpm {args.rpm or '-'}, "
+          f"tpm {args.tpm or '-'}")
+    print(f"{'concurrency':>11s} | {'wall s':>7s} | {'users/s':>7s} | {'retries':>7s} | {'failed':>6s} | {'rl wait s':>9s}")
+    for c in [int(x) for x in args.concurrency.split(",")]:
+        elapsed, stats = asyncio.run(run(hashes, c, args.rpm, args.tpm))
+        print(f"{c:11d} | {elapsed:7.2f} | {args.users / elapsed:7.1f} | {stats['retries']:7d} | "
+              f"{stats['failures']:6d} | {stats['rate_limit_wait_seconds']:9.2f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,71 @@
+"""/health-report 종단 지연: 단일 프롬프트(raw) vs map-reduce(chunked) 모드.
+
+FakeOpenAI 로 LLM 을 대신한다. 호출 한 번의 지연 = --latency + 프롬프트 1,000 글자당
+--prefill-per-1k 이므로, 긴 단일 프롬프트와 여러 개의 짧은 병렬 호출의 차이를 볼 수 있다.
+모드/예산/동시성별로 종단 지연, LLM 호출 수, 가장 긴 프롬프트의 토큰 수(추정)를 보고한다.
+실행: python benchmarks/bench_report_mapreduce.py [--latency 1.0] [--prefill-per-1k 0.05] [--budget 30000]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main  # noqa: E402
+import report_mapreduce  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from clients import run_io  # noqa: E402
+
+
+async def single(sources):
+    prompt = await run_io(main._build_report_prompt, sources, False)
+    return await run_io(main._complete_report, prompt, "2025-01-01")
+
+
+async def chunked(sources, budget, concurrency):
+    loaders = [(label, lambda load=load: load()) for label, load in sources]
+    prompt = await report_mapreduce.build_reduce_prompt(loaders, main._llm_complete, budget, concurrency)
+    return await run_io(main._complete_report, prompt, "2025-01-01", "reduce")
+
+
+def run(fake, coro):
+    fake.calls = fake.max_prompt_chars = 0
+    start = time.perf_counter()
+    asyncio.run(coro)
+    return time.perf_counter() - start, fake.calls, fake.max_prompt_chars
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0, help="호출당 고정 지연(초)")
+    parser.add_argument("--prefill-per-1k", type=float, default=0.05, help="프롬프트 1,000 글자당 추가 지연(초)")
+    parser.add_argument("--budget", type=int, default=report_mapreduce.REPORT_CHUNK_TOKENS, help="청크 토큰 예산")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="map 동시성 목록")
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(latency=args.latency, prefill_per_1k=args.prefill_per_1k)
+    main.client = fake
+    paths = sorted(glob.glob(os.path.join(ROOT, "fhir", "*.json")))
+    files = [(os.path.basename(p), main._read_text_file(p)) for p in paths]
+    cases = [("fhir/* 중 가장 큰 파일", [max(files, key=lambda f: len(f[1]))]), ("fhir/* (전체)", files)]
+
+    print(f"tokenizer: {'tiktoken o200k_base' if report_mapreduce._encoding() else 'chars/2 추정'}, "
+          f"budget {args.budget} tokens")
+    print(f"{'input':28s} {'mode':18s} {'e2e s':>8s} {'calls':>6s} {'max prompt tok':>15s}")
+    for label, texts in cases:
+        sources = [(name, lambda t=text: t) for name, text in texts]
+        rows = [("single", run(fake, single(sources)))]
+        for c in [int(x) for x in args.concurrency.split(",")]:
+            rows.append((f"chunked c={c}", run(fake, chunked(sources, args.budget, c))))
+        for mode, (seconds, calls, chars) in rows:
+            tokens = -(-chars // report_mapreduce._CHARS_PER_TOKEN)
+            print(f"{label:28s} {mode:18s} {seconds:8.2f} {calls:6d} {tokens:15,d}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,120 @@
+"""JSON 직렬화(json vs orjson)와 CSV 레이아웃(wide vs long) 비교.
+
+1) 사용자당 EHR 행 수가 한쪽으로 치우친 합성 코호트(대부분 0~3행, --heavy 비율의 사용자만
+   --max-rows 행)를 fake Supabase 에 넣고, CSV 를 레이아웃 x 직렬화 구현별로 끝까지 소비하면서
+   크기, 전체 시간, 그중 직렬화(export_serialize_csv) 시간, 저장소 왕복 수를 잰다.
+   wide 는 모든 사용자를 최대 행 수만큼 빈 셀로 채우고, 헤더를 위해 개수를 세는 1차 패스가 있다.
+2) fhir/ 번들 하나로 FHIR 원본 직렬화/파싱과, 큰 /ingest-fhir 결과의 응답 본문 생성
+   (jsonable_encoder + JSONResponse vs FastJSONResponse) 시간을 잰다.
+
+실행: python benchmarks/bench_serialization.py [--users 1000 4000] [--heavy 0.01] [--max-rows 300]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import export_stream  # noqa: E402
+import fast_json  # noqa: E402
+import main  # noqa: E402
+import metrics  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+BACKENDS = ("json", "orjson")
+
+
+def build_cohort(n_users, heavy, max_rows, seed=0):
+    rng = random.Random(seed)
+    db = FakeSupabase()
+    db.tables["users"] = [{"id": i + 1, "name_hash": f"user-{i:07d}"} for i in range(n_users)]
+    db.tables["pro_responses"] = [
+        {"id": i + 1, "user_id": f"user-{i:07d}", "response": {"q1": rng.randint(1, 5), "q2": "응답"}}
+        for i in range(n_users)
+    ]
+    for _, table in export_stream.EHR_TABLES:
+        rows = db.tables[table] = []
+        for uid in range(1, n_users + 1):
+            count = rng.randint(max_rows // 2, max_rows) if rng.random() < heavy else rng.randint(0, 3)
+            for _ in range(count):
+                rows.append({"id": len(rows) + 1, "user_id": uid, "resource_id": uid * 1000 + len(rows),
+                             "age": rng.randint(1, 90), "medication_code": f"{rng.randint(0, 999999):06d}",
+                             "medication_name": "약품", "days_supply": rng.randint(1, 30),
+                             "occurrence_date": "2023-10-01", "copay_amount": rng.randint(1000, 50000)})
+    return db
+
+
+def measure_csv(db, layout):
+    rows = export_stream.iter_long_csv if layout == "long" else export_stream.iter_wide_csv
+    breakdown = metrics._Breakdown()
+    token = metrics._breakdown.set(breakdown)
+    db.reset_counters()
+    start = time.perf_counter()
+    try:
+        size = sum(len(chunk) for chunk in rows(db))
+    finally:
+        metrics._breakdown.reset(token)
+    elapsed = time.perf_counter() - start
+    return size, elapsed, breakdown.stages["export_serialize_csv"][0], db.round_trips
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_payloads(repeat):
+    path = max(glob.glob(os.path.join(ROOT, "fhir", "*")), key=os.path.getsize)
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    doc = json.loads(text)
+    result = {"status": "success", "user_id": 1,
+              "results": [{"resource_type": "MedicationDispense", "resource_id": i} for i in range(20000)]}
+    print(f"\n{os.path.basename(path)} ({len(text) / 1e6:.2f} MB), ingest 결과 {len(result['results'])} 건")
+    print(f"{'':28s} " + " ".join(f"{b + ' ms':>10s}" for b in BACKENDS))
+    cases = [
+        ("FHIR 번들 dumps", lambda: fast_json.dumps_bytes(doc)),
+        ("FHIR 번들 loads", lambda: fast_json.loads(text)),
+        ("ingest 응답 (encoder+render)", lambda: JSONResponse(jsonable_encoder(result))),
+        ("ingest 응답 (FastJSONResponse)", lambda: main.FastJSONResponse(result)),
+    ]
+    for label, func in cases:
+        times = []
+        for backend in BACKENDS:
+            fast_json.use(backend)
+            times.append(timed(func, repeat))
+        print(f"{label:28s} " + " ".join(f"{t:10.2f}" for t in times))
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 4000])
+    parser.add_argument("--heavy", type=float, default=0.01)
+    parser.add_argument("--max-rows", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'users':>7s} {'layout':>6s} {'json':>7s} {'size(MB)':>9s} {'total(s)':>9s} {'serialize(s)':>13s} "
+          f"{'round trips':>12s}")
+    for n in args.users:
+        db = build_cohort(n, args.heavy, args.max_rows)
+        for layout in ("wide", "long"):
+            for backend in BACKENDS:
+                fast_json.use(backend)
+                size, elapsed, serialize, round_trips = measure_csv(db, layout)
+                print(f"{n:7d} {layout:>6s} {backend:>7s} {size / 1e6:9.2f} {elapsed:9.2f} {serialize:13.2f} "
+                      f"{round_trips:12d}")
+    bench_payloads(args.repeat)
+
+
+if __name__ == "__main__":
+    main_()
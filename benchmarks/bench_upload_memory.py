@@ -0,0 +1,101 @@
+"""동시 업로드 중 서버 프로세스의 최대 RSS(VmHWM) 측정.
+
+fake 클라이언트를 주입한 서버를 별도 프로세스로 띄우고 큰 FHIR JSON(/health-report)과
+PDF(/extract)를 동시에 업로드한 뒤 /proc/<pid>/status 의 VmHWM 을 읽는다.
+UPLOAD_SPOOL_THRESHOLD 를 크게 주면 스풀링 없이 메모리에 올리는 경우와 비교할 수 있다.
+
+실행: python benchmarks/bench_upload_memory.py [--size-mb 8] [--concurrency 8]
+(Linux 전용: /proc 사용)
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def make_fhir(size_mb):
+    """fhir/ 샘플의 publicData 를 반복해 size_mb 크기의 번들을 만든다"""
+    with open(os.path.join(ROOT, "fhir", "phr_정한나.json"), encoding="utf-8") as f:
+        doc = json.load(f)
+    items = doc["publicData"]
+    unit = len(json.dumps(items, ensure_ascii=False).encode("utf-8"))
+    doc["publicData"] = items * max(1, int(size_mb * 1024 * 1024 / unit))
+    return json.dumps(doc, ensure_ascii=False).encode("utf-8")
+
+
+def vm_hwm_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def vm_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def load(port, fhir, pdf, concurrency):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as http:
+        tasks = []
+        for i in range(concurrency):
+            tasks.append(http.post("/health-report", params={"refresh": "true"},
+                                   files=[("files", (f"bundle{i}.json", fhir, "application/json"))]))
+            tasks.append(http.post("/extract", files={"file": ("pbh1.pdf", pdf)}, data={"password": "0000"}))
+        responses = await asyncio.gather(*tasks)
+    return [r.status_code for r in responses]
+
+
+def run(threshold, args, fhir, pdf):
+    env = dict(os.environ, UPLOAD_SPOOL_THRESHOLD=str(threshold), MAX_REQUEST_BYTES=str(1 << 34))
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "serve_fake.py"), "--port", str(args.port),
+                             "--llm-latency", "0.2"], env=env)
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{args.port}/ping")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        base = vm_rss_kb(proc.pid)
+        start = time.perf_counter()
+        codes = asyncio.run(load(args.port, fhir, pdf, args.concurrency))
+        elapsed = time.perf_counter() - start
+        return base, vm_hwm_kb(proc.pid), elapsed, codes
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    fhir = make_fhir(args.size_mb)
+    with open(os.path.join(ROOT, "pbh1.pdf"), "rb") as f:
+        pdf = f.read()
+    total_mb = (len(fhir) + len(pdf)) * args.concurrency / 1024 / 1024
+    print(f"업로드: FHIR {len(fhir) / 1024 / 1024:.1f}MB + PDF x {args.concurrency} 동시 (총 {total_mb:.1f}MB)")
+    print(f"{'mode':24s} {'base RSS(MB)':>13s} {'peak RSS(MB)':>13s} {'wall(s)':>8s}  status")
+    for name, threshold in (("spool (1MB threshold)", 1024 * 1024), ("in-memory", 1 << 34)):
+        base, peak, elapsed, codes = run(threshold, args, fhir, pdf)
+        print(f"{name:24s} {base / 1024:13.1f} {peak / 1024:13.1f} {elapsed:8.2f}  {sorted(set(codes))}")
+
+
+if __name__ == "__main__":
+    main_()
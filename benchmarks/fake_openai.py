@@ -0,0 +1,156 @@
+"""벤치마크용 OpenAI 대역(fake): chat.completions.create 를 고정 지연 후 응답한다.
+
+stream=True 이면 첫 청크까지 `latency` 의 일부(first_token_ratio)를 기다린 뒤
+나머지 시간 동안 응답을 청크 단위로 나눠 내보낸다. FakeOpenAI 의 prefill_per_1k 를 주면
+프롬프트 1,000 글자마다 그만큼 지연이 더해진다 (긴 프롬프트의 prefill 비용 흉내).
+
+FakeOpenAI 는 프로세스 안에서 main.client 를 대신하고, create_app 은 같은 동작을 하는
+HTTP 스텁 서버(/v1/chat/completions)를 만든다. HTTP 스텁을 쓰면 실제 OpenAI SDK 의
+연결 풀, SSE 파싱까지 포함해 잴 수 있다.
+
+실행(HTTP 스텁): python benchmarks/fake_openai.py [--port 8766] [--latency 1.0]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+
+class _Stream:
+    def __init__(self, owner, prefill=0.0):
+        self._owner = owner
+        self._prefill = prefill
+        self.closed = False
+
+    def __iter__(self):
+        owner = self._owner
+        pieces = owner.reply.split(" ") or [""]
+        time.sleep(self._prefill + owner.latency * owner.first_token_ratio)
+        step = owner.latency * (1 - owner.first_token_ratio) / len(pieces)
+        for i, piece in enumerate(pieces):
+            if self.closed:
+                return
+            text = piece if i == 0 else " " + piece
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+            time.sleep(step)
+
+    def close(self):
+        self.closed = True
+        self._owner.closed_streams += 1
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        owner = self._owner
+        chars = sum(len(m.get("content") or "") for m in messages or [])
+        with owner.lock:
+            owner.calls += 1
+            owner.max_prompt_chars = max(owner.max_prompt_chars, chars)
+        prefill = owner.prefill_per_1k * chars / 1000
+        if stream:
+            return _Stream(owner, prefill)
+        time.sleep(prefill + owner.latency)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self._owner.reply))],
+            usage=SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0),
+        )
+
+
+class FakeOpenAI:
+    """`openai.OpenAI` 대신 main.client 에 주입하는 클라이언트"""
+
+    def __init__(self, latency: float = 1.0, reply: str = "나의 건강 관리 프로필", first_token_ratio: float = 0.1,
+                 prefill_per_1k: float = 0.0):
+        self.latency = latency
+        self.reply = reply
+        self.first_token_ratio = first_token_ratio
+        self.prefill_per_1k = prefill_per_1k
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.max_prompt_chars = 0
+        self.closed_streams = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+
+def _completion(model, reply, prompt_tokens, completion_tokens):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": reply}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _chunk(cid, model, delta=None, usage=None, finish=None):
+    return {
+        "id": cid,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish}],
+        "usage": usage,
+    }
+
+
+def create_app(latency: float = 1.0, reply: str = "나의 건강 관리 프로필", first_token_ratio: float = 0.1):
+    """OpenAI 호환 POST /v1/chat/completions 스텁 (starlette 앱).
+
+    토큰 수는 근사값이다: 프롬프트는 메시지 글자 수 / 4, 응답은 공백으로 나눈 조각 수.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    pieces = reply.split(" ") or [""]
+
+    async def completions(request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return JSONResponse(_completion(model, reply, prompt_tokens, len(pieces)))
+
+        cid = f"chatcmpl-{uuid.uuid4().hex}"
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def events():
+            await asyncio.sleep(latency * first_token_ratio)
+            step = latency * (1 - first_token_ratio) / len(pieces)
+            for i, piece in enumerate(pieces):
+                text = piece if i == 0 else " " + piece
+                delta = {"role": "assistant", "content": text} if i == 0 else {"content": text}
+                yield f"data: {json.dumps(_chunk(cid, model, delta), ensure_ascii=False)}\n\n"
+                await asyncio.sleep(step)
+            yield f"data: {json.dumps(_chunk(cid, model, {}, finish='stop'))}\n\n"
+            if include_usage:
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                         "total_tokens": prompt_tokens + len(pieces)}
+                yield f"data: {json.dumps(_chunk(cid, model, usage=usage))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--first-token-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, first_token_ratio=args.first_token_ratio),
+                host="127.0.0.1", port=args.port, log_level="warning")
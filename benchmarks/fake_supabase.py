@@ -0,0 +1,181 @@
+"""벤치마크용 인메모리 Supabase 대역(fake).
+
+main.py 가 사용하는 `supabase.table(...).select/insert/delete ... .execute()` 형태의
+쿼리 빌더만 흉내내며, execute() 호출 수를 HTTP 왕복(round trip) 수로 집계한다.
+"""
+import copy
+import itertools
+import time
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, db, table):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns = None
+        self._payload = None
+        self._filters = []
+        self._order = []
+        self._range = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+
+    # --- 연산 -----------------------------------------------------------
+    def select(self, columns="*", **kwargs):
+        self._op = "select"
+        if columns.strip() != "*":
+            self._columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._op = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict="", ignore_duplicates=False, **kwargs):
+        self._op = "upsert"
+        self._payload = payload
+        self._on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()]
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload, **kwargs):
+        self._op = "update"
+        self._payload = payload
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    # --- 필터 -----------------------------------------------------------
+    def eq(self, col, val):
+        self._filters.append(lambda r: r.get(col) == val)
+        return self
+
+    def neq(self, col, val):
+        self._filters.append(lambda r: r.get(col) != val)
+        return self
+
+    def in_(self, col, values):
+        values = set(values)
+        self._filters.append(lambda r: r.get(col) in values)
+        return self
+
+    def gt(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) > val)
+        return self
+
+    def gte(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) >= val)
+        return self
+
+    def lt(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) < val)
+        return self
+
+    def lte(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) <= val)
+        return self
+
+    def order(self, col, desc=False, **kwargs):
+        self._order.append((col, desc))
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def limit(self, n):
+        self._range = (0, n - 1)
+        return self
+
+    # --- 실행 -----------------------------------------------------------
+    def _match(self, row):
+        return all(f(row) for f in self._filters)
+
+    def _project(self, row):
+        if self._columns is None:
+            return copy.deepcopy(row)
+        return {c: copy.deepcopy(row.get(c)) for c in self._columns}
+
+    def execute(self):
+        self._db.round_trips += 1
+        self._db.calls[(self._table, self._op)] = self._db.calls.get((self._table, self._op), 0) + 1
+        if self._db.latency:
+            time.sleep(self._db.latency)
+        rows = self._db.tables.setdefault(self._table, [])
+
+        if self._op == "select":
+            out = [r for r in rows if self._match(r)]
+            # 여러 번 호출한 order 는 앞쪽이 우선 (안정 정렬을 뒤에서부터 적용)
+            for col, desc in reversed(self._order):
+                out.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+            if self._range:
+                start, end = self._range
+                out = out[start:end + 1]
+            return _Result([self._project(r) for r in out])
+
+        if self._op in ("insert", "upsert"):
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            out = []
+            for item in payload:
+                if self._op == "upsert" and self._on_conflict:
+                    found = next((r for r in rows if all(r.get(c) == item.get(c) for c in self._on_conflict)), None)
+                    if found is not None:
+                        if not self._ignore_duplicates:
+                            found.update(copy.deepcopy(item))
+                            out.append(copy.deepcopy(found))
+                        continue
+                row_id = item.get("id") or next(self._db._ids.setdefault(self._table, itertools.count(1)))
+                if self._db.discard_writes:
+                    out.append({"id": row_id})
+                    continue
+                row = copy.deepcopy(item)
+                row["id"] = row_id
+                rows.append(row)
+                out.append(copy.deepcopy(row))
+            return _Result(out)
+
+        if self._op == "update":
+            out = []
+            for r in rows:
+                if self._match(r):
+                    r.update(copy.deepcopy(self._payload))
+                    out.append(copy.deepcopy(r))
+            return _Result(out)
+
+        if self._op == "delete":
+            kept, removed = [], []
+            for r in rows:
+                (removed if self._match(r) else kept).append(r)
+            self._db.tables[self._table] = kept
+            return _Result(removed)
+
+        raise ValueError(f"지원하지 않는 연산: {self._op}")
+
+
+class FakeSupabase:
+    """`supabase.Client` 대신 main.supabase 에 주입하는 인메모리 클라이언트"""
+
+    def __init__(self, latency: float = 0.0, discard_writes: bool = False):
+        self.latency = latency
+        # True 면 insert 결과(id)만 돌려주고 행은 보관하지 않는다 (메모리 벤치마크용)
+        self.discard_writes = discard_writes
+        self.tables = {}
+        self.round_trips = 0
+        self.calls = {}
+        self._ids = {}  # 테이블별 id 시퀀스
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def reset_counters(self):
+        self.round_trips = 0
+        self.calls = {}
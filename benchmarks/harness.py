@@ -0,0 +1,302 @@
+"""엔드포인트별 재현 가능한 부하 벤치마크.
+
+serve_fake.py 로 fake Supabase(또는 SQLite)와 OpenAI 대역을 붙인 서버를 별도 프로세스로 띄우고,
+번들된 픽스처(fhir/*.json, payload.json, pro_data.json, pbh1.pdf/pbh2.pdf)를 시나리오별로
+지정한 동시성으로 재생한다. 시나리오마다 처리량(req/s), p50/p95/p99 지연, 오류 수,
+서버 프로세스의 최대 RSS(시나리오 시작 시 초기화한 VmHWM, Linux 전용)를 보고하고
+결과를 JSON 으로 저장한다. --compare 로 이전 결과와 비교한다.
+
+--llm http 이면 OpenAI 호환 HTTP 스텁(fake_openai.py)을 함께 띄워 실제 SDK 경로로 호출한다.
+
+실행: python benchmarks/harness.py [--requests 50] [--concurrency 8] [--scenarios ping,ingest,...]
+     [--llm-latency 0.5] [--db-latency 0.0] [--llm inproc|http] [--sqlite :memory:]
+     [--out results.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+import httpx  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def _read(path, mode="r"):
+    with open(os.path.join(ROOT, path), mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+        return f.read()
+
+
+# --- 픽스처 -----------------------------------------------------------------
+class Fixtures:
+    def __init__(self):
+        self.payload = json.loads(_read("payload.json"))
+        self.pro = json.loads(_read("pro_data.json"))
+        self.pdfs = [(name, _read(name, "rb")) for name in ("pbh1.pdf", "pbh2.pdf")]
+        self.bundles = [self.payload] + [
+            {"name_hash": f"bench-{os.path.basename(p)}", "resource": json.loads(_read(p))}
+            for p in sorted(glob.glob(os.path.join(ROOT, "fhir", "*.json")))
+        ]
+
+
+# 시나리오 이름 -> 요청 i 번째의 httpx 요청 인자를 만드는 함수. 적재가 export 보다 먼저 오도록 순서를 둔다
+def _scenarios(fx: Fixtures):
+    bundles = itertools.cycle(fx.bundles)
+    pdfs = itertools.cycle(fx.pdfs)
+
+    def pdf(i):
+        name, data = next(pdfs)
+        return {"method": "POST", "url": "/extract", "files": {"file": (name, data, "application/pdf")},
+                "data": {"password": "0000"}}
+
+    def ingest(i, bulk):
+        body = next(bundles)
+        return {"method": "POST", "url": "/ingest-fhir", "params": {"bulk": str(bulk).lower()}, "json": body}
+
+    def ingest_stream(i):
+        body = next(bundles)
+        return {"method": "POST", "url": "/ingest-fhir/stream", "content": json.dumps(body, ensure_ascii=False),
+                "headers": {"content-type": "application/json"}}
+
+    def pro(i):
+        # 사용자마다 응답이 하나씩 쌓이도록 적재한 번들의 name_hash 를 돌려 쓴다
+        return {"method": "POST", "url": "/pro-responses",
+                "json": {"user_id": fx.bundles[i % len(fx.bundles)]["name_hash"], "response": fx.pro["response"]}}
+
+    return {
+        "ping": lambda i: {"method": "GET", "url": "/ping"},
+        "extract": pdf,
+        "ingest": lambda i: ingest(i, False),
+        "ingest_bulk": lambda i: ingest(i, True),
+        "ingest_stream": ingest_stream,
+        "pro_responses": pro,
+        "health_report": lambda i: {"method": "POST", "url": "/health-report", "params": {"refresh": "true"}},
+        "health_report_stream": lambda i: {"method": "POST", "url": "/health-report",
+                                           "params": {"refresh": "true", "stream": "true"}},
+        "export_csv": lambda i: {"method": "GET", "url": "/export-data", "params": {"format": "csv"}},
+        "export_xlsx": lambda i: {"method": "GET", "url": "/export-data", "params": {"format": "xlsx"}},
+        "export_parquet": lambda i: {"method": "GET", "url": "/export-data", "params": {"format": "parquet"}},
+        "cohort_stats": lambda i: {"method": "GET", "url": "/cohort-stats"},
+    }
+
+
+# --- 서버 프로세스 ----------------------------------------------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"서버가 종료됨 (exit {proc.returncode})")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"서버 준비 시간 초과: {url}")
+
+
+def _status(pid, field):
+    """/proc/<pid>/status 의 kB 값을 MB 로 (Linux 외에는 None)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _reset_peak(pid):
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def start_servers(args):
+    procs = []
+    cmd = [sys.executable, os.path.join(HERE, "serve_fake.py"), "--port", str(args.port),
+           "--llm-latency", str(args.llm_latency), "--db-latency", str(args.db_latency)]
+    if args.sqlite:
+        cmd += ["--sqlite", args.sqlite]
+    if args.llm == "http":
+        llm_port = _free_port()
+        stub = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_openai.py"),
+                                 "--port", str(llm_port), "--latency", str(args.llm_latency)])
+        procs.append(stub)
+        _wait_ready(f"http://127.0.0.1:{llm_port}/", stub)
+        cmd += ["--llm-url", f"http://127.0.0.1:{llm_port}/v1"]
+    server = subprocess.Popen(cmd, cwd=ROOT)
+    procs.append(server)
+    _wait_ready(f"http://127.0.0.1:{args.port}/ping", server)
+    return server, procs
+
+
+# --- 부하 -------------------------------------------------------------------
+async def run_scenario(base_url, make_request, requests, concurrency, timeout):
+    latencies = []
+    errors = 0
+    statuses = {}
+    counter = itertools.count()
+
+    async def worker(client):
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            start = time.perf_counter()
+            try:
+                resp = await client.request(**make_request(i))
+                await resp.aread()
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                if resp.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, statuses, elapsed
+
+
+def summarize(latencies, errors, statuses, elapsed, requests, peak, base):
+    ms = [t * 1000 for t in latencies]
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "peak_rss_delta_mb": round(peak - base, 1) if peak is not None and base is not None else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    before, after = previous.get("meta", {}).get("args", {}), current["meta"]["args"]
+    differs = {k: (before.get(k), v) for k, v in after.items() if k != "scenarios" and before.get(k) != v}
+    if differs:
+        print(f"\n주의: 실행 조건이 다릅니다 {differs}")
+    print(f"\n{'scenario':22s} {'metric':15s} {'before':>10s} {'after':>10s} {'change':>8s}")
+    for name, result in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if old is None:
+            continue
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"):
+            a, b = old.get(metric), result.get(metric)
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+            print(f"{name:22s} {metric:15s} {a:10.2f} {b:10.2f} {change:>8s}")
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    fx = Fixtures()
+    names = list(_scenarios(fx))
+    parser.add_argument("--scenarios", default=",".join(names), help=f"쉼표로 구분 (기본: 전체 {names})")
+    parser.add_argument("--requests", type=int, default=50, help="시나리오별 요청 수")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=2, help="측정 전에 보내는 요청 수")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--db-latency", type=float, default=0.0)
+    parser.add_argument("--llm", choices=("inproc", "http"), default="inproc",
+                        help="inproc: 프로세스 내 fake, http: OpenAI 호환 HTTP 스텁 + 실제 SDK")
+    parser.add_argument("--sqlite", metavar="PATH", help="fake DB 대신 SQLite 저장소 사용 (:memory: 가능)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join(HERE, "results", f"harness-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    parser.add_argument("--compare", metavar="JSON", help="이전 결과 파일과 비교")
+    args = parser.parse_args()
+    args.port = args.port or _free_port()
+
+    scenarios = _scenarios(fx)
+    selected = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in selected if s not in scenarios]
+    if unknown:
+        parser.error(f"알 수 없는 시나리오: {unknown}")
+
+    server, procs = start_servers(args)
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    try:
+        print(f"{'scenario':22s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'peak MB':>8s} {'err':>4s}")
+        for name in selected:
+            make_request = scenarios[name]
+            if args.warmup:
+                asyncio.run(run_scenario(base_url, make_request, args.warmup, 1, args.timeout))
+            base = _status(server.pid, "VmRSS")
+            _reset_peak(server.pid)
+            latencies, errors, statuses, elapsed = asyncio.run(
+                run_scenario(base_url, make_request, args.requests, args.concurrency, args.timeout))
+            peak = _status(server.pid, "VmHWM")
+            results[name] = summarize(latencies, errors, statuses, elapsed, args.requests, peak, base)
+            r = results[name]
+            print(f"{name:22s} {r['throughput_rps']:8.2f} {r['p50_ms'] or 0:9.2f} {r['p95_ms'] or 0:9.2f} "
+                  f"{r['p99_ms'] or 0:9.2f} {r['peak_rss_mb'] or 0:8.1f} {errors:4d}")
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "port")},
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n저장: {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,49 @@
+"""Supabase/OpenAI 대역을 주입한 상태로 main.app 을 uvicorn 으로 띄운다 (벤치마크용).
+
+실행: python benchmarks/serve_fake.py [--port 8765] [--llm-latency 1.0] [--db-latency 0.0] [--discard-writes]
+     [--sqlite PATH]   # fake DB 대신 SQLite 저장소 사용
+     [--llm-url URL]   # 인프로세스 fake 대신 OpenAI SDK 로 HTTP 스텁(fake_openai.py) 호출
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import uvicorn  # noqa: E402
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--db-latency", type=float, default=0.0)
+    parser.add_argument("--discard-writes", action="store_true", help="fake DB 에 행을 보관하지 않음")
+    parser.add_argument("--sqlite", metavar="PATH", help="fake DB 대신 SQLite 저장소 사용 (:memory: 가능)")
+    parser.add_argument("--llm-url", metavar="URL", help="OpenAI 호환 스텁 주소 (예: http://127.0.0.1:8766/v1)")
+    args = parser.parse_args()
+
+    import main
+    import metrics
+    if args.sqlite:
+        from storage_sqlite import SQLiteClient
+        storage = SQLiteClient(args.sqlite)
+    else:
+        storage = FakeSupabase(latency=args.db_latency, discard_writes=args.discard_writes)
+    # 운영과 같게 저장소 왕복 계측(/metrics)을 포함한다
+    main.supabase = metrics.instrument_storage(storage)
+    if args.llm_url:
+        from openai import OpenAI
+        main.client = OpenAI(base_url=args.llm_url, api_key="fake")
+    else:
+        main.client = FakeOpenAI(latency=args.llm_latency)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main_()
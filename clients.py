@@ -0,0 +1,223 @@
+"""Supabase / OpenAI 클라이언트와 블로킹 I/O 실행기.
+
+저장소는 STORAGE_BACKEND 로 고른다: supabase(기본) 또는 sqlite(SQLITE_PATH 파일, storage_sqlite).
+어느 쪽이든 `supabase` 이름으로 같은 쿼리 빌더 인터페이스를 제공한다.
+
+두 SDK 모두 동기(blocking) 클라이언트이므로, async 엔드포인트에서는 반드시
+`await run_io(...)` 로 전용 스레드 풀에 넘겨 이벤트 루프가 멈추지 않게 한다.
+HTTP 연결은 클라이언트별 httpx 커넥션 풀에서 재사용된다.
+저장소 클라이언트는 metrics.instrument_storage 로 감싸 왕복마다 지연을 기록하고,
+run_io/iter_io 는 호출한 요청의 컨텍스트(단계별 시간 기록)를 I/O 스레드로 넘긴다.
+
+콜드 스타트를 줄이기 위해 두 클라이언트(와 openai/supabase/httpx SDK 임포트)는 처음
+사용할 때 만든다. `supabase`, `client` 는 그 자리를 지키는 프록시이고, warm_up() 으로
+미리 만들 수 있다 (main 의 lifespan 이 CLIENT_WARMUP 에 따라 호출).
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import CancelledError as FutureCancelledError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# 블로킹 I/O(Supabase/OpenAI 호출)를 동시에 처리할 스레드 수
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+# 클라이언트별 HTTP 커넥션 풀 크기
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+# 요청 전체 타임아웃(초): LLM 호출은 수십 초가 걸릴 수 있어 별도로 둔다
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "300"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+# iter_io 가 소비자보다 앞서 읽어 두는 최대 항목 수 (느린 클라이언트에게 보내는 동안의 버퍼)
+IO_STREAM_BUFFER = int(os.getenv("IO_STREAM_BUFFER", "8"))
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class _Lazy:
+    """처음 속성에 접근할 때 factory() 로 객체를 만들어 위임하는 프록시 (스레드 안전)"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._obj is not None
+
+    def get(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+_supabase_http = None
+
+
+def _create_storage():
+    """STORAGE_BACKEND 에 맞는 저장소 클라이언트 (supabase 면 그 HTTP 클라이언트도 만들어 둔다)"""
+    global _supabase_http
+    if STORAGE_BACKEND == "sqlite":
+        from storage_sqlite import SQLiteClient
+        return SQLiteClient(os.getenv("SQLITE_PATH", "piethon.db"))
+    if STORAGE_BACKEND != "supabase":
+        raise ValueError(f"지원하지 않는 STORAGE_BACKEND: {STORAGE_BACKEND}")
+    import httpx
+    from supabase import create_client, ClientOptions
+    http = httpx.Client(
+        limits=_limits(),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        follow_redirects=True,
+        http2=True,
+    )
+    storage = create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+        options=ClientOptions(httpx_client=http),
+    )
+    _supabase_http = http
+    return storage
+
+
+def _create_openai():
+    from openai import OpenAI, DefaultHttpxClient
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=OPENAI_TIMEOUT,
+        max_retries=OPENAI_MAX_RETRIES,
+        http_client=DefaultHttpxClient(limits=_limits()),
+    )
+
+
+_storage = _Lazy(_create_storage)
+supabase = metrics.instrument_storage(_storage)
+client = _Lazy(_create_openai)
+
+
+def warm_up():
+    """두 클라이언트를 미리 만든다 (첫 요청이 SDK 임포트와 클라이언트 생성 비용을 내지 않도록)"""
+    _storage.get()
+    client.get()
+
+_io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+
+async def run_io(fn, *args, **kwargs):
+    """블로킹 함수를 I/O 스레드 풀에서 실행하고 결과를 기다린다"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_io_executor, ctx.run, functools.partial(fn, *args, **kwargs))
+
+
+_DONE = object()
+# 버퍼가 가득 찬 동안 소비자가 멈췄는지 확인하는 간격(초)
+_PUT_POLL = 0.1
+
+
+async def iter_io(fn, *args, closer=None, **kwargs):
+    """fn(*args) 가 돌려주는 블로킹 이터레이터를 I/O 스레드 풀에서 소비하며 항목을 하나씩 내보낸다.
+
+    소비자가 중간에 멈추면(클라이언트 연결 종료 등) closer() 를 I/O 스레드에서 호출해 upstream 요청
+    (예: OpenAI 스트림의 HTTP 응답)을 끊는다. 이터레이터가 다음 항목을 기다리는 중에는 실행 중인
+    제너레이터라 close() 할 수 없으므로(ValueError), 블로킹된 읽기는 closer 로만 깨울 수 있다.
+    이터레이터의 close() 는 읽기가 끝나 멈춘 뒤 I/O 스레드에서 호출한다.
+
+    소비자보다 IO_STREAM_BUFFER 항목 넘게 앞서 읽지 않는다: 버퍼가 차면 I/O 스레드가 자리가 날
+    때까지 기다리므로, 느리거나 멈춘 클라이언트에게 보내는 동안에도 메모리 사용량이 일정하다
+    (대신 그동안 I/O 스레드 하나를 차지한다).
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=IO_STREAM_BUFFER)
+    stop = threading.Event()
+    holder = {}
+
+    def put(item) -> bool:
+        """자리가 날 때까지 기다렸다 넣는다. 소비자가 멈췄거나 루프가 닫혔으면 False"""
+        if stop.is_set():
+            return False
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:
+            # 이벤트 루프가 이미 종료됨
+            return False
+        while True:
+            try:
+                future.result(timeout=_PUT_POLL)
+                return True
+            except FutureTimeoutError:
+                if stop.is_set() or loop.is_closed():
+                    future.cancel()
+                    return False
+            except FutureCancelledError:
+                # 루프 종료로 대기 중인 put 이 취소됨
+                return False
+
+    def close_iterator():
+        close = getattr(holder.get("it"), "close", None)
+        if close is not None:
+            close()
+
+    def pump():
+        try:
+            holder["it"] = fn(*args, **kwargs)
+            for item in holder["it"]:
+                if not put((item, None)):
+                    break
+        except Exception as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+        finally:
+            if stop.is_set():
+                close_iterator()
+
+    loop.run_in_executor(_io_executor, contextvars.copy_context().run, pump)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        if not stop.is_set():
+            stop.set()
+            # 다음 청크를 기다리며 블로킹된 upstream 응답을 즉시 닫는다
+            if closer is not None:
+                _io_executor.submit(closer)
+
+
+def close_clients():
+    """종료 시 스레드 풀과 커넥션 풀 정리"""
+    _io_executor.shutdown(wait=False, cancel_futures=True)
+    if _supabase_http is not None:
+        _supabase_http.close()
+    elif _storage.built:
+        _storage.close()
+    if client.built:
+        client.close()
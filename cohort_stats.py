@@ -0,0 +1,272 @@
+"""/cohort-stats 코호트 집계.
+
+원본 행을 내려받지 않고 작은 결과만 돌려준다. 집계는 적재(ingest_fhir) 때 사용자별로
+갱신하는 요약 테이블에서 읽으므로 반복 조회가 사실(fact) 테이블을 다시 훑지 않는다.
+
+- medication_summaries: (user_id, medication_code, medication_name, age) 별 조제 건수, days_supply 합
+- claim_summaries: (user_id, claim_type) 별 청구 건수, copay/benefit 합
+- immunization_summaries: (user_id, vaccine_name) 별 접종 횟수, 마지막 접종일
+
+요약은 적재에서 매핑 행이 추가/변경된 사용자만 다시 계산한다. 매핑 행을 쓰기 전에
+users.summary_dirty 에 표시(mark_dirty)하고, 적재가 끝날 때(캐시 적중 포함) 표시된 사용자를
+갱신한 뒤 표시를 지운다(refresh_dirty). 갱신이 실패하면 표시가 남아 다음 적재에서 다시 시도한다.
+
+갱신(사용자별 삭제 + 재계산)과 집계는 저장소 안에서 수행한다.
+- SQLite: SQLiteClient.refresh_summaries / cohort_stats (한 트랜잭션, GROUP BY)
+- Supabase: refresh_cohort_summaries / cohort_stats_summary 함수 (rpc)
+- 둘 다 없는 클라이언트(벤치마크용 fake 등): 요약 테이블을 페이지 단위로 읽어 Python 으로 합친다
+
+Supabase 에는 supabase/migrations 의 cohort_summaries, cohort_summary_refresh 마이그레이션으로
+테이블, 컬럼, 함수를 만들어 두어야 한다. 빠져 있으면 앱 시작 시 schema.check 가 알려준다.
+"""
+import os
+import threading
+import time
+
+import export_stream
+
+# 나이 구간 기본 폭
+COHORT_AGE_BAND = int(os.getenv("COHORT_AGE_BAND", "10"))
+
+SUMMARY_TABLES = ("medication_summaries", "claim_summaries", "immunization_summaries")
+
+# 저장소 안에서 갱신할 수 없는 클라이언트의 삭제 후 삽입을 프로세스 안에서 직렬화
+_refresh_lock = threading.Lock()
+
+
+def _num(value):
+    try:
+        return float(value) if value is not None and value != "" else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# --- 요약 갱신 -------------------------------------------------------------
+def _summarize(db, ids):
+    """사용자 ids 의 사실 테이블 행을 읽어 요약 테이블별 행 목록을 만든다"""
+    in_ids = [lambda q: q.in_("user_id", ids)]
+    meds = {}
+    for r in export_stream.iter_rows(db, "medication_dispenses",
+                                     "id,user_id,medication_code,medication_name,age,days_supply", in_ids):
+        key = (r.get("user_id"), r.get("medication_code"), r.get("medication_name"), r.get("age"))
+        acc = meds.setdefault(key, [0, 0.0])
+        acc[0] += 1
+        acc[1] += _num(r.get("days_supply"))
+    claims = {}
+    for r in export_stream.iter_rows(db, "treatment_claims",
+                                     "id,user_id,claim_type,copay_amount,benefit_amount", in_ids):
+        acc = claims.setdefault((r.get("user_id"), r.get("claim_type")), [0, 0.0, 0.0])
+        acc[0] += 1
+        acc[1] += _num(r.get("copay_amount"))
+        acc[2] += _num(r.get("benefit_amount"))
+    vaccines = {}
+    for r in export_stream.iter_rows(db, "immunizations", "id,user_id,vaccine_name,occurrence_date", in_ids):
+        acc = vaccines.setdefault((r.get("user_id"), r.get("vaccine_name")), [0, None])
+        acc[0] += 1
+        date = r.get("occurrence_date") or None
+        if date and (acc[1] is None or date > acc[1]):
+            acc[1] = date
+    return {
+        "medication_summaries": [
+            {"user_id": uid, "medication_code": code, "medication_name": name, "age": age,
+             "dispense_count": n, "days_supply_total": days}
+            for (uid, code, name, age), (n, days) in meds.items()
+        ],
+        "claim_summaries": [
+            {"user_id": uid, "claim_type": claim_type, "claim_count": n,
+             "copay_total": copay, "benefit_total": benefit}
+            for (uid, claim_type), (n, copay, benefit) in claims.items()
+        ],
+        "immunization_summaries": [
+            {"user_id": uid, "vaccine_name": name, "dose_count": n, "last_date": last}
+            for (uid, name), (n, last) in vaccines.items()
+        ],
+    }
+
+
+def refresh_summaries(db, user_ids):
+    """user_ids 의 요약 행을 사실 테이블에서 다시 계산해 교체한다.
+
+    SQLite 는 refresh_summaries(한 트랜잭션), Supabase 는 refresh_cohort_summaries rpc 로
+    저장소 안에서 원자적으로 교체해 동시 적재가 같은 사용자를 두 번 세지 않게 한다.
+    """
+    ids = sorted({uid for uid in user_ids if uid is not None})
+    native = getattr(db, "refresh_summaries", None)
+    rpc = getattr(db, "rpc", None) if native is None else None
+    for chunk in _chunks(ids, export_stream.EXPORT_USER_BATCH):
+        if native is not None:
+            native(chunk)
+        elif rpc is not None:
+            rpc("refresh_cohort_summaries", {"user_ids": chunk}).execute()
+        else:
+            with _refresh_lock:
+                rows = _summarize(db, chunk)
+                for table in SUMMARY_TABLES:
+                    db.table(table).delete().in_("user_id", chunk).execute()
+                    for part in _chunks(rows[table], export_stream.EXPORT_PAGE_SIZE):
+                        db.table(table).insert(part).execute()
+
+
+def mark_dirty(db, user_ids):
+    """user_ids 의 요약을 '다시 계산 필요' 로 표시한다 (매핑 행을 쓰기 전에 호출).
+
+    표시 값은 매번 새 값이라 갱신 도중 다시 표시된 사용자는 refresh_dirty 가 지우지 않는다.
+    """
+    ids = sorted({uid for uid in user_ids if uid is not None})
+    mark = time.time_ns()
+    for chunk in _chunks(ids, export_stream.EXPORT_USER_BATCH):
+        db.table("users").update({"summary_dirty": mark}).in_("id", chunk).execute()
+
+
+def refresh_dirty(db, user_ids) -> int:
+    """user_ids 중 표시된 사용자의 요약을 갱신하고 표시를 지운다. 갱신한 사용자 수를 돌려준다.
+
+    표시는 갱신이 성공한 뒤에만 지우므로, 실패하면 다음 적재(캐시 적중 포함)에서 다시 갱신된다.
+    """
+    ids = sorted({uid for uid in user_ids if uid is not None})
+    refreshed = 0
+    for chunk in _chunks(ids, export_stream.EXPORT_USER_BATCH):
+        marks = db.table("users").select("id,summary_dirty").in_("id", chunk) \
+            .neq("summary_dirty", 0).execute().data or []
+        if not marks:
+            continue
+        refresh_summaries(db, [m["id"] for m in marks])
+        for m in marks:
+            db.table("users").update({"summary_dirty": 0}) \
+                .eq("id", m["id"]).eq("summary_dirty", m["summary_dirty"]).execute()
+        refreshed += len(marks)
+    return refreshed
+
+
+def rebuild_summaries(db) -> int:
+    """모든 사용자의 요약을 다시 만든다 (기존 데이터 백필용). 처리한 사용자 수를 돌려준다"""
+    ids = [u["id"] for u in export_stream.iter_rows(db, "users", "id")]
+    clear_summaries(db)
+    refresh_summaries(db, ids)
+    return len(ids)
+
+
+def clear_summaries(db):
+    for table in SUMMARY_TABLES:
+        db.table(table).delete().neq("id", 0).execute()
+
+
+# --- 집계 ------------------------------------------------------------------
+def _band(age, width):
+    if age is None:
+        return None
+    low = int(age) // width * width
+    return f"{low}-{low + width - 1}"
+
+
+def medication_filters(min_age=None, max_age=None, med_codes=None) -> list:
+    """export 와 같은 의미의 조제 필터를 medication_summaries 에 적용하는 함수 목록"""
+    return export_stream.ehr_filters(min_age, max_age, med_codes)["medication_dispenses"]
+
+
+def _iter_for_users(db, table, columns, users):
+    """users 가 None 이면 table 전체를, 아니면 해당 사용자 행만 배치로 읽는다"""
+    if users is None:
+        yield from export_stream.iter_rows(db, table, columns)
+        return
+    for chunk in _chunks(sorted(users), export_stream.EXPORT_USER_BATCH):
+        yield from export_stream.iter_rows(db, table, columns, [lambda q, chunk=chunk: q.in_("user_id", chunk)])
+
+
+def _aggregate(db, min_age, max_age, med_codes, age_band):
+    """요약 테이블을 페이지 단위로 읽어 코호트 통계를 만든다 (저장소 집계가 없는 클라이언트용)"""
+    filtered = min_age is not None or max_age is not None or bool(med_codes)
+    meds = {}
+    bands = {}
+    cohort = set()
+    for r in export_stream.iter_rows(db, "medication_summaries",
+                                     "id,user_id,medication_code,medication_name,age,dispense_count,days_supply_total",
+                                     medication_filters(min_age, max_age, med_codes)):
+        uid = r.get("user_id")
+        cohort.add(uid)
+        acc = meds.setdefault((r.get("medication_code"), r.get("medication_name")), [0, set(), 0.0])
+        acc[0] += r.get("dispense_count") or 0
+        acc[1].add(uid)
+        acc[2] += _num(r.get("days_supply_total"))
+        band = bands.setdefault(_band(r.get("age"), age_band), [0, set()])
+        band[0] += r.get("dispense_count") or 0
+        band[1].add(uid)
+
+    # 필터가 없으면 코호트는 요약이 있는 모든 사용자
+    users = cohort if filtered else None
+    claims = {}
+    claim_users = set()
+    for r in _iter_for_users(db, "claim_summaries",
+                             "id,user_id,claim_type,claim_count,copay_total,benefit_total", users):
+        acc = claims.setdefault(r.get("claim_type"), [0, set(), 0.0, 0.0])
+        acc[0] += r.get("claim_count") or 0
+        acc[1].add(r.get("user_id"))
+        acc[2] += _num(r.get("copay_total"))
+        acc[3] += _num(r.get("benefit_total"))
+        claim_users.add(r.get("user_id"))
+    vaccines = {}
+    vaccine_users = set()
+    for r in _iter_for_users(db, "immunization_summaries", "id,user_id,vaccine_name,dose_count", users):
+        acc = vaccines.setdefault(r.get("vaccine_name"), [0, set()])
+        acc[0] += r.get("dose_count") or 0
+        acc[1].add(r.get("user_id"))
+        vaccine_users.add(r.get("user_id"))
+    if not filtered:
+        cohort |= claim_users | vaccine_users
+
+    return {
+        "cohort_users": len(cohort),
+        "medications": [
+            {"medication_code": code, "medication_name": name, "dispenses": n,
+             "users": len(uids), "days_supply_total": days}
+            for (code, name), (n, uids, days) in meds.items()
+        ],
+        "age_bands": [
+            {"band": band, "dispenses": n, "users": len(uids)} for band, (n, uids) in bands.items()
+        ],
+        "claims": [
+            {"claim_type": claim_type, "claims": n, "users": len(uids),
+             "copay_total": copay, "benefit_total": benefit}
+            for claim_type, (n, uids, copay, benefit) in claims.items()
+        ],
+        "vaccines": [
+            {"vaccine_name": name, "doses": n, "users": len(uids)} for name, (n, uids) in vaccines.items()
+        ],
+    }
+
+
+def cohort_stats(db, min_age=None, max_age=None, med_codes=None, age_band=None) -> dict:
+    """코호트 통계. SQLite 는 cohort_stats, Supabase 는 cohort_stats_summary rpc 로 저장소에서 집계한다"""
+    age_band = age_band or COHORT_AGE_BAND
+    native = getattr(db, "cohort_stats", None)
+    rpc = getattr(db, "rpc", None) if native is None else None
+    if native is not None:
+        stats = native(min_age, max_age, med_codes, age_band)
+    elif rpc is not None:
+        stats = rpc("cohort_stats_summary", {
+            "p_min_age": min_age, "p_max_age": max_age, "p_med_names": med_codes or None, "p_age_band": age_band,
+        }).execute().data
+    else:
+        stats = _aggregate(db, min_age, max_age, med_codes, age_band)
+
+    cohort = stats["cohort_users"]
+    stats["medications"].sort(key=lambda m: (-m["dispenses"], str(m["medication_name"])))
+    stats["age_bands"].sort(key=lambda b: (b["band"] is None, int(b["band"].split("-")[0]) if b["band"] else 0))
+    stats["claims"].sort(key=lambda c: str(c["claim_type"]))
+    stats["vaccines"].sort(key=lambda v: (-v["users"], str(v["vaccine_name"])))
+    for v in stats["vaccines"]:
+        v["coverage"] = v["users"] / cohort if cohort else 0.0
+    stats["totals"] = {
+        "dispenses": sum(m["dispenses"] for m in stats["medications"]),
+        "days_supply_total": sum(m["days_supply_total"] for m in stats["medications"]),
+        "claims": sum(c["claims"] for c in stats["claims"]),
+        "copay_total": sum(c["copay_total"] for c in stats["claims"]),
+        "benefit_total": sum(c["benefit_total"] for c in stats["claims"]),
+    }
+    stats["filters"] = {"min_age": min_age, "max_age": max_age, "med_codes": med_codes, "age_band": age_band}
+    return stats
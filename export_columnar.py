@@ -0,0 +1,187 @@
+"""/export-data 의 컬럼 기반 출력 (Parquet / Arrow IPC 스트림).
+
+PRO 응답과 EHR 행을 한 행 = 레코드 하나인 long 형식 테이블 하나로 내보낸다.
+record_type 컬럼이 원본 테이블을 나타내고, 테이블별 컬럼은 해당 레코드에만 값이 있다.
+날짜는 date32, 금액은 float64 등 실제 타입으로 저장하므로 pandas/DuckDB 에서
+별도 파싱 없이 바로 읽을 수 있다. 사용자 배치 하나가 row group(IPC 는 record batch)
+하나가 되어 만들어지는 대로 스트리밍된다.
+"""
+import os
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import export_stream
+import fast_json
+import metrics
+
+PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+ARROW_COMPRESSION = os.getenv("EXPORT_ARROW_COMPRESSION", "zstd") or None
+
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+FILE_EXTENSIONS = {"parquet": "parquet", "arrow": "arrows"}
+
+RECORD_TYPES = export_stream.RECORD_TYPES
+
+SCHEMA = pa.schema([
+    ("record_type", pa.dictionary(pa.int8(), pa.string())),
+    ("user_id", pa.int64()),
+    ("id", pa.int64()),
+    ("resource_id", pa.int64()),
+    # pro_responses
+    ("response", pa.string()),
+    # immunizations
+    ("vaccine_name", pa.string()),
+    ("occurrence_date", pa.date32()),
+    ("dose_number", pa.int32()),
+    ("performer_name", pa.string()),
+    # medication_dispenses
+    ("medication_code", pa.string()),
+    ("medication_name", pa.string()),
+    ("pharmacy_name", pa.string()),
+    ("when_prepared", pa.date32()),
+    ("days_supply", pa.float64()),
+    ("age", pa.int32()),
+    # treatment_claims
+    ("claim_type", pa.string()),
+    ("created_date", pa.date32()),
+    ("copay_amount", pa.float64()),
+    ("benefit_amount", pa.float64()),
+    # 증분 내보내기(export_delta)의 변경 번호
+    ("change_seq", pa.int64()),
+])
+
+
+def _date(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _int(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _str(value):
+    return None if value is None else str(value)
+
+
+# 스키마 타입별 값 변환
+_CONVERTERS = {
+    pa.int64(): _int,
+    pa.int32(): _int,
+    pa.float64(): _float,
+    pa.date32(): _date,
+    pa.string(): _str,
+}
+_FIELDS = [(f.name, _CONVERTERS.get(f.type)) for f in SCHEMA if f.name != "record_type"]
+
+
+def records_table(records) -> pa.Table:
+    """(원본 테이블, 행) 목록을 long 형식 Arrow 테이블로 변환"""
+    columns = {name: [] for name in SCHEMA.names}
+    for table, row in records:
+        columns["record_type"].append(RECORD_TYPES[table])
+        for name, convert in _FIELDS:
+            columns[name].append(convert(row.get(name)))
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+
+def _response(row) -> dict:
+    return {**row, "response": fast_json.dumps(row.get("response"))}
+
+
+def batch_table(batch) -> pa.Table:
+    """iter_user_batches 의 배치 하나를 long 형식 Arrow 테이블로 변환"""
+    records = []
+    for uid, response, groups in batch:
+        records.append(("pro_responses", _response({"user_id": uid, "response": response})))
+        for _, table in export_stream.EHR_TABLES:
+            records += [(table, row) for row in groups[table]]
+    return records_table(records)
+
+
+class _Sink:
+    """Arrow writer 가 쓴 바이트를 모아 두었다가 청크 단위로 꺼내는 쓰기 전용 파일 객체"""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _writer(fmt, sink):
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, SCHEMA, compression=PARQUET_COMPRESSION)
+    options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+    return pa.ipc.new_stream(sink, SCHEMA, options=options)
+
+
+def _iter_tables(tables, fmt):
+    sink = _Sink()
+    writer = _writer(fmt, sink)
+    try:
+        for make_table in tables:
+            with metrics.timed(f"export_serialize_{fmt}"):
+                writer.write_table(make_table())
+                data = sink.drain()
+            if data:
+                yield data
+    finally:
+        with metrics.timed(f"export_serialize_{fmt}"):
+            writer.close()
+    yield sink.drain()
+
+
+def iter_columnar(db, fmt, filters=None):
+    """Parquet(fmt="parquet") 또는 Arrow IPC 스트림(fmt="arrow") 바이트 청크를 내보낸다"""
+    batches = export_stream.iter_user_batches(db, filters)
+    return _iter_tables((lambda b=batch: batch_table(b) for batch in batches), fmt)
+
+
+def iter_columnar_delta(db, fmt, since=None, until=None, filters=None):
+    """export_delta.iter_changes 의 변경 행을 같은 long 형식으로 내보낸다 (묶음 하나가 row group 하나)"""
+    import export_delta
+    changes = export_delta.iter_changes(db, since, until, filters)
+    return _iter_tables(
+        (lambda t=table, rows=rows: records_table([(t, _response(r) if t == "pro_responses" else r) for r in rows])
+         for table, rows in changes),
+        fmt,
+    )
@@ -0,0 +1,125 @@
+"""/export-data 증분(delta) 내보내기.
+
+적재(ingest_fhir)와 PRO 응답 저장(create_pro_response)은 pro_responses, immunizations,
+medication_dispenses, treatment_claims 에 행을 쓰거나 고칠 때마다 change_seq 에 단조 증가하는
+변경 번호(마이크로초 시각 기반, 프로세스 안에서 엄격히 증가)를 기록한다.
+
+클라이언트는 직전 응답의 X-Export-Cursor 값을 cursor 로 넘기고, 그 뒤에 생기거나 바뀐 행만
+받는다 (cursor 가 없으면 전체). 새 커서는 지금보다 EXPORT_DELTA_LAG 초 이전으로 잡는다.
+변경 번호는 쓰기 요청을 보내기 직전에 찍으므로, 그 이전에 번호를 받은 쓰기는 모두 커밋됐거나
+실패했다고 볼 수 있으려면 lag 가 쓰기 한 번의 최대 시간(WRITE_TIMEOUT: supabase 면
+SUPABASE_TIMEOUT, sqlite 면 busy timeout) 이상이어야 한다. check_lag() 가 앱 시작 시 이를
+검사한다. Supabase 쪽 statement_timeout 도 SUPABASE_TIMEOUT 보다 짧아야 한다 (클라이언트가
+포기한 요청이 서버에서 늦게 커밋되지 않도록). 이 조건에서 여러 워커가 동시에 써도 행을 놓치지
+않으며, 같은 행을 두 번 받을 수 있으므로 (테이블, id) 로 upsert 하면 된다. 삭제는 추적하지
+않는다 (/debug/clear-data 뿐).
+
+Supabase 에는 supabase/migrations 의 change_seq 마이그레이션으로 컬럼과 인덱스를 추가해야 한다
+(기존 행은 0: 첫 전체 동기화에 포함). 빠져 있으면 앱 시작 시 schema.check 가 알려준다.
+"""
+import base64
+import os
+import threading
+import time
+
+import export_stream
+import fast_json
+import metrics
+from clients import STORAGE_BACKEND, SUPABASE_TIMEOUT
+
+# 변경 번호를 찍은 쓰기가 커밋되기까지 걸릴 수 있는 최대 시간(초). sqlite3 의 기본 busy timeout 은 5초
+WRITE_TIMEOUT = SUPABASE_TIMEOUT if STORAGE_BACKEND == "supabase" else 5.0
+EXPORT_DELTA_LAG = float(os.getenv("EXPORT_DELTA_LAG", str(WRITE_TIMEOUT + 5)))
+
+CHANGE_TABLES = ("pro_responses", "immunizations", "medication_dispenses", "treatment_claims")
+
+_seq_lock = threading.Lock()
+_last_seq = 0
+
+
+def next_change_seq() -> int:
+    """새 변경 번호 (마이크로초 단위 시각, 같은 프로세스 안에서는 항상 이전 값보다 크다)"""
+    global _last_seq
+    with _seq_lock:
+        _last_seq = max(_last_seq + 1, time.time_ns() // 1000)
+        return _last_seq
+
+
+def check_lag():
+    """lag 가 쓰기 타임아웃보다 짧으면 커서 뒤에 커밋되는 행을 영영 놓칠 수 있으므로 시작을 막는다"""
+    if EXPORT_DELTA_LAG < WRITE_TIMEOUT:
+        raise RuntimeError(
+            f"EXPORT_DELTA_LAG({EXPORT_DELTA_LAG}s) 는 저장소 쓰기 타임아웃({WRITE_TIMEOUT}s) 이상이어야 합니다."
+        )
+
+
+def cursor_upper_bound(lag: float = None) -> int:
+    """이번 응답에 포함할 마지막 변경 번호 (= 다음 커서)"""
+    lag = EXPORT_DELTA_LAG if lag is None else lag
+    return time.time_ns() // 1000 - int(lag * 1_000_000)
+
+
+def encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(f"v1:{seq}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """커서 문자열의 변경 번호. 형식이 잘못되면 ValueError"""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except Exception:
+        raise ValueError("올바르지 않은 커서입니다.")
+    version, _, seq = text.partition(":")
+    if version != "v1" or not seq.isdigit():
+        raise ValueError("올바르지 않은 커서입니다.")
+    return int(seq)
+
+
+def _pages(rows, size):
+    page = []
+    for row in rows:
+        page.append(row)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _changed_rows(db, table, since, until, filters=()):
+    window = [lambda q: q.lte("change_seq", until)]
+    if since is not None:
+        window.append(lambda q: q.gt("change_seq", since))
+    return export_stream.iter_rows(db, table, "*", [*window, *filters])
+
+
+def iter_changes(db, since=None, until=None, filters=None, page_size=None):
+    """(since, until] 구간에 생기거나 바뀐 행을 (테이블, [행]) 묶음으로 내보낸다.
+
+    pro_responses 의 user_id(name_hash)는 전체 내보내기와 같게 users.id 로 바꾸고,
+    users 에 없는 해시의 응답은 건너뛴다. 그 사용자가 나중에 만들어지면 적재 경로
+    (_get_or_create_user)가 해당 응답의 change_seq 를 다시 찍으므로 다음 delta 에 포함된다.
+    """
+    filters = filters or {}
+    page_size = page_size or export_stream.EXPORT_PAGE_SIZE
+    until = cursor_upper_bound() if until is None else until
+    for table in CHANGE_TABLES:
+        for rows in _pages(_changed_rows(db, table, since, until, filters.get(table, ())), page_size):
+            if table == "pro_responses":
+                hashes = list({r["user_id"] for r in rows if r.get("user_id")})
+                mapping = {}
+                for chunk in export_stream._chunks(hashes, export_stream.EXPORT_USER_BATCH):
+                    users = db.table("users").select("id,name_hash").in_("name_hash", chunk).execute().data or []
+                    mapping.update((u["name_hash"], u["id"]) for u in users)
+                rows = [{**r, "user_id": mapping[r["user_id"]]} for r in rows if r.get("user_id") in mapping]
+                if not rows:
+                    continue
+            yield table, rows
+
+
+def iter_ndjson(db, since=None, until=None, filters=None):
+    """변경 행을 한 줄에 하나씩 {"table": ..., "row": {...}} NDJSON 바이트 청크로 내보낸다"""
+    for table, rows in iter_changes(db, since, until, filters):
+        with metrics.timed("export_serialize_ndjson"):
+            chunk = b"".join(fast_json.dumps_bytes({"table": table, "row": row}) + b"\n" for row in rows)
+        yield chunk
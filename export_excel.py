@@ -0,0 +1,104 @@
+"""/export-data 의 Excel(4개 시트) 출력.
+
+openpyxl write-only 워크북에 페이지 단위로 읽은 행을 바로 추가하고, 결과는 BytesIO 대신
+임시 파일에 저장한 뒤 청크 단위로 스트리밍한다. DataFrame 을 만들지 않으므로 메모리
+사용량이 행 수와 무관하게 일정하다. 시트 이름과 컬럼은 기존 pandas 출력과 같다.
+"""
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+import export_stream
+import metrics
+
+EXPORT_TMP_DIR = os.getenv("EXPORT_TMP_DIR") or None
+_READ_CHUNK = 1024 * 1024
+
+# 원본 테이블 -> 시트 이름 (시트 순서 유지)
+SHEETS = {
+    "pro_responses": "PRO Responses",
+    "immunizations": "Immunizations",
+    "medication_dispenses": "MedicationDispenses",
+    "treatment_claims": "TreatmentClaims",
+}
+
+
+def _cell(value):
+    # pandas 출력과 같게 jsonb(dict/list) 값은 문자열로 쓴다
+    return str(value) if isinstance(value, (dict, list)) else value
+
+
+class _SheetWriter:
+    """첫 행의 키로 헤더를 쓰고 이후 행을 같은 컬럼 순서로 추가한다.
+
+    PostgREST 의 `select *` 결과는 모든 행의 키가 같으므로 첫 행 기준으로 충분하다.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.columns = None
+        self.rows = 0
+
+    def append(self, row: dict):
+        if self.columns is None:
+            self.columns = list(row)
+            self.ws.append(self.columns)
+        self.ws.append([_cell(row.get(c)) for c in self.columns])
+        self.rows += 1
+
+
+def write_workbook(db, path, filters=None) -> dict:
+    """path 에 4개 시트 워크북을 쓰고 시트별 행 수를 돌려준다"""
+    wb = Workbook(write_only=True)
+    sheets = {table: _SheetWriter(wb.create_sheet(title)) for table, title in SHEETS.items()}
+    for row in export_stream.iter_rows(db, "pro_responses"):
+        sheets["pro_responses"].append(row)
+    for batch in export_stream.iter_user_batches(db, filters):
+        with metrics.timed("export_serialize_xlsx"):
+            for _, _, groups in batch:
+                for table, rows in groups.items():
+                    for row in rows:
+                        sheets[table].append(row)
+    with metrics.timed("export_serialize_xlsx"):
+        wb.save(path)
+    return {SHEETS[table]: sheet.rows for table, sheet in sheets.items()}
+
+
+def build_workbook(db, filters=None) -> str:
+    """임시 파일에 워크북을 만들고 경로를 돌려준다. 호출자가 iter_file 로 읽으며 지운다"""
+    fd, path = tempfile.mkstemp(prefix="export-", suffix=".xlsx", dir=EXPORT_TMP_DIR)
+    os.close(fd)
+    try:
+        write_workbook(db, path, filters)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _read_chunks(f, path):
+    try:
+        with f:
+            while True:
+                chunk = f.read(_READ_CHUNK)
+                if not chunk:
+                    return
+                yield chunk
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def iter_file(path):
+    """파일을 청크 단위로 읽는 이터레이터를 돌려준다.
+
+    열어 둔 핸들로 계속 읽을 수 있으므로 파일은 바로 삭제한다 (응답이 시작되기 전에
+    연결이 끊겨도 임시 파일이 남지 않는다). 삭제할 수 없는 플랫폼에서는 다 읽은 뒤 지운다.
+    """
+    f = open(path, "rb")
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return _read_chunks(f, path)
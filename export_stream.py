@@ -0,0 +1,221 @@
+"""/export-data 스트리밍 파이프라인.
+
+테이블을 id 기준 keyset 페이지네이션으로 나눠 읽고, PRO 응답 사용자를 배치 단위로
+EHR 행과 합쳐 바로 CSV 행으로 내보낸다. 한 번에 메모리에 올라가는 것은 한 배치
+(EXPORT_USER_BATCH 명)의 행뿐이라 사용자 수가 늘어도 메모리 사용량이 일정하고,
+Supabase 의 기본 최대 행 수(max-rows) 제한에도 걸리지 않는다.
+
+CSV 레이아웃은 두 가지다. wide(기본)는 사용자당 한 행에 EHR 행을 immun_N/meds_N/tc_N 셀로
+펼치므로 헤더를 만들려면 개수를 세는 1차 패스가 필요하고, 크기가 (사용자 수 x 최대 행 수)에
+비례한다 (행이 적은 사용자도 빈 셀로 채운다). long 은 레코드(PRO 응답, EHR 행)당 한 행
+(user_id, record_type, data) 이라 1차 패스가 없고 크기가 전체 행 수에 비례한다.
+
+모든 함수는 블로킹 제너레이터이므로 async 엔드포인트에서는 `iter_io` 로 소비한다.
+"""
+import csv
+import io
+import os
+from collections import OrderedDict
+
+import fast_json
+import metrics
+
+# 한 번의 select 로 가져오는 최대 행 수 (Supabase max-rows 보다 작게)
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+# in_ 필터 하나에 넣는 사용자 수 (URL 길이 제한 고려)
+EXPORT_USER_BATCH = int(os.getenv("EXPORT_USER_BATCH", "200"))
+
+# (CSV 컬럼 접두사, 테이블)
+EHR_TABLES = (
+    ("immun", "immunizations"),
+    ("meds", "medication_dispenses"),
+    ("tc", "treatment_claims"),
+)
+
+# long 레이아웃(CSV, Parquet, Arrow)의 record_type 값
+RECORD_TYPES = {
+    "pro_responses": "pro_response",
+    "immunizations": "immunization",
+    "medication_dispenses": "medication_dispense",
+    "treatment_claims": "treatment_claim",
+}
+
+
+def ehr_filters(min_age=None, max_age=None, med_codes=None) -> dict:
+    """테이블별 추가 필터 (쿼리 빌더를 받아 쿼리 빌더를 돌려주는 함수 목록)"""
+    meds = []
+    if min_age is not None:
+        meds.append(lambda q: q.gte("age", min_age))
+    if max_age is not None:
+        meds.append(lambda q: q.lte("age", max_age))
+    if med_codes:
+        meds.append(lambda q: q.in_("medication_name", med_codes))
+    return {"medication_dispenses": meds}
+
+
+def iter_rows(db, table, columns="*", filters=(), page_size=None):
+    """id 오름차순 keyset 페이지네이션으로 table 의 행을 하나씩 내보낸다.
+
+    columns 를 지정할 때는 id 를 포함해야 한다.
+    """
+    page_size = page_size or EXPORT_PAGE_SIZE
+    last_id = None
+    while True:
+        q = db.table(table).select(columns)
+        for apply in filters:
+            q = apply(q)
+        if last_id is not None:
+            q = q.gt("id", last_id)
+        rows = q.order("id").limit(page_size).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def _latest_response(db, name_hash):
+    rows = (db.table("pro_responses").select("id,response").eq("user_id", name_hash)
+            .order("id", desc=True).limit(1).execute().data or [])
+    return rows[0].get("response") if rows else None
+
+
+def iter_pro_users(db, page_size=None):
+    """PRO 응답 사용자를 해시 순으로 (name_hash, 가장 최근 응답) 페이지 단위로 내보낸다.
+
+    (user_id, id) 순으로 읽고 user_id 로 keyset 페이지네이션한다. 페이지 끝에서 응답이
+    잘렸을 수 있는 마지막 사용자는 다음 페이지에서 다시 읽는다.
+    """
+    page_size = page_size or EXPORT_PAGE_SIZE
+    cursor = None
+    while True:
+        q = db.table("pro_responses").select("id,user_id,response")
+        if cursor is not None:
+            q = q.gt("user_id", cursor)
+        rows = q.order("user_id").order("id").limit(page_size).execute().data or []
+        latest = OrderedDict()
+        for r in rows:
+            if r.get("user_id"):
+                latest[r["user_id"]] = r.get("response")
+        full = len(rows) == page_size
+        if full and len(latest) > 1:
+            latest.popitem()
+        elif full and latest:
+            # 한 사용자의 응답이 페이지보다 많은 경우: 마지막 응답만 따로 조회
+            name_hash = next(iter(latest))
+            latest[name_hash] = _latest_response(db, name_hash)
+        if not latest:
+            return
+        yield list(latest.items())
+        if not full:
+            return
+        cursor = next(reversed(latest))
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def iter_user_batches(db, filters=None, columns="*", batch_size=None):
+    """PRO 응답 사용자 배치마다 [(정수 user_id, 응답, {테이블: [행]})] 를 내보낸다.
+
+    users 테이블에 없는 해시는 건너뛴다. columns 로 EHR 테이블에서 읽을 컬럼을 줄일 수 있다.
+    저장소가 export_user_batches 를 제공하면(SQLite 등) 조인을 저장소에 맡긴다.
+    """
+    filters = filters or {}
+    batch_size = batch_size or EXPORT_USER_BATCH
+    native = getattr(db, "export_user_batches", None)
+    if native is not None:
+        yield from native(filters, columns, batch_size, [table for _, table in EHR_TABLES])
+        return
+    for page in iter_pro_users(db):
+        for batch in _chunks(page, batch_size):
+            hashes = [h for h, _ in batch]
+            users = db.table("users").select("id,name_hash").in_("name_hash", hashes).execute().data or []
+            mapping = {u.get("name_hash"): u.get("id") for u in users}
+            members = [(mapping[h], resp) for h, resp in batch if mapping.get(h) is not None]
+            if not members:
+                continue
+            ids = [uid for uid, _ in members]
+            groups = {uid: {table: [] for _, table in EHR_TABLES} for uid in ids}
+            for _, table in EHR_TABLES:
+                in_batch = [lambda q: q.in_("user_id", ids), *filters.get(table, ())]
+                for r in iter_rows(db, table, columns, in_batch):
+                    group = groups.get(r.get("user_id"))
+                    if group is not None:
+                        group[table].append(r)
+            yield [(uid, resp, groups[uid]) for uid, resp in members]
+
+
+def _max_counts(db, filters):
+    """wide CSV 헤더에 필요한 테이블별 사용자당 최대 행 수 (id, user_id 만 읽는 가벼운 1차 패스)"""
+    counts = {table: 0 for _, table in EHR_TABLES}
+    for batch in iter_user_batches(db, filters, columns="id,user_id"):
+        for _, _, groups in batch:
+            for table, rows in groups.items():
+                counts[table] = max(counts[table], len(rows))
+    return counts
+
+
+def _cell(value):
+    return fast_json.dumps(value) if value is not None else ""
+
+
+def iter_wide_csv(db, filters=None):
+    """기존 CSV 레이아웃(user_id, response, immun_N, meds_N, tc_N)을 바이트 청크로 내보낸다.
+
+    wide 레이아웃은 헤더에 사용자당 최대 행 수가 필요하므로 1차 패스로 개수만 세고,
+    2차 패스에서 배치 단위로 행을 만든다. 두 패스 사이에 적재된 행은 헤더 열 수만큼만 싣는다.
+    BOM 은 응답 시작과 함께 바로 보낸다.
+    """
+    yield "﻿".encode("utf-8")
+    counts = _max_counts(db, filters)
+    header = ["user_id", "response"]
+    for prefix, table in EHR_TABLES:
+        header += [f"{prefix}_{i + 1}" for i in range(counts[table])]
+
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(header)
+    for batch in iter_user_batches(db, filters):
+        with metrics.timed("export_serialize_csv"):
+            for uid, response, groups in batch:
+                row = [uid, fast_json.dumps(response)]
+                for _, table in EHR_TABLES:
+                    # 1차 패스 이후 추가된 행은 헤더 열 수를 넘지 않게 잘라낸다
+                    rows = groups[table][:counts[table]]
+                    row += [_cell(r) for r in rows]
+                    row += [""] * (counts[table] - len(rows))
+                writer.writerow(row)
+            chunk = out.getvalue().encode("utf-8")
+            out.seek(0)
+            out.truncate()
+        yield chunk
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
+
+
+def iter_long_csv(db, filters=None):
+    """long CSV 레이아웃(user_id, record_type, data)을 바이트 청크로 내보낸다.
+
+    data 는 PRO 응답이면 응답 JSON, EHR 행이면 행 전체 JSON 이다. 개수를 세는 1차 패스가 없다.
+    """
+    yield "﻿".encode("utf-8")
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["user_id", "record_type", "data"])
+    pro, ehr = RECORD_TYPES["pro_responses"], [(RECORD_TYPES[t], t) for _, t in EHR_TABLES]
+    for batch in iter_user_batches(db, filters):
+        with metrics.timed("export_serialize_csv"):
+            rows = []
+            for uid, response, groups in batch:
+                rows.append((uid, pro, fast_json.dumps(response)))
+                for record_type, table in ehr:
+                    rows += [(uid, record_type, fast_json.dumps(r)) for r in groups[table]]
+            writer.writerows(rows)
+            chunk = out.getvalue().encode("utf-8")
+            out.seek(0)
+            out.truncate()
+        yield chunk
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
@@ -0,0 +1,46 @@
+"""응답, FHIR 원본(data), 내보내기 셀에 쓰는 JSON 직렬화 계층.
+
+orjson 이 설치되어 있으면 orjson 을, 없으면 표준 json 을 쓴다. JSON_SERIALIZER=json 으로
+표준 라이브러리를 강제할 수 있다 (use() 로 실행 중 교체 가능). 어느 쪽이든 출력은 공백 없는
+구분자의 UTF-8 JSON 이고 한글은 이스케이프하지 않는다. 파싱 오류는 두 경우 모두
+json.JSONDecodeError (orjson.JSONDecodeError 는 그 하위 클래스) 로 나타난다.
+
+정규화 해시(ingest_cache, report_cache)는 저장된 해시와 값이 같아야 하므로 여기를 거치지 않는다.
+"""
+import functools
+import json
+import os
+
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "orjson")
+
+
+def _json_dumps_bytes(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def use(name: str) -> str:
+    """직렬화 구현 선택 ("orjson" 또는 "json"). orjson 이 없으면 json. 실제로 선택된 이름을 돌려준다"""
+    global backend, dumps_bytes, dumps, loads
+    if name == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            name = "json"
+        else:
+            dumps_bytes = functools.partial(orjson.dumps, option=orjson.OPT_NON_STR_KEYS)
+            dumps = lambda obj: dumps_bytes(obj).decode("utf-8")  # noqa: E731
+            loads = orjson.loads
+    if name != "orjson":
+        name = "json"
+        dumps_bytes, dumps, loads = _json_dumps_bytes, _json_dumps, json.loads
+    backend = name
+    return name
+
+
+backend = None
+dumps_bytes = dumps = loads = None
+use(JSON_SERIALIZER)
@@ -0,0 +1,208 @@
+"""FHIR 리소스 추출기 레지스트리.
+
+resourceType 마다 Extractor 를 하나 등록하고, 추출기는 리소스를 매핑 테이블 한 행에 해당하는
+작은 레코드(slots dataclass)로 바꾼다. 적재 경로는 레지스트리만 보므로 새 리소스 타입
+(Observation, Condition, Encounter 등)은 레코드와 추출기를 정의해 register 하고 매핑 테이블을
+만들면 엔드포인트를 고치지 않고 적재된다.
+
+extract_batch 는 묶음 단위로 추출한다. MedicationDispense 는 나이 계산에 필요한 생년월일과
+조제일을 묶음 안의 서로 다른 값마다 한 번만 파싱한다 (한 번들의 조제 기록은 대부분 같은 환자).
+"""
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+RRN_SYSTEM = "http://mois.go.kr/rnn"
+_NON_DIGIT = re.compile(r"\D")
+
+
+def first_coding(obj):
+    codings = (obj or {}).get("coding") or [{}]
+    return codings[0] or {}
+
+
+def actor_name(res):
+    """performer[0].actor.resource.name"""
+    perf = res.get("performer")
+    if isinstance(perf, list) and perf:
+        return ((perf[0].get("actor") or {}).get("resource") or {}).get("name")
+    return None
+
+
+def _date_part(value) -> str:
+    return (value or "").split("T")[0]
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rrn(res):
+    """subject.resource 의 주민등록번호 식별자 값"""
+    patient = (res.get("subject") or {}).get("resource") or {}
+    for ident in patient.get("identifier") or []:
+        if ident.get("system") == RRN_SYSTEM:
+            return ident.get("value", "")
+    return None
+
+
+def birth_date(rrn):
+    """주민등록번호 앞 7자리로 생년월일 (성별 코드 1, 2, 5, 6 은 1900년대, 나머지는 2000년대)"""
+    digits = _NON_DIGIT.sub("", rrn or "")
+    if len(digits) < 7:
+        return None
+    year = (1900 if digits[6] in ("1", "2", "5", "6") else 2000) + int(digits[0:2])
+    try:
+        return date(year, int(digits[2:4]), int(digits[4:6]))
+    except ValueError:
+        return None
+
+
+def rrn_gender(rrn):
+    """주민등록번호 성별 코드로 "남성"/"여성" (홀수 남성, 짝수 여성)"""
+    digits = _NON_DIGIT.sub("", rrn or "")
+    if len(digits) < 7:
+        return None
+    return "남성" if digits[6] in ("1", "3", "5", "7") else "여성"
+
+
+def age_on(dob, day):
+    if dob is None or day is None:
+        return None
+    return day.year - dob.year - ((day.month, day.day) < (dob.month, dob.day))
+
+
+class _Record:
+    __slots__ = ()
+
+    def to_row(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass(slots=True)
+class MedicationDispenseRecord(_Record):
+    medication_code: Optional[str]
+    medication_name: Optional[str]
+    pharmacy_name: Optional[str]
+    when_prepared: str
+    days_supply: Optional[float]
+    age: Optional[int]
+
+
+@dataclass(slots=True)
+class TreatmentClaimRecord(_Record):
+    claim_type: Optional[str]
+    created_date: str
+    copay_amount: Optional[float]
+    benefit_amount: Optional[float]
+
+
+@dataclass(slots=True)
+class ImmunizationRecord(_Record):
+    vaccine_name: Optional[str]
+    occurrence_date: str
+    dose_number: Optional[int]
+    performer_name: Optional[str]
+
+
+class Extractor:
+    """resource_type 리소스를 table 의 한 행(record)으로 바꾸는 추출기"""
+
+    resource_type = None
+    table = None
+
+    def extract(self, res: dict):
+        raise NotImplementedError
+
+    def extract_batch(self, resources: list) -> list:
+        return [self.extract(res) for res in resources]
+
+
+class MedicationDispenseExtractor(Extractor):
+    resource_type = "MedicationDispense"
+    table = "medication_dispenses"
+
+    def _fields(self, res):
+        coding = first_coding(((res.get("medicationReference") or {}).get("resource") or {}).get("code"))
+        return [
+            coding.get("code"),
+            coding.get("display"),
+            actor_name(res),
+            _date_part(res.get("whenPrepared")),
+            (res.get("daysSupply") or {}).get("value"),
+        ]
+
+    def extract(self, res):
+        return self.extract_batch([res])[0]
+
+    def extract_batch(self, resources):
+        fields = [self._fields(res) for res in resources]
+        rrns = [_rrn(res) for res in resources]
+        # 서로 다른 주민등록번호/조제일만 한 번씩 파싱
+        dobs = {rrn: birth_date(rrn) for rrn in set(rrns) if rrn}
+        days = {f[3]: _parse_date(f[3]) for f in fields}
+        return [
+            MedicationDispenseRecord(*f, age_on(dobs.get(rrn), days[f[3]]) if rrn else None)
+            for f, rrn in zip(fields, rrns)
+        ]
+
+
+class TreatmentClaimExtractor(Extractor):
+    resource_type = "ExplanationOfBenefit"
+    table = "treatment_claims"
+
+    def extract(self, res):
+        coding = first_coding(res.get("type"))
+        # created_date: billablePeriod.start 우선 사용
+        created = (res.get("billablePeriod") or {}).get("start", res.get("created", ""))
+        copay = benefit = None
+        totals = res.get("total")
+        if isinstance(totals, list):
+            for t in totals:
+                code = first_coding(t.get("category")).get("code")
+                if code == "copay":
+                    copay = (t.get("amount") or {}).get("value")
+                elif code == "benefit":
+                    benefit = (t.get("amount") or {}).get("value")
+        return TreatmentClaimRecord(coding.get("code") or coding.get("display"), _date_part(created), copay, benefit)
+
+
+class ImmunizationExtractor(Extractor):
+    resource_type = "Immunization"
+    table = "immunizations"
+
+    def extract(self, res):
+        dose_number = res.get("doseNumber")
+        if not dose_number:
+            prot = res.get("protocolApplied")
+            if isinstance(prot, list) and prot:
+                dose_number = prot[0].get("doseNumberPositiveInt") or prot[0].get("doseNumber")
+        return ImmunizationRecord(
+            first_coding(res.get("vaccineCode")).get("display"),
+            _date_part(res.get("occurrenceDateTime")),
+            dose_number,
+            actor_name(res),
+        )
+
+
+# resourceType -> Extractor
+EXTRACTORS = {}
+
+
+def register(extractor: Extractor) -> Extractor:
+    EXTRACTORS[extractor.resource_type] = extractor
+    return extractor
+
+
+def get(resource_type):
+    """등록된 추출기 (없으면 None: 원본만 저장하고 매핑하지 않는 타입)"""
+    return EXTRACTORS.get(resource_type)
+
+
+register(MedicationDispenseExtractor())
+register(TreatmentClaimExtractor())
+register(ImmunizationExtractor())
@@ -0,0 +1,244 @@
+"""서버의 fhir/ 디렉터리 상주 인덱스.
+
+파일마다 한 번만 읽고 파싱해서 원본 텍스트, 파싱된 문서, 리소스 타입별 목록, 정규화 해시,
+환자(Patient 리소스의 이름/식별자)를 메모리에 둔다. 파일이 바뀌었는지는 (mtime_ns, size) 로
+판단하며, 바뀐 파일만 다시 파싱한다. 갱신은 백그라운드에서 한다: watchfiles 가 설치되어 있으면
+(uvicorn[standard] 에 포함) 파일 변경 알림을, 없으면 FHIR_INDEX_POLL 초 간격 폴링을 쓴다.
+FHIR_INDEX_POLL=0 이면 백그라운드 갱신 없이 조회할 때마다 stat 만으로 변경을 확인한다.
+
+조회(select)는 메모리의 스냅샷만 읽으므로 디스크 I/O 도 JSON 파싱도 없다. 리소스 타입 필터를
+준 결과(텍스트/해시)도 처음 한 번 만든 뒤 파일 항목에 저장해 둔다.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import threading
+
+import fast_json
+import fhir_summary
+import report_cache
+
+logger = logging.getLogger(__name__)
+
+FHIR_DIR = os.getenv("FHIR_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fhir"))
+# 백그라운드 폴링 간격(초). watchfiles 가 있으면 쓰지 않는다
+FHIR_INDEX_POLL = float(os.getenv("FHIR_INDEX_POLL", "2"))
+# MHID(마이헬스웨이 ID) 식별자 코드
+_PATIENT_ID_CODE = "MHID"
+
+
+def _patient_keys(resources) -> tuple:
+    """(이름, 식별자) - Patient 리소스가 없으면 (None, None)"""
+    for res in resources:
+        if res.get("resourceType") != "Patient":
+            continue
+        name = ((res.get("name") or [{}])[0] or {}).get("text")
+        patient_id = None
+        for ident in res.get("identifier") or []:
+            codes = {c.get("code") for c in ((ident.get("type") or {}).get("coding") or [])}
+            if _PATIENT_ID_CODE in codes:
+                patient_id = ident.get("value")
+        return name, patient_id
+    return None, None
+
+
+class IndexedSource:
+    """파일 하나(또는 그 타입 필터 결과). 호출하면 원본 텍스트를 돌려주므로 (label, 로더) 의 로더로 쓴다.
+
+    doc(파싱된 문서)과 content_hash 가 있어 보고서 경로에서 다시 파싱하지 않는다.
+    """
+
+    __slots__ = ("label", "text", "doc", "content_hash")
+
+    def __init__(self, label, text, doc, content_hash):
+        self.label = label
+        self.text = text
+        self.doc = doc
+        self.content_hash = content_hash
+
+    def __call__(self) -> str:
+        return self.text
+
+
+class IndexedFile(IndexedSource):
+    __slots__ = ("path", "stamp", "resources", "by_type", "patient", "patient_id", "_views", "_lock")
+
+    def __init__(self, path, stamp, text):
+        doc = fast_json.loads(text)
+        super().__init__(os.path.basename(path), text, doc, report_cache.content_hash(text))
+        self.path = path
+        self.stamp = stamp
+        self.resources = list(fhir_summary.iter_resources(doc))
+        self.by_type = {}
+        for res in self.resources:
+            self.by_type.setdefault(res.get("resourceType"), []).append(res)
+        self.patient, self.patient_id = _patient_keys(self.resources)
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def matches(self, patient) -> bool:
+        return patient in (self.patient, self.patient_id, self.label)
+
+    def select(self, types=None) -> IndexedSource:
+        """types(리소스 타입 목록)만 남긴 소스. 타입 조합별로 한 번만 만든다"""
+        if not types:
+            return self
+        key = frozenset(types)
+        view = self._views.get(key)
+        if view is None:
+            with self._lock:
+                view = self._views.get(key)
+                if view is None:
+                    resources = [res for t in sorted(key) for res in self.by_type.get(t, [])]
+                    text = json.dumps(resources, ensure_ascii=False)
+                    view = IndexedSource(self.label, text, resources, report_cache.content_hash(text))
+                    self._views[key] = view
+        return view
+
+    def summary(self) -> dict:
+        return {
+            "file": self.label,
+            "patient": self.patient,
+            "patient_id": self.patient_id,
+            "resources": len(self.resources),
+            "types": {t: len(items) for t, items in self.by_type.items()},
+            "bytes": self.stamp[1],
+        }
+
+
+class FhirIndex:
+    """디렉터리의 파일을 (mtime_ns, size) 로 추적하는 인덱스. 스냅샷은 통째로 바꿔 끼운다"""
+
+    def __init__(self, directory: str = None, pattern: str = "*", poll: float = None):
+        self.directory = directory or FHIR_DIR
+        self.pattern = pattern
+        self.poll = FHIR_INDEX_POLL if poll is None else poll
+        self._files = None  # path -> IndexedFile (None: 아직 읽지 않음)
+        self._errors = {}   # path -> (stamp, 오류 메시지): 파싱할 수 없는 파일
+        self._refresh_lock = threading.Lock()
+        self._task = None
+        self._stop = None
+        self.refreshes = 0
+        self.parsed = 0
+
+    def refresh(self) -> dict:
+        """디렉터리를 stat 해서 추가/변경/삭제된 파일만 반영한다"""
+        with self._refresh_lock:
+            old = self._files or {}
+            files, errors, changes = {}, {}, {"added": 0, "updated": 0, "removed": 0}
+            for path in glob.glob(os.path.join(self.directory, self.pattern)):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                stamp = (st.st_mtime_ns, st.st_size)
+                current = old.get(path)
+                if current is not None and current.stamp == stamp:
+                    files[path] = current
+                    continue
+                if self._errors.get(path, (None,))[0] == stamp:
+                    errors[path] = self._errors[path]
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        files[path] = IndexedFile(path, stamp, f.read())
+                except (OSError, ValueError) as e:  # UnicodeDecodeError, JSONDecodeError 포함
+                    logger.warning("FHIR 파일 %s 을(를) 인덱싱하지 못함: %s", path, e)
+                    errors[path] = (stamp, str(e))
+                    continue
+                self.parsed += 1
+                changes["updated" if current is not None else "added"] += 1
+            changes["removed"] = len(set(old) - set(files))
+            self._files = files
+            self._errors = errors
+            self.refreshes += 1
+            return changes
+
+    def _snapshot(self) -> dict:
+        if self._files is None or (self.poll <= 0 and self._task is None):
+            self.refresh()
+        return self._files
+
+    def select(self, patient=None, types=None) -> list:
+        """(label, 소스) 목록 (파일 이름순). patient 는 환자 이름, MHID 또는 파일 이름"""
+        files = sorted(self._snapshot().values(), key=lambda f: f.label)
+        if patient is not None:
+            files = [f for f in files if f.matches(patient)]
+        return [(f.label, f.select(types)) for f in files]
+
+    def resources(self, patient=None, types=None) -> list:
+        """환자(없으면 전체)의 리소스 목록, types 가 있으면 해당 타입만"""
+        out = []
+        for _, source in self.select(patient, types):
+            out += source.doc if types else source.resources
+        return out
+
+    def patients_of(self, labels) -> set:
+        """labels(파일 이름)의 환자 (이름, MHID) 집합"""
+        files = {f.label: f for f in self._snapshot().values()}
+        return {(files[label].patient, files[label].patient_id) for label in labels if label in files}
+
+    def patients(self) -> list:
+        return [f.summary() for f in sorted(self._snapshot().values(), key=lambda f: f.label)]
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "files": len(self._files or {}),
+            "errors": {os.path.basename(p): msg for p, (_, msg) in self._errors.items()},
+            "refreshes": self.refreshes,
+            "parsed": self.parsed,
+            "watcher": None if self._task is None else ("watchfiles" if _has_watchfiles() else f"poll {self.poll}s"),
+        }
+
+    # --- 백그라운드 갱신 ------------------------------------------------------
+    def start(self, run_io):
+        """이벤트 루프에서 호출. run_io 로 갱신(디스크 I/O)을 I/O 스레드에 넘긴다"""
+        if self._task is None and (self.poll > 0 or _has_watchfiles()):
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._watch(run_io))
+
+    async def stop(self):
+        if self._task is not None:
+            # 취소하면 watchfiles 의 감시 스레드가 남은 채 인터프리터가 종료되어 크래시할 수 있으므로
+            # stop_event 로 끝내고 기다린다 (감시 스레드는 50ms 마다 확인)
+            self._stop.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), 5)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self, run_io):
+        await run_io(self.refresh)
+        if _has_watchfiles() and os.path.isdir(self.directory):
+            import watchfiles
+            try:
+                async for _ in watchfiles.awatch(self.directory, stop_event=self._stop):
+                    await run_io(self.refresh)
+            except Exception:
+                logger.exception("FHIR 디렉터리 감시 실패, 폴링으로 전환")
+        interval = self.poll if self.poll > 0 else 2.0
+        while True:
+            try:
+                await asyncio.wait_for(self._stop.wait(), interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await run_io(self.refresh)
+            except Exception:
+                logger.exception("FHIR 인덱스 갱신 실패")
+
+
+def _has_watchfiles() -> bool:
+    try:
+        import watchfiles  # noqa: F401
+    except ImportError:
+        return False
+    return True
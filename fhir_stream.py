@@ -0,0 +1,220 @@
+"""FHIR 번들 점진(streaming) 파서.
+
+요청 본문을 청크 단위로 받으면서 `publicData[i].resource` 를 하나씩 꺼낸다.
+번들 전체를 dict 로 만들지 않으므로 번들 크기와 무관하게 메모리 사용량이 일정하다.
+
+지원 형식
+- JSON: FHIR 내보내기 문서 `{"publicData": [...], ...}` 또는 /ingest-fhir 요청 본문
+  `{"name_hash": ..., "full_name": ..., "resource": {"publicData": [...]}}`
+- NDJSON: 한 줄에 리소스 하나(`{"resourceType": ...}` 또는 `{"resource": {...}}`).
+  `{"name_hash": ..., "full_name": ...}` 줄은 메타데이터로 취급한다.
+"""
+import codecs
+import json
+import time
+
+import fast_json
+import metrics
+
+_WS = " \t\r\n"
+# 소비한 버퍼 앞부분을 잘라내는 기준 (문자 수)
+_COMPACT_AT = 64 * 1024
+_META_KEYS = ("name_hash", "full_name")
+
+
+class BundleFormatError(ValueError):
+    pass
+
+
+class _Reader:
+    """비동기 바이트 청크 위의 JSON 토큰 리더"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        # JSON 디코딩에 쓴 누적 시간 (스트림이 끝나면 json_decode 단계로 한 번 기록)
+        self.decode_seconds = 0.0
+
+    async def fill(self) -> bool:
+        if self.eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            tail = self._decoder.decode(b"", final=True)
+            self.buf += tail
+            return bool(tail)
+        self.bytes_read += len(chunk)
+        if self.pos > _COMPACT_AT:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += self._decoder.decode(chunk)
+        return True
+
+    async def peek(self) -> str:
+        """공백을 건너뛰고 다음 문자를 돌려준다 (EOF 면 빈 문자열)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not await self.fill():
+                return ""
+
+    async def expect(self, ch: str):
+        if await self.peek() != ch:
+            raise BundleFormatError(f"'{ch}' 가 필요한 위치입니다 (offset {self.pos}).")
+        self.pos += 1
+
+    async def value(self):
+        """완전한 JSON 값 하나를 파싱 (리소스 하나, 키 문자열 등 작은 값에 사용)"""
+        await self.peek()
+        while True:
+            start = time.perf_counter()
+            try:
+                obj, end = self._json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                self.decode_seconds += time.perf_counter() - start
+                if await self.fill():
+                    continue
+                raise BundleFormatError(f"JSON 파싱 오류: {e.msg} (offset {e.pos})")
+            self.decode_seconds += time.perf_counter() - start
+            # 숫자처럼 버퍼 끝에서 끝난 값은 다음 청크에 이어질 수 있다
+            if end == len(self.buf) and not self.eof and await self.fill():
+                continue
+            self.pos = end
+            return obj
+
+    async def items(self):
+        """현재 위치의 배열 원소를 하나씩 파싱해서 내보낸다"""
+        await self.expect("[")
+        if await self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield await self.value()
+            sep = await self.peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise BundleFormatError(f"배열 구분자가 올바르지 않습니다 (offset {self.pos}).")
+
+    async def skip(self):
+        """값을 버린다. 큰 배열/객체도 원소 단위로 건너뛰어 버퍼가 커지지 않게 한다"""
+        ch = await self.peek()
+        if ch == "[":
+            async for _ in self.items():
+                pass
+        elif ch == "{":
+            async for _ in self.members():
+                await self.skip()
+        else:
+            await self.value()
+
+    async def members(self):
+        """현재 위치 객체의 키를 하나씩 내보낸다. 호출자가 값을 소비(value/skip/items)해야 한다"""
+        await self.expect("{")
+        if await self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = await self.value()
+            await self.expect(":")
+            yield key
+            sep = await self.peek()
+            self.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise BundleFormatError(f"객체 구분자가 올바르지 않습니다 (offset {self.pos}).")
+
+
+class BundleStream:
+    """요청 본문 청크에서 리소스를 하나씩 꺼내는 파서.
+
+    meta 에는 본문에서 발견한 name_hash/full_name 이 채워지고,
+    bytes_read 로 지금까지 읽은 바이트 수(진행률)를 알 수 있다.
+    """
+
+    def __init__(self, chunks, ndjson: bool = False):
+        self._reader = _Reader(chunks)
+        self._ndjson = ndjson
+        self.meta = {}
+
+    @property
+    def bytes_read(self) -> int:
+        return self._reader.bytes_read
+
+    def __aiter__(self):
+        return self._timed(self._iter_ndjson() if self._ndjson else self._iter_json())
+
+    async def _timed(self, resources):
+        try:
+            async for res in resources:
+                yield res
+        finally:
+            metrics.observe_stage("json_decode", self._reader.decode_seconds)
+
+    async def _iter_json(self):
+        reader = self._reader
+        if await reader.peek() != "{":
+            raise BundleFormatError("번들은 publicData 를 가진 JSON 객체여야 합니다.")
+        async for res in self._object(depth=0):
+            yield res
+        if await reader.peek():
+            raise BundleFormatError("JSON 객체 뒤에 불필요한 데이터가 있습니다.")
+
+    async def _object(self, depth):
+        reader = self._reader
+        async for key in reader.members():
+            if key == "publicData" and await reader.peek() == "[":
+                async for item in reader.items():
+                    if isinstance(item, dict) and "resource" in item:
+                        yield item["resource"]
+            elif key == "resource" and depth == 0 and await reader.peek() == "{":
+                # /ingest-fhir 요청 본문 형태: resource 안의 publicData 를 스트리밍
+                async for res in self._object(depth + 1):
+                    yield res
+            elif key in _META_KEYS and depth == 0:
+                self.meta[key] = await reader.value()
+            else:
+                await reader.skip()
+
+    async def _iter_ndjson(self):
+        reader = self._reader
+        line_no = 0
+        while True:
+            end = reader.buf.find("\n", reader.pos)
+            if end < 0:
+                if await reader.fill():
+                    continue
+                end = len(reader.buf)
+                if reader.pos >= end:
+                    return
+            line = reader.buf[reader.pos:end].strip()
+            reader.pos = end + 1
+            line_no += 1
+            if not line:
+                continue
+            start = time.perf_counter()
+            try:
+                obj = fast_json.loads(line)
+            except json.JSONDecodeError as e:
+                raise BundleFormatError(f"{line_no}번째 줄 JSON 파싱 오류: {e.msg}")
+            finally:
+                reader.decode_seconds += time.perf_counter() - start
+            if not isinstance(obj, dict):
+                raise BundleFormatError(f"{line_no}번째 줄이 JSON 객체가 아닙니다.")
+            if "resourceType" in obj:
+                yield obj
+            elif isinstance(obj.get("resource"), dict):
+                yield obj["resource"]
+            elif any(k in obj for k in _META_KEYS):
+                self.meta.update({k: obj[k] for k in _META_KEYS if k in obj})
@@ -0,0 +1,222 @@
+"""FHIR 데이터를 로컬에서 사전 집계하여 건강 보고서 프롬프트용 요약(digest)을 만든다.
+
+원본 JSON 전체를 프롬프트에 넣는 대신 보고서 항목(TOP 3 약물, 이용 약국/기관 수,
+계절 분포, 장기/단기 약물, 약물 종류 추이, 예방접종 등)을 결정적으로 계산해
+수 KB 이내의 텍스트로 전달한다.
+"""
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from statistics import mean, pstdev
+
+import fhir_extract
+
+# 총 처방 일수가 이 값 이상이면 장기 복용 약물로 본다 (리포트의 "6개월 이상" 기준)
+LONG_TERM_DAYS = 180
+# 총 처방 일수가 이 값 이하이면 단기 복용 약물로 본다
+SHORT_TERM_DAYS = 14
+
+SEASONS = {12: "겨울", 1: "겨울", 2: "겨울", 3: "봄", 4: "봄", 5: "봄",
+           6: "여름", 7: "여름", 8: "여름", 9: "가을", 10: "가을", 11: "가을"}
+
+
+def iter_resources(doc):
+    """업로드/저장된 FHIR 문서에서 개별 리소스를 꺼낸다.
+
+    publicData/medicalData 래퍼, /ingest-fhir 요청 본문, FHIR Bundle(entry),
+    단일 리소스, 리소스 리스트를 지원한다.
+    """
+    if isinstance(doc, list):
+        for item in doc:
+            yield from iter_resources(item)
+        return
+    if not isinstance(doc, dict):
+        return
+    if "publicData" in doc or "medicalData" in doc:
+        for key in ("publicData", "medicalData"):
+            items = doc.get(key)
+            if isinstance(items, list):
+                for item in items:
+                    if isinstance(item, dict) and "resource" in item:
+                        yield item["resource"]
+        return
+    if "resourceType" not in doc and isinstance(doc.get("resource"), dict):
+        # /ingest-fhir 요청 본문(payload.json) 형태
+        yield from iter_resources(doc["resource"])
+        return
+    if doc.get("resourceType") == "Bundle":
+        for entry in doc.get("entry") or []:
+            if isinstance(entry, dict) and isinstance(entry.get("resource"), dict):
+                yield entry["resource"]
+        return
+    if "resourceType" in doc:
+        yield doc
+
+
+def _to_date(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _birth_and_gender(patient):
+    """주민등록번호로 생년월일과 성별을 추정 (적재 경로의 나이 계산과 같은 규칙)"""
+    for ident in (patient or {}).get("identifier") or []:
+        if ident.get("system") == fhir_extract.RRN_SYSTEM:
+            value = ident.get("value", "")
+            return fhir_extract.birth_date(value), fhir_extract.rrn_gender(value)
+    return None, None
+
+
+def summarize(resources, today=None) -> dict:
+    """리소스 목록에서 보고서 작성에 필요한 통계를 계산"""
+    today = today or datetime.now().date()
+    patient = None
+    dispenses, claims, immunizations = [], [], []
+
+    for res in resources:
+        rtype = res.get("resourceType")
+        if rtype == "Patient" and patient is None:
+            patient = res
+        elif rtype == "MedicationDispense":
+            med = (res.get("medicationReference") or {}).get("resource") or {}
+            coding = fhir_extract.first_coding(med.get("code"))
+            name = coding.get("display") or (med.get("code") or {}).get("text") or coding.get("code")
+            if patient is None:
+                patient = (res.get("subject") or {}).get("resource")
+            dispenses.append({
+                "name": name or "(이름 없음)",
+                "date": _to_date(res.get("whenPrepared") or res.get("whenHandedOver")),
+                "days": (res.get("daysSupply") or {}).get("value") or 0,
+                "pharmacy": fhir_extract.actor_name(res),
+            })
+        elif rtype == "ExplanationOfBenefit":
+            copay = benefit = None
+            for t in res.get("total") or []:
+                code_key = fhir_extract.first_coding(t.get("category")).get("code")
+                val = (t.get("amount") or {}).get("value")
+                if code_key == "copay":
+                    copay = val
+                elif code_key == "benefit":
+                    benefit = val
+            claims.append({
+                "date": _to_date((res.get("billablePeriod") or {}).get("start") or res.get("created")),
+                "provider": ((res.get("provider") or {}).get("resource") or {}).get("name"),
+                "copay": copay or 0,
+                "benefit": benefit or 0,
+            })
+        elif rtype == "Immunization":
+            dose = res.get("doseNumber")
+            prot = res.get("protocolApplied")
+            if not dose and isinstance(prot, list) and prot:
+                dose = prot[0].get("doseNumberPositiveInt") or prot[0].get("doseNumber")
+            immunizations.append({
+                "name": fhir_extract.first_coding(res.get("vaccineCode")).get("display"),
+                "date": _to_date(res.get("occurrenceDateTime")),
+                "dose": dose,
+                "performer": fhir_extract.actor_name(res),
+            })
+
+    dob, gender = _birth_and_gender(patient)
+
+    # 약물별 처방 횟수/총 처방 일수/기간
+    meds = defaultdict(lambda: {"count": 0, "days": 0, "first": None, "last": None})
+    for d in dispenses:
+        m = meds[d["name"]]
+        m["count"] += 1
+        m["days"] += d["days"]
+        if d["date"]:
+            m["first"] = min(filter(None, (m["first"], d["date"])))
+            m["last"] = max(filter(None, (m["last"], d["date"])))
+    ranked = sorted(meds.items(), key=lambda kv: (-kv[1]["count"], -kv[1]["days"], kv[0]))
+
+    long_term = [n for n, m in ranked if m["days"] >= LONG_TERM_DAYS]
+    short_term = [n for n, m in ranked if m["days"] <= SHORT_TERM_DAYS]
+
+    # 계절 분포 / 분기별 약물 종류 수 추이 / 처방일 간격
+    seasons = Counter(SEASONS[d["date"].month] for d in dispenses if d["date"])
+    quarterly = defaultdict(set)
+    for d in dispenses:
+        if d["date"]:
+            quarterly[f"{d['date'].year}-Q{(d['date'].month - 1) // 3 + 1}"].add(d["name"])
+    visit_days = sorted({d["date"] for d in dispenses if d["date"]})
+    gaps = [(b - a).days for a, b in zip(visit_days, visit_days[1:])]
+
+    all_dates = [x["date"] for x in dispenses + claims + immunizations if x["date"]]
+    return {
+        "name": ((patient or {}).get("name") or [{}])[0].get("text"),
+        "gender": gender,
+        "age": fhir_extract.age_on(dob, today),
+        "period": (min(all_dates), max(all_dates)) if all_dates else None,
+        "dispense_count": len(dispenses),
+        "medications": ranked,
+        "long_term": long_term,
+        "short_term": short_term,
+        "pharmacies": Counter(d["pharmacy"] for d in dispenses if d["pharmacy"]),
+        "providers": Counter(c["provider"] for c in claims if c["provider"]),
+        "seasons": seasons,
+        "quarterly_drug_counts": {q: len(names) for q, names in sorted(quarterly.items())},
+        "visit_gap": (mean(gaps), pstdev(gaps)) if gaps else None,
+        "claim_count": len(claims),
+        "copay_total": sum(c["copay"] for c in claims),
+        "benefit_total": sum(c["benefit"] for c in claims),
+        "immunizations": sorted(immunizations, key=lambda x: (x["date"] or date.min, x["name"] or "")),
+    }
+
+
+def _fmt_counter(counter, limit=5):
+    items = counter.most_common(limit)
+    text = ", ".join(f"{k}({v}회)" for k, v in items)
+    if len(counter) > limit:
+        text += f" 외 {len(counter) - limit}곳"
+    return text or "없음"
+
+
+def render(label: str, stats: dict) -> str:
+    """통계를 프롬프트에 넣을 간결한 텍스트로 변환"""
+    lines = [f"=== {label} ==="]
+    profile = [x for x in (stats["gender"], f"만 {stats['age']}세" if stats["age"] is not None else None) if x]
+    lines.append(f"기본 정보: {', '.join(profile) or '알 수 없음'}")
+    if stats["period"]:
+        lines.append(f"데이터 기간: {stats['period'][0]} ~ {stats['period'][1]}")
+
+    lines.append(f"[투약] 총 {stats['dispense_count']}건, 약물 {len(stats['medications'])}종")
+    for i, (name, m) in enumerate(stats["medications"][:3], 1):
+        lines.append(f"TOP{i}: {name} - 총 {m['count']}회 처방, {m['days']}일간 복용")
+    lines.append("약물 목록(이름: 처방 횟수/총 일수/최초~최근 처방일):")
+    for name, m in stats["medications"]:
+        lines.append(f"- {name}: {m['count']}회/{m['days']}일/{m['first']}~{m['last']}")
+    lines.append(f"장기 복용 약물(총 {LONG_TERM_DAYS}일 이상): {', '.join(stats['long_term']) or '없음'}")
+    lines.append(f"단기 복용 약물(총 {SHORT_TERM_DAYS}일 이하): {len(stats['short_term'])}종")
+
+    lines.append(f"[약국] {len(stats['pharmacies'])}곳: {_fmt_counter(stats['pharmacies'])}")
+    lines.append(f"[병의원] {len(stats['providers'])}곳: {_fmt_counter(stats['providers'])}")
+    seasons = stats["seasons"]
+    lines.append("[계절별 처방] " + ", ".join(f"{s} {seasons.get(s, 0)}건" for s in ("봄", "여름", "가을", "겨울")))
+    if stats["quarterly_drug_counts"]:
+        lines.append("[분기별 약물 종류 수] " + ", ".join(f"{q}: {n}종" for q, n in stats["quarterly_drug_counts"].items()))
+    if stats["visit_gap"]:
+        avg, sd = stats["visit_gap"]
+        lines.append(f"[처방 간격] 평균 {avg:.1f}일, 표준편차 {sd:.1f}일")
+
+    lines.append(
+        f"[진료 청구] {stats['claim_count']}건, 본인부담금 합계 {stats['copay_total']:,}원, "
+        f"공단부담금 합계 {stats['benefit_total']:,}원"
+    )
+    lines.append(f"[예방접종] {len(stats['immunizations'])}건")
+    for im in stats["immunizations"]:
+        dose = f" {im['dose']}차" if im["dose"] else ""
+        lines.append(f"- {im['date']} {im['name']}{dose}")
+    return "\n".join(lines)
+
+
+def build_digest(docs, today=None) -> str:
+    """(이름, 파싱된 FHIR 문서) 목록을 문서(환자)별 요약 텍스트로 만든다"""
+    sections = []
+    for label, doc in docs:
+        stats = summarize(iter_resources(doc), today=today)
+        title = f"{stats['name']} ({label})" if stats["name"] else label
+        sections.append(render(title, stats))
+    return "\n\n".join(sections)
@@ -0,0 +1,145 @@
+"""FHIR 적재 경로의 프로세스 내 캐시.
+
+- name_hash -> users.id LRU
+- 사용자별로 이미 적재한 fhir_id -> (fhir_resources.id, 리소스 내용 해시, 리소스 타입)
+
+앱이 동기화할 때마다 같은 번들을 다시 올리므로, 내용 해시가 같은 리소스는 네트워크
+호출 없이 건너뛰고 해시가 바뀐 리소스만 갱신한다. 캐시는 적재가 끝난 뒤에만 채워지며,
+DB 를 직접 지우는 경로(/debug/clear-data 등)는 반드시 clear 를 호출해야 한다.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def resource_hash(res: dict) -> str:
+    """키 순서와 공백에 무관한 리소스 내용 해시"""
+    canonical = json.dumps(res, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IngestCache:
+    """사용자 ID LRU + 사용자별 적재 리소스 인덱스 (스레드 안전).
+
+    max_users 가 0 이면 비활성화된다. ttl 은 다른 인스턴스가 DB 를 바꿀 수 있으므로
+    항목을 무기한 신뢰하지 않기 위한 유효 시간(초)이다.
+    """
+
+    def __init__(self, max_users: int = 1024, max_resources: int = 200000, ttl: float = 3600):
+        self.max_users = max_users
+        self.max_resources = max_resources
+        self.ttl = ttl
+        self._users = OrderedDict()      # name_hash -> (만료 시각, user_id)
+        self._resources = OrderedDict()  # user_id -> (만료 시각, {fhir_id: (resource_id, hash, type)})
+        self._resource_count = 0
+        self._lock = threading.Lock()
+        self.user_hits = 0
+        self.user_misses = 0
+        self.resource_hits = 0
+        self.resource_misses = 0
+        self.resource_updates = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_users > 0
+
+    # --- 사용자 ID ------------------------------------------------------
+    def get_user(self, name_hash):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._users.get(name_hash)
+            if entry is not None and entry[0] > time.time():
+                self._users.move_to_end(name_hash)
+                self.user_hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._users[name_hash]
+            self.user_misses += 1
+            return None
+
+    def set_user(self, name_hash, user_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._users[name_hash] = (time.time() + self.ttl, user_id)
+            self._users.move_to_end(name_hash)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    # --- 적재된 리소스 --------------------------------------------------
+    def _user_resources(self, user_id):
+        entry = self._resources.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            self._drop(user_id)
+            return None
+        self._resources.move_to_end(user_id)
+        return entry[1]
+
+    def _drop(self, user_id):
+        _, known = self._resources.pop(user_id)
+        self._resource_count -= len(known)
+
+    def lookup(self, user_id, fhir_ids) -> dict:
+        """fhir_id 목록 중 캐시에 있는 항목 {fhir_id: (resource_id, hash, type)}"""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            known = self._user_resources(user_id) or {}
+            found = {fid: known[fid] for fid in fhir_ids if fid in known}
+            self.resource_hits += len(found)
+            self.resource_misses += len(fhir_ids) - len(found)
+            return found
+
+    def record(self, user_id, entries: dict, updated: int = 0):
+        """적재가 끝난 리소스 {fhir_id: (resource_id, hash, type)} 를 기록"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.resource_updates += updated
+            if not entries:
+                return
+            known = self._user_resources(user_id)
+            if known is None:
+                known = {}
+                self._resources[user_id] = (time.time() + self.ttl, known)
+            before = len(known)
+            known.update(entries)
+            self._resource_count += len(known) - before
+            while self._resources and (len(self._resources) > self.max_users
+                                       or self._resource_count > self.max_resources):
+                oldest = next(iter(self._resources))
+                if oldest == user_id and len(self._resources) == 1:
+                    break
+                self._drop(oldest)
+
+    def clear(self, users: bool = True):
+        """캐시 무효화. users=False 면 적재 리소스 인덱스만 비운다"""
+        with self._lock:
+            if users:
+                self._users.clear()
+            self._resources.clear()
+            self._resource_count = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            user_lookups = self.user_hits + self.user_misses
+            resource_lookups = self.resource_hits + self.resource_misses
+            return {
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "resources": self._resource_count,
+                "max_resources": self.max_resources,
+                "ttl": self.ttl,
+                "user_hits": self.user_hits,
+                "user_misses": self.user_misses,
+                "user_hit_rate": self.user_hits / user_lookups if user_lookups else 0.0,
+                "resource_hits": self.resource_hits,
+                "resource_misses": self.resource_misses,
+                "resource_updates": self.resource_updates,
+                "resource_hit_rate": self.resource_hits / resource_lookups if resource_lookups else 0.0,
+            }
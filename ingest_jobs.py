@@ -0,0 +1,234 @@
+"""비동기 FHIR 적재 작업 큐.
+
+/ingest-fhir?async=true 는 번들을 큐에 넣고 작업 ID 를 바로 돌려준다. 백그라운드 워커가
+큐에서 여러 작업을 모아(최대 INGEST_JOB_BATCH_RESOURCES 리소스, INGEST_JOB_LINGER 초 대기)
+한 번의 일괄 쓰기로 처리한다. 큐 깊이가 차면 submit 이 QueueFullError 를 던져
+클라이언트에게 재시도를 요청한다(backpressure).
+
+같은 사용자의 작업이 동시에 적재되면 존재 확인과 insert 사이에 경합이 생기므로, 큐는
+name_hash 로 샤드를 나누고 워커는 샤드 하나씩만 맡는다 (사용자별 처리 순서도 보장된다).
+
+큐와 작업 상태 저장소는 JobQueue / JobStore 인터페이스 뒤에 있으므로 외부 브로커 구현으로
+바꿀 수 있다. 기본 구현(MemoryJobQueue, MemoryJobStore)은 프로세스 내에서만 동작한다.
+"""
+import asyncio
+import logging
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """큐 깊이 제한에 걸려 작업을 받을 수 없는 경우"""
+
+
+class IngestJob:
+    def __init__(self, name_hash, full_name, resources, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.name_hash = name_hash
+        self.full_name = full_name
+        self.resources = resources
+        self.resource_count = len(resources)
+        self.status = "queued"
+        self.user_id = None
+        self.mapped = Counter()
+        self.error = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "user_id": self.user_id,
+            "resources": self.resource_count,
+            "mapped": dict(self.mapped),
+            "error": self.error,
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobStore:
+    """작업 상태 저장소 인터페이스"""
+
+    def save(self, job: IngestJob):
+        raise NotImplementedError
+
+    def get(self, job_id: str):
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """최근 max_jobs 개 작업만 보관하는 인메모리 저장소"""
+
+    def __init__(self, max_jobs: int = 10000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+
+    def save(self, job):
+        self._jobs[job.id] = job
+        self._jobs.move_to_end(job.id)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+
+class JobQueue:
+    """작업 큐 인터페이스. 같은 name_hash 의 작업은 항상 같은 샤드로 들어가야 한다"""
+
+    shards = 1
+
+    def put(self, job: IngestJob):
+        """작업을 넣는다. 가득 차 있으면 QueueFullError"""
+        raise NotImplementedError
+
+    async def get_batch(self, shard: int, max_resources: int, linger: float) -> list:
+        """shard 에서 최소 한 개의 작업을 기다린 뒤, linger 초 동안 max_resources 리소스까지 더 모아서 돌려준다"""
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryJobQueue(JobQueue):
+    def __init__(self, max_depth: int = 1000, shards: int = 4):
+        self.max_depth = max_depth
+        self.shards = shards
+        self._queues = [asyncio.Queue() for _ in range(shards)]
+        self._depth = 0
+
+    def put(self, job):
+        if self._depth >= self.max_depth:
+            raise QueueFullError("적재 대기열이 가득 찼습니다.")
+        shard = zlib.crc32(str(job.name_hash).encode("utf-8")) % self.shards
+        self._queues[shard].put_nowait(job)
+        self._depth += 1
+
+    async def get_batch(self, shard, max_resources, linger):
+        queue = self._queues[shard]
+        jobs = [await queue.get()]
+        total = jobs[0].resource_count
+        deadline = time.monotonic() + linger
+        while total < max_resources:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            jobs.append(job)
+            total += job.resource_count
+        self._depth -= len(jobs)
+        return jobs
+
+    def depth(self):
+        return self._depth
+
+
+class IngestWorkers:
+    """큐에서 작업 묶음을 꺼내 writer 로 적재하는 백그라운드 워커 풀 (샤드마다 워커 하나).
+
+    writer(jobs) 는 작업 목록을 받아 작업별 results 목록을 돌려주는 코루틴이다.
+    묶음 적재가 실패하면 작업을 하나씩 다시 시도해 실패한 작업만 failed 로 남긴다.
+    """
+
+    def __init__(self, writer, queue: JobQueue = None, store: JobStore = None,
+                 batch_resources: int = 1000, linger: float = 0.05):
+        self.writer = writer
+        self.queue = queue or MemoryJobQueue()
+        self.store = store or MemoryJobStore()
+        self.batch_resources = batch_resources
+        self.linger = linger
+        self._tasks = []
+        self.batches = 0
+        self.jobs_done = 0
+        self.jobs_failed = 0
+
+    def submit(self, name_hash, full_name, resources) -> IngestJob:
+        job = IngestJob(name_hash, full_name, resources)
+        self.queue.put(job)
+        self.store.save(job)
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(shard)) for shard in range(self.queue.shards)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, shard):
+        while True:
+            jobs = await self.queue.get_batch(shard, self.batch_resources, self.linger)
+            await self._process(jobs)
+
+    async def _process(self, jobs):
+        now = time.time()
+        for job in jobs:
+            job.status = "running"
+            job.started_at = now
+            self.store.save(job)
+        try:
+            self._finish(jobs, await self.writer(jobs))
+            self.batches += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if len(jobs) == 1:
+                self._fail(jobs[0], e)
+                return
+            logger.exception("적재 묶음(%d개 작업) 실패, 작업별로 재시도", len(jobs))
+            for job in jobs:
+                try:
+                    self._finish([job], await self.writer([job]))
+                    self.batches += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._fail(job, e)
+
+    def _finish(self, jobs, results):
+        now = time.time()
+        for job, job_results in zip(jobs, results):
+            job.mapped.update(r["resource_type"] for r in job_results)
+            job.status = "done"
+            job.finished_at = now
+            job.resources = None
+            self.jobs_done += 1
+            self.store.save(job)
+
+    def _fail(self, job, error):
+        logger.exception("적재 작업 %s 실패", job.id)
+        job.status = "failed"
+        job.error = str(error)
+        job.finished_at = time.time()
+        job.resources = None
+        self.jobs_failed += 1
+        self.store.save(job)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.depth(),
+            "workers": len(self._tasks),
+            "batches": self.batches,
+            "jobs_done": self.jobs_done,
+            "jobs_failed": self.jobs_failed,
+        }
@@ -1,23 +1,84 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query
-import io
-from PyPDF2 import PdfReader
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
 import os
-import glob
-from openai import OpenAI
 import json
 from pydantic import BaseModel
 from typing import Optional, List
 from dotenv import load_dotenv
-from supabase import create_client, Client
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
-import pandas as pd
-from io import BytesIO
-from fastapi.responses import StreamingResponse
-import re
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+import hashlib
+import logging
+import time
+import functools
+import itertools
+import asyncio
+import uuid
+from collections import OrderedDict, Counter
+from contextlib import asynccontextmanager
 
 load_dotenv()
-app = FastAPI()
+
+from clients import STORAGE_BACKEND, supabase, client, run_io, iter_io, close_clients, warm_up
+import fhir_summary
+import pdf_extract
+import pdf_cache
+import uploads
+import fhir_stream
+import export_stream
+import export_delta
+import report_cache
+import ingest_cache
+import ingest_jobs
+import cohort_stats
+import schema
+import metrics
+import fhir_extract
+import report_mapreduce
+import report_batch
+import fhir_index
+import fast_json
+
+# 기본은 WARNING: 적재 경로의 매핑 디버그 로그는 LOG_LEVEL=DEBUG 일 때만 출력된다
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger("piethon")
+
+# 1 이면 시작 직후 백그라운드에서 OpenAI/저장소 클라이언트를 미리 만든다 (0: 처음 사용할 때)
+CLIENT_WARMUP = os.getenv("CLIENT_WARMUP", "1") == "1"
+# 1 이면 시작할 때 Supabase 에 마이그레이션(supabase/migrations)이 적용됐는지 확인한다 (schema 참고)
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "1") == "1"
+
+def _warm_up_clients():
+    try:
+        warm_up()
+    except Exception:
+        logger.exception("클라이언트 미리 만들기 실패 (처음 사용할 때 다시 시도)")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    export_delta.check_lag()
+    if STORAGE_BACKEND == "supabase" and SCHEMA_CHECK:
+        await run_io(schema.check, supabase)
+    if CLIENT_WARMUP:
+        # 준비 완료(첫 요청 수락)를 늦추지 않도록 기다리지 않는다
+        asyncio.ensure_future(run_io(_warm_up_clients))
+    ingest_workers.start()
+    report_batches.start()
+    fhir_dir_index.start(run_io)
+    yield
+    await fhir_dir_index.stop()
+    await report_batches.stop()
+    await ingest_workers.stop()
+    pdf_extract.shutdown()
+    close_clients()
+
+class FastJSONResponse(JSONResponse):
+    """fast_json(orjson) 으로 본문을 만드는 JSONResponse (앱의 기본 응답 클래스)"""
+
+    def render(self, content) -> bytes:
+        return fast_json.dumps_bytes(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # CORS 설정
 origins = [
@@ -33,74 +94,167 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-supabase: Client = create_client(supabase_url, supabase_key)
+# 경로별 요청 본문 크기 제한 (초과 시 413)
+app.add_middleware(uploads.UploadLimitMiddleware)
+# 요청 지연 기록 (+ METRICS_TIMING_HEADER=1 이면 Server-Timing 헤더). 가장 바깥에 둔다
+app.add_middleware(metrics.MetricsMiddleware)
 
 @app.get("/ping")
 async def ping():
     return {"message": "pong"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 수집용 지표 (단계별 시간, 저장소 왕복, LLM 지연/토큰, 요청 지연)"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# /extract 결과 캐시와 /extract/batch 의 동시 처리 파일 수, 요청당 최대 파일 수
+pdf_text_cache = pdf_cache.PdfTextCache()
+PDF_BATCH_CONCURRENCY = int(os.getenv("PDF_BATCH_CONCURRENCY", "4"))
+PDF_BATCH_MAX_FILES = int(os.getenv("PDF_BATCH_MAX_FILES", "100"))
+
+def _pdf_cache_key(spooled, password: str) -> str:
+    with spooled.buffer() as buf:
+        return pdf_cache.cache_key(buf, password)
+
+async def _extract_pages(spooled, password: str) -> tuple:
+    """(페이지 텍스트 목록, 캐시 적중 여부). spooled 는 이 함수가 넘겨받아 닫는다.
+
+    캐시를 쓰면 추출 태스크가 업로드를 넘겨받아 추출이 끝난 뒤 닫는다. 요청이 취소되어도 같은
+    파일을 기다리는 다른 요청의 추출이 임시 파일을 잃지 않는다.
+    """
+    if not pdf_text_cache.enabled:
+        try:
+            return await pdf_extract.extract_pages(spooled.source, password), False
+        finally:
+            spooled.close()
+    try:
+        key = await run_io(_pdf_cache_key, spooled, password)
+    except BaseException:
+        spooled.close()
+        raise
+    return await pdf_text_cache.get_or_create(
+        key, lambda: pdf_extract.extract_pages(spooled.source, password), release=spooled.close,
+    )
+
+async def _iter_cached_pages(pages):
+    for text in pages:
+        yield text
+
+async def _iter_caching_pages(key: str, pages):
+    """페이지를 그대로 넘기면서 모아 두었다가 마지막 페이지까지 추출되면 캐시에 저장"""
+    collected = []
+    try:
+        async for text in pages:
+            collected.append(text)
+            yield text
+        pdf_text_cache.set(key, collected)
+    finally:
+        await pages.aclose()
+
+async def _stream_pages(first: Optional[str], pages, spooled):
+    """페이지별 추출 결과를 NDJSON 한 줄씩 전송"""
+    try:
+        if first is None:
+            return
+        yield fast_json.dumps({"page": 1, "content": first}) + "\n"
+        index = 1
+        async for text in pages:
+            index += 1
+            yield fast_json.dumps({"page": index, "content": text}) + "\n"
+    finally:
+        await pages.aclose()
+        spooled.close()
+
 @app.post("/extract")
-async def extract_pdf(file: UploadFile = File(...), password: str = Form(...)):
+async def extract_pdf(
+    file: UploadFile = File(...),
+    password: str = Form(...),
+    stream: bool = Query(False, description="페이지별 결과를 NDJSON 으로 순서대로 바로 전송"),
+):
+    # 큰 업로드는 임시 파일로 옮겨 mmap 으로 파싱한다 (본문 전체를 메모리에 올리지 않음)
+    spooled = await uploads.spool(file)
+    # 업로드를 스트리밍 응답이나 _extract_pages 에 넘긴 뒤에는 여기서 닫지 않는다
+    handed_off = False
     try:
-        content = await file.read()
-        reader = PdfReader(io.BytesIO(content))
-        if reader.is_encrypted:
-            result = reader.decrypt(password)
-            if result == 0:
-                raise HTTPException(status_code=400, detail="비밀번호가 올바르지 않습니다.")
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return {"content": text}
+        if stream:
+            key = await run_io(_pdf_cache_key, spooled, password) if pdf_text_cache.enabled else None
+            cached = pdf_text_cache.get(key) if key else None
+            if cached is not None:
+                pages = _iter_cached_pages(cached)
+            else:
+                pages = pdf_extract.iter_pages(spooled.source, password)
+                if key:
+                    pages = _iter_caching_pages(key, pages)
+            # 비밀번호 오류는 응답을 시작하기 전에 400 으로 돌려주기 위해 첫 페이지를 미리 받는다
+            first = await anext(pages, None)
+            handed_off = True
+            return StreamingResponse(_stream_pages(first, pages, spooled), media_type="application/x-ndjson")
+        handed_off = True
+        pages, _ = await _extract_pages(spooled, password)
+        return {"content": "".join(pages)}
+    except pdf_extract.PDFPasswordError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF 처리 중 오류 발생: {str(e)}")
+    finally:
+        if not handed_off:
+            spooled.close()
+
+@app.post("/extract/batch")
+async def extract_pdf_batch(
+    files: List[UploadFile] = File(...),
+    passwords: List[str] = Form(..., description="모든 파일에 같은 비밀번호 하나, 또는 파일 순서대로 하나씩"),
+):
+    """여러 PDF 를 한 요청으로 받아 PDF_BATCH_CONCURRENCY 개씩 동시에 추출한다.
+
+    결과는 업로드 순서대로 파일별 content 또는 error 를 담고, 한 파일의 실패는 다른 파일에
+    영향을 주지 않는다. 같은 파일·비밀번호는 /extract 와 같은 결과 캐시를 쓴다.
+    """
+    if len(files) > PDF_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"한 번에 최대 {PDF_BATCH_MAX_FILES}개 파일까지 처리할 수 있습니다.")
+    if len(passwords) not in (1, len(files)):
+        raise HTTPException(status_code=400, detail="비밀번호는 하나 또는 파일 수만큼 보내야 합니다.")
+    if len(passwords) == 1:
+        passwords = passwords * len(files)
+    semaphore = asyncio.Semaphore(PDF_BATCH_CONCURRENCY)
+
+    async def extract_one(upload, password):
+        result = {"filename": upload.filename}
+        async with semaphore:
+            spooled = await uploads.spool(upload)
+            try:
+                # 업로드는 _extract_pages 가 닫는다
+                pages, cached = await _extract_pages(spooled, password)
+                result.update(status="done", cached=cached, pages=len(pages), content="".join(pages))
+            except pdf_extract.PDFPasswordError as e:
+                result.update(status="failed", error=str(e))
+            except Exception as e:
+                logger.warning("PDF %s 추출 실패: %s", upload.filename, e)
+                result.update(status="failed", error=f"PDF 처리 중 오류 발생: {str(e)}")
+        return result
+
+    results = await asyncio.gather(*(extract_one(f, p) for f, p in zip(files, passwords)))
+    return {"counts": dict(Counter(r["status"] for r in results)), "results": results}
+
+REPORT_MODEL = "o4-mini"
+
+REPORT_PROMPT_RAW = """
+당신은 FHIR 의료 데이터 분석 전문가입니다. 
+다음 개인 의료 데이터를 분석하여 흥미로운 건강 관리 프로필을 작성해주세요.
 
-@app.post("/health-report")
-async def health_report(files: List[UploadFile] = File(default=None)):
-    """FHIR JSON 파일을 직접 업로드하거나(여러 개 가능) 
-    업로드가 없으면 서버의 fhir/ 디렉터리를 읽어 GPT 건강 보고서를 생성한다."""
-
-    try:
-        combined = ""
-
-        # 1) 요청으로부터 업로드된 파일이 있는 경우 우선 사용
-        if files:
-            for uf in files:
-                content_bytes = await uf.read()
-                try:
-                    combined += content_bytes.decode("utf-8") + "\n"
-                except UnicodeDecodeError:
-                    raise HTTPException(status_code=400, detail=f"파일 {uf.filename} 은(는) UTF-8 인코딩된 JSON이 아닙니다.")
-
-        # 2) 업로드가 없으면 기존 fhir 디렉터리의 파일 사용
-        if not combined:
-            fhir_dir = os.path.join(os.path.dirname(__file__), "fhir")
-            local_files = glob.glob(os.path.join(fhir_dir, "*"))
-            if not local_files:
-                raise HTTPException(status_code=404, detail="FHIR 데이터 파일을 찾을 수 없습니다.")
-            for file_path in local_files:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    combined += f.read() + "\n"
+=== 전체 FHIR 데이터 ===\n"""
 
-        # GPT 프롬프트 구성 및 호출
-        prompt = (
-            """
+REPORT_PROMPT_DIGEST = """
 당신은 FHIR 의료 데이터 분석 전문가입니다. 
-다음 개인 의료 데이터를 분석하여 흥미로운 건강 관리 프로필을 작성해주세요.
+다음은 개인 의료 데이터(FHIR)를 항목별로 미리 집계한 요약입니다.
+요약에 제시된 수치(처방 횟수, 복용 일수, 기관 수 등)를 그대로 사용하여 흥미로운 건강 관리 프로필을 작성해주세요.
 
-=== 전체 FHIR 데이터 ===\n""" + combined
-        )
+=== FHIR 데이터 요약 ===\n"""
 
-        response = client.chat.completions.create(
-            model="o4-mini",
-            messages=[
-                {"role": "system", "content": f"""
+HEALTH_REPORT_SYSTEM_PROMPT = """
 === 분석 요구사항 ===
 
 반드시 Plain Text 형식으로만 작성하고, 다음 구조로 리포트를 작성해주세요.
@@ -110,7 +264,7 @@ async def health_report(files: List[UploadFile] = File(default=None)):
 나의 건강 관리 프로필
 ========================================
 
-분석 기준일: {datetime.now().strftime('%Y년 %m월 %d일')}
+분석 기준일: {analysis_date}
 
 ----------------------------------------
 📊 가장 자주 복용한 약물 TOP 3
@@ -267,12 +421,229 @@ H) "예방 중심형"
 - 복용 중인 약물별로 실제 상호작용이 확인된 음식만 안내해주세요  
 - 상호작용이 없는 약물의 경우 "특별한 식이 제한 없음"으로 명시해주세요
 - 예방접종은 복용 약물로 추정되는 기저질환과 연령을 고려해 개인 맞춤형으로 권장해주세요
-"""},
-                {"role": "user", "content": prompt},
-            ],
-        )
+"""
+
+# 프롬프트/모델이 바뀌면 버전이 달라져 기존 캐시 항목이 자동으로 무효화된다
+REPORT_PROMPT_VERSION = hashlib.sha256(
+    "\0".join([REPORT_MODEL, REPORT_PROMPT_RAW, REPORT_PROMPT_DIGEST, HEALTH_REPORT_SYSTEM_PROMPT]).encode("utf-8")
+).hexdigest()[:16]
+
+health_report_cache = report_cache.ReportCache(
+    max_entries=int(os.getenv("REPORT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("REPORT_CACHE_TTL", "86400")),
+    disk_dir=os.getenv("REPORT_CACHE_DIR") or None,
+    max_disk_bytes=int(os.getenv("REPORT_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024))),
+)
+
+# 서버의 fhir/ 디렉터리 인덱스 (파일별로 한 번만 파싱, 변경된 파일만 다시 읽음)
+fhir_dir_index = fhir_index.FhirIndex()
 
-        report = response.choices[0].message.content
+def _read_text_file(path) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def _load_source(label, load) -> str:
+    try:
+        return load()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail=f"파일 {label} 은(는) UTF-8 인코딩된 JSON이 아닙니다.")
+
+def _build_report_prompt(sources, digest: bool) -> str:
+    """digest 모드는 로컬에서 사전 집계한 요약을, raw 모드는 원본 FHIR JSON 전체를 프롬프트로 사용"""
+    if not digest:
+        combined = "".join(_load_source(label, load) + "\n" for label, load in sources)
+        return REPORT_PROMPT_RAW + combined
+
+    sections = []
+    for label, load in sources:
+        # fhir_index 의 소스는 이미 파싱된 문서를 들고 있다
+        doc = getattr(load, "doc", None)
+        if doc is None:
+            text = _load_source(label, load)
+            try:
+                with metrics.timed("json_decode"):
+                    doc = fast_json.loads(text)
+            except json.JSONDecodeError:
+                raise HTTPException(status_code=400, detail=f"파일 {label} 은(는) 올바른 JSON 형식이 아닙니다.")
+        # 파일 하나씩 파싱·요약하고 원본은 바로 버린다
+        sections.append(fhir_summary.build_digest([(label, doc)]))
+    return REPORT_PROMPT_DIGEST + "\n\n".join(sections)
+
+def _report_cache_key(sources, digest: bool, analysis_date: str, chunked: bool = False) -> str:
+    return report_cache.make_key(
+        [getattr(load, "content_hash", None) or report_cache.content_hash(_load_source(label, load))
+         for label, load in sources],
+        # map-reduce 모드는 map/combine/reduce 프롬프트와 청크 예산의 버전도 키에 넣는다
+        mode=f"mapreduce:{report_mapreduce.PROMPT_VERSION}" if chunked else "digest" if digest else "raw",
+        prompt_version=REPORT_PROMPT_VERSION,
+        analysis_date=analysis_date,
+    )
+
+def _report_messages(prompt: str, analysis_date: str) -> list:
+    return [
+        {"role": "system", "content": HEALTH_REPORT_SYSTEM_PROMPT.format(analysis_date=analysis_date)},
+        {"role": "user", "content": prompt},
+    ]
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {fast_json.dumps(data)}\n\n"
+
+def _iter_report_deltas(prompt: str, analysis_date: str, opened: Optional[list] = None):
+    """OpenAI 스트림의 텍스트 조각을 내보낸다. 연 스트림은 opened 에 넣어 다른 스레드에서 닫을 수 있게 한다"""
+    start = time.perf_counter()
+    usage = None
+    stream = client.chat.completions.create(
+        model=REPORT_MODEL,
+        messages=_report_messages(prompt, analysis_date),
+        stream=True,
+        # 마지막 청크(choices 없음)에 토큰 사용량을 받는다
+        stream_options={"include_usage": True},
+    )
+    if opened is not None:
+        opened.append(stream)
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+        metrics.observe_llm(REPORT_MODEL, "stream", time.perf_counter() - start, usage)
+
+def _llm_complete(messages: list, mode: str) -> str:
+    """스트리밍 없는 LLM 호출 (mode 는 지표 라벨: complete, map, combine, reduce)"""
+    start = time.perf_counter()
+    response = client.chat.completions.create(model=REPORT_MODEL, messages=messages)
+    metrics.observe_llm(REPORT_MODEL, mode, time.perf_counter() - start, getattr(response, "usage", None))
+    return response.choices[0].message.content
+
+def _complete_report(prompt: str, analysis_date: str, mode: str = "complete") -> str:
+    return _llm_complete(_report_messages(prompt, analysis_date), mode)
+
+async def _build_chunked_prompt(sources) -> str:
+    """map-reduce 모드: 파일/기간 청크별 요약을 병렬로 만든 뒤 reduce 프롬프트를 돌려준다"""
+    loaders = [(label, functools.partial(_load_source, label, load)) for label, load in sources]
+    return await report_mapreduce.build_reduce_prompt(loaders, _llm_complete)
+
+async def _stream_report(cache_key: str, cached: Optional[str], prompt: Optional[str], analysis_date: str,
+                         prepare=None, release=None):
+    """보고서를 SSE 로 전송: start -> data(delta)* -> done.
+
+    클라이언트가 연결을 끊으면 제너레이터가 닫히면서 iter_io 가 closer 로 OpenAI 스트림(HTTP 응답)을
+    닫아, 다음 토큰을 기다리는 중(추론 중)이어도 upstream 생성이 중단된다. 끝까지 생성된 보고서만 캐시에 저장한다.
+    prepare 가 있으면 start 이벤트를 보낸 뒤 프롬프트를 만든다 (map-reduce 모드의 map 단계).
+    release 는 prepare 가 읽는 업로드를 정리하는 함수로, 프롬프트를 만든 뒤 부른다.
+    """
+    # 헤더와 첫 바이트를 즉시 내보내 클라이언트가 진행 상황을 표시할 수 있게 한다
+    yield _sse({"cached": cached is not None}, event="start")
+    if cached is not None:
+        yield _sse({"delta": cached})
+        yield _sse({}, event="done")
+        return
+    if prepare is not None:
+        try:
+            prompt = await prepare()
+        except Exception as e:
+            yield _sse({"detail": f"건강 보고서 생성 중 오류 발생: {str(e)}"}, event="error")
+            return
+        finally:
+            if release is not None:
+                release()
+
+    parts = []
+    opened = []
+
+    def close_upstream():
+        for stream in opened:
+            stream.close()
+
+    try:
+        async for delta in iter_io(_iter_report_deltas, prompt, analysis_date, opened, closer=close_upstream):
+            parts.append(delta)
+            yield _sse({"delta": delta})
+    except Exception as e:
+        yield _sse({"detail": f"건강 보고서 생성 중 오류 발생: {str(e)}"}, event="error")
+        return
+    await health_report_cache.aset(cache_key, "".join(parts))
+    yield _sse({}, event="done")
+
+@app.post("/health-report")
+async def health_report(
+    files: List[UploadFile] = File(default=None),
+    digest: bool = Query(True, description="사전 집계 요약 모드 (false 면 원본 JSON 전체를 프롬프트로 사용)"),
+    refresh: bool = Query(False, description="캐시를 무시하고 보고서를 새로 생성"),
+    stream: bool = Query(False, description="생성되는 토큰을 Server-Sent Events 로 바로 전송"),
+    chunked: bool = Query(False, description="map-reduce 모드: 원본을 파일/기간 청크로 나눠 병렬 요약 후 합성 (digest 무시, 한 사람의 데이터만)"),
+    patient: Optional[str] = Query(None, description="업로드가 없을 때 fhir/ 에서 고를 환자 (이름, MHID 또는 파일 이름)"),
+    resource_types: Optional[List[str]] = Query(None, description="업로드가 없을 때 사용할 리소스 타입만 남김"),
+):
+    """FHIR JSON 파일을 직접 업로드하거나(여러 개 가능) 
+    업로드가 없으면 서버의 fhir/ 디렉터리 인덱스(fhir_index)로 GPT 건강 보고서를 생성한다."""
+
+    spooled = []
+
+    def close_uploads():
+        for upload in spooled:
+            upload.close()
+
+    # 업로드를 읽는 생성 태스크나 스트리밍 응답에 넘긴 뒤에는 여기서 닫지 않는다
+    handed_off = False
+    try:
+        sources = []
+
+        # 1) 요청으로부터 업로드된 파일이 있는 경우 우선 사용 (큰 파일은 임시 파일로 스풀링)
+        if files:
+            for uf in files:
+                upload = await uploads.spool(uf)
+                spooled.append(upload)
+                sources.append((uf.filename, uploads.TextSource(upload)))
+
+        # 2) 업로드가 없으면 fhir 디렉터리 인덱스 사용 (메모리의 파싱 결과, 디스크 I/O 없음)
+        if not sources:
+            sources = await run_io(fhir_dir_index.select, patient, resource_types)
+            if not sources:
+                raise HTTPException(status_code=404, detail="FHIR 데이터 파일을 찾을 수 없습니다.")
+            # map-reduce 는 모든 요약을 한 사람의 것으로 합치므로 여러 환자를 섞지 않는다
+            if chunked and len(fhir_dir_index.patients_of(label for label, _ in sources)) > 1:
+                raise HTTPException(
+                    status_code=400,
+                    detail="chunked 모드는 한 사람의 데이터만 처리합니다. patient 로 환자를 지정해주세요.",
+                )
+
+        # 동일 입력/프롬프트 버전/기준일이면 캐시된 보고서 재사용
+        analysis_date = datetime.now().strftime('%Y년 %m월 %d일')
+        cache_key = await run_io(_report_cache_key, sources, digest, analysis_date, chunked)
+
+        if stream:
+            cached = None if refresh else await health_report_cache.aget(cache_key)
+            prompt = prepare = None
+            if cached is None and chunked:
+                prepare = functools.partial(_build_chunked_prompt, sources)
+                handed_off = True
+            elif cached is None:
+                prompt = await run_io(_build_report_prompt, sources, digest)
+            return StreamingResponse(
+                _stream_report(cache_key, cached, prompt, analysis_date, prepare, close_uploads if prepare else None),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        async def generate():
+            # GPT 프롬프트 구성 및 호출
+            if chunked:
+                prompt = await _build_chunked_prompt(sources)
+                return await run_io(_complete_report, prompt, analysis_date, "reduce")
+            prompt = await run_io(_build_report_prompt, sources, digest)
+
+            return await run_io(_complete_report, prompt, analysis_date)
+
+        if refresh:
+            report = await generate()
+            await health_report_cache.aset(cache_key, report)
+        else:
+            handed_off = True
+            report = await health_report_cache.get_or_create(cache_key, generate, release=close_uploads)
         return {"report": report}
 
     except HTTPException:
@@ -281,202 +652,572 @@ H) "예방 중심형"
         raise HTTPException(
             status_code=500, detail=f"건강 보고서 생성 중 오류 발생: {str(e)}"
         )
+    finally:
+        if not handed_off:
+            close_uploads()
+
+def _find_user(name_hash: str):
+    """name_hash 의 사용자 ID (없으면 None, 만들지 않는다)"""
+    user_id = ingest_index.get_user(name_hash)
+    if user_id is not None:
+        return user_id
+    rows = supabase.table("users").select("id").eq("name_hash", name_hash).execute().data
+    if not rows:
+        return None
+    ingest_index.set_user(name_hash, rows[0]["id"])
+    return rows[0]["id"]
+
+def _stored_resources_text(name_hash: str) -> str:
+    """사용자의 fhir_resources 원본을 리소스 리스트 JSON 텍스트로"""
+    user_id = _find_user(name_hash)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail=f"사용자 {name_hash} 를 찾을 수 없습니다.")
+    rows = export_stream.iter_rows(supabase, "fhir_resources", "id,data", [lambda q: q.eq("user_id", user_id)])
+    resources = [row["data"] for row in rows]
+    if not resources:
+        raise HTTPException(status_code=404, detail=f"사용자 {name_hash} 의 저장된 FHIR 리소스가 없습니다.")
+    return fast_json.dumps(resources)
+
+def _prepare_batch_report(item, digest: bool):
+    """배치 항목의 (캐시 키, LLM messages). 기준일은 처리 시점 날짜"""
+    if item.text is not None:
+        text = item.text
+    else:
+        text = _stored_resources_text(item.name_hash)
+    # 캐시 키는 /health-report 업로드와 같은 원본 바이트 해시 (키를 만들려고 파싱하지 않는다)
+    sources = [(item.label, fhir_index.IndexedSource(item.label, text, None,
+                                                     report_cache.bytes_hash(text.encode("utf-8"))))]
+    analysis_date = datetime.now().strftime('%Y년 %m월 %d일')
+    key = _report_cache_key(sources, digest, analysis_date)
+    return key, _report_messages(_build_report_prompt(sources, digest), analysis_date)
+
+def _complete_batch_report(messages: list):
+    """배치용 LLM 호출. 재시도는 report_batch 가 레이트 리미터를 거쳐 하므로 SDK 재시도는 끈다"""
+    llm = client.with_options(max_retries=0) if hasattr(client, "with_options") else client
+    start = time.perf_counter()
+    response = llm.chat.completions.create(model=REPORT_MODEL, messages=messages)
+    usage = getattr(response, "usage", None)
+    metrics.observe_llm(REPORT_MODEL, "batch", time.perf_counter() - start, usage)
+    return response.choices[0].message.content, usage
+
+# 보고서 일괄 생성 워커 (동시성/RPM/TPM 은 REPORT_BATCH_* 환경 변수).
+# 작업 결과는 프로세스 메모리(MemoryJobStore)에만 남는다: 재시작하면 사라지고 워커끼리 공유되지 않는다
+report_batches = report_batch.ReportBatchRunner(
+    _prepare_batch_report,
+    _complete_batch_report,
+    cache=health_report_cache,
+    store=ingest_jobs.MemoryJobStore(max_jobs=int(os.getenv("REPORT_BATCH_HISTORY", "1000"))),
+)
+
+@app.post("/health-report/batch")
+async def health_report_batch(
+    files: List[UploadFile] = File(default=None),
+    name_hashes: Optional[List[str]] = Form(None, description="저장된 fhir_resources 로 보고서를 만들 사용자 목록"),
+    digest: bool = Query(True, description="사전 집계 요약 모드 (false 면 원본 JSON 전체를 프롬프트로 사용)"),
+    refresh: bool = Query(False, description="캐시를 무시하고 보고서를 새로 생성"),
+):
+    """여러 사용자의 건강 보고서를 백그라운드에서 일괄 생성하고 작업 ID 를 바로 돌려준다.
+
+    name_hashes 는 저장된 리소스를, files 는 업로드된 번들 하나를 사용자 한 명으로 사용한다.
+    결과는 GET /health-report/batch/{job_id} 로 조회한다. 작업은 이 프로세스의 메모리에만 남으므로
+    재시작하면 사라지고, 여러 워커로 띄우면 같은 워커로 조회해야 한다 (report_batch 참고).
+    """
+    name_hashes = list(dict.fromkeys(name_hashes or []))
+    count = len(name_hashes) + len(files or [])
+    if count > report_batches.max_depth:
+        raise HTTPException(status_code=400, detail=f"한 번에 최대 {report_batches.max_depth}명까지 요청할 수 있습니다.")
+    try:
+        # 업로드를 읽기 전에 대기열 자리를 확인한다
+        report_batches.check_room(count)
+    except ingest_jobs.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    items = [report_batch.BatchItem(h, name_hash=h) for h in name_hashes]
+    for uf in files or []:
+        upload = await uploads.spool(uf)
+        try:
+            text = await run_io(_load_source, uf.filename, upload.read_text)
+        finally:
+            upload.close()
+        items.append(report_batch.BatchItem(uf.filename, text=text))
+    if not items:
+        raise HTTPException(status_code=400, detail="name_hashes 또는 files 가 필요합니다.")
+    try:
+        job = report_batches.submit(items, digest=digest, refresh=refresh)
+    except ingest_jobs.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return JSONResponse(status_code=202, content={"status": "queued", "job_id": job.id, "items": len(items)})
+
+@app.get("/health-report/batch/{job_id}")
+async def health_report_batch_status(
+    job_id: str,
+    reports: bool = Query(True, description="항목별 보고서 본문 포함"),
+):
+    """보고서 일괄 생성 작업 상태와 항목별 결과 (queued / running / retrying / done / failed)"""
+    job = report_batches.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="해당 보고서 작업을 찾을 수 없습니다.")
+    return job.to_dict(reports)
 
 class FHIRIngestRequest(BaseModel):
     name_hash: str
     full_name: Optional[str] = None
     resource: dict
 
-@app.post("/ingest-fhir")
-async def ingest_fhir(request: FHIRIngestRequest):
-    try:
-        # 1) 사용자 조회 또는 생성
-        user_resp = supabase.table("users").select("id").eq("name_hash", request.name_hash).execute()
-        if user_resp.data:
-            user_id = user_resp.data[0]["id"]
-        else:
-            insert_user = supabase.table("users").insert({"name_hash": request.name_hash, "full_name": request.full_name}).execute()
-            user_id = insert_user.data[0]["id"]
+# 일괄 적재 시 한 번의 요청에 담을 최대 행(또는 in_ 필터 값) 수
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
 
-        # 2) 원본 FHIR 리소스 저장 및 매핑 (publicData 처리)
-        raw = request.resource
-        # publicData 배열이 있으면 여러 리소스 처리, 없으면 단일 리소스로 처리
-        resources = []  
-        if isinstance(raw.get("publicData"), list):
-            for item in raw["publicData"]:
-                if isinstance(item, dict) and "resource" in item:
-                    resources.append(item["resource"])
+# 사용자 ID / 적재된 리소스 캐시 (재업로드 시 변경 없는 리소스는 DB 조회 없이 건너뜀)
+ingest_index = ingest_cache.IngestCache(
+    max_users=int(os.getenv("INGEST_CACHE_USERS", "1024")),
+    max_resources=int(os.getenv("INGEST_CACHE_RESOURCES", "200000")),
+    ttl=float(os.getenv("INGEST_CACHE_TTL", "3600")),
+)
+
+def _chunks(items, size=None):
+    size = size or INGEST_BATCH_SIZE
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _split_resources(raw: dict) -> list:
+    """publicData 배열이 있으면 여러 리소스로, 없으면 단일 리소스로 취급"""
+    resources = []
+    if isinstance(raw.get("publicData"), list):
+        for item in raw["publicData"]:
+            if isinstance(item, dict) and "resource" in item:
+                resources.append(item["resource"])
+    else:
+        resources.append(raw)
+    return resources
+
+def _get_or_create_user(name_hash: str, full_name: Optional[str]):
+    user_id = ingest_index.get_user(name_hash)
+    if user_id is not None:
+        return user_id
+    user_resp = supabase.table("users").select("id").eq("name_hash", name_hash).execute()
+    if user_resp.data:
+        user_id = user_resp.data[0]["id"]
+    else:
+        insert_user = supabase.table("users").insert({"name_hash": name_hash, "full_name": full_name}).execute()
+        user_id = insert_user.data[0]["id"]
+        # 사용자보다 먼저 저장된 PRO 응답은 delta 내보내기에서 빠져 있었으므로 지금 다시 변경으로 표시한다
+        supabase.table("pro_responses").update({"change_seq": export_delta.next_change_seq()}) \
+            .eq("user_id", name_hash).execute()
+    ingest_index.set_user(name_hash, user_id)
+    return user_id
+
+def _update_resource(user_id, resource_id, res: dict, extractor=None, row=None):
+    """내용이 바뀐 리소스의 원본과 매핑 행을 갱신 (매핑 행이 없으면 삽입)"""
+    supabase.table("fhir_resources") \
+        .update({"resource_type": res.get("resourceType"), "data": res}) \
+        .eq("id", resource_id) \
+        .execute()
+    if extractor is None:
+        return
+    table = extractor.table
+    row = row if row is not None else extractor.extract(res).to_row()
+    row = {**row, "change_seq": export_delta.next_change_seq()}
+    updated = supabase.table(table).update(row).eq("resource_id", resource_id).execute()
+    if not updated.data:
+        supabase.table(table).insert({"user_id": user_id, "resource_id": resource_id, **row}).execute()
+
+def _ingest_per_resource(user_id, resources: list) -> list:
+    """리소스마다 조회/삽입을 순차적으로 수행하는 기존 적재 경로"""
+    results = []
+    marked = False
+
+    def mark_dirty():
+        # 매핑 행을 쓰기 전에 한 번만 요약 재계산 표시
+        nonlocal marked
+        if not marked:
+            cohort_stats.mark_dirty(supabase, [user_id])
+            marked = True
+
+    for res in resources:
+        resource_type = res.get("resourceType")
+        fhir_id_val = res.get("id")
+        extractor = fhir_extract.get(resource_type)
+        content_hash = ingest_cache.resource_hash(res)
+        # 캐시: 이미 적재했고 내용이 같으면 DB 조회 없이 건너뜀, 바뀌었으면 갱신
+        cached = ingest_index.lookup(user_id, [fhir_id_val]).get(fhir_id_val) if fhir_id_val is not None else None
+        if cached is not None:
+            resource_id, cached_hash, _ = cached
+            if cached_hash != content_hash:
+                if extractor is not None:
+                    mark_dirty()
+                _update_resource(user_id, resource_id, res, extractor)
+                ingest_index.record(user_id, {fhir_id_val: (resource_id, content_hash, resource_type)}, updated=1)
+            if extractor is not None:
+                results.append({"resource_type": resource_type, "resource_id": resource_id})
+            continue
+
+        # 원본 리소스 저장(idempotent): 이미 존재하면 건너뜀, 내용이 바뀌었으면 갱신
+        existing = supabase.table("fhir_resources") \
+            .select("id, data") \
+            .eq("user_id", user_id) \
+            .eq("fhir_id", fhir_id_val) \
+            .execute()
+        updated = 0
+        if existing.data:
+            resource_id = existing.data[0]["id"]
+            if ingest_cache.resource_hash(existing.data[0].get("data") or {}) != content_hash:
+                if extractor is not None:
+                    mark_dirty()
+                _update_resource(user_id, resource_id, res, extractor)
+                updated = 1
         else:
-            resources.append(raw)
+            insert_fhir = supabase.table("fhir_resources").insert({
+                "user_id": user_id,
+                "resource_type": resource_type,
+                "fhir_id": fhir_id_val,
+                "data": res
+            }).execute()
+            resource_id = insert_fhir.data[0]["id"]
+
+        # 리소스 타입별 매핑 (지원하지 않는 리소스 타입은 건너뜀)
+        if extractor is not None and not updated:
+            table = extractor.table
+            row = extractor.extract(res).to_row()
+
+            # idempotent: 이미 삽입된 매핑은 건너뜀
+            exists = supabase.table(table) \
+                .select("id") \
+                .eq("resource_id", resource_id) \
+                .execute()
+            if not exists.data:
+                mark_dirty()
+                supabase.table(table).insert({
+                    "user_id": user_id, "resource_id": resource_id, **row,
+                    "change_seq": export_delta.next_change_seq(),
+                }).execute()
 
-        results = []
-        for res in resources:
-            resource_type = res.get("resourceType")
-            fhir_id_val = res.get("id")
-            # 원본 리소스 저장(idempotent): 이미 존재하면 건너뜀
+        if fhir_id_val is not None:
+            ingest_index.record(user_id, {fhir_id_val: (resource_id, content_hash, resource_type)}, updated=updated)
+        if extractor is not None:
+            results.append({"resource_type": resource_type, "resource_id": resource_id})
+    # 표시된 경우에만 코호트 요약 갱신 (이전 적재에서 갱신이 실패한 경우 포함)
+    cohort_stats.refresh_dirty(supabase, [user_id])
+    return results
+
+def _ingest_bulk(user_id, resources: list) -> list:
+    """매핑을 메모리에서 먼저 수행한 뒤 테이블별로 묶어서 조회/삽입하는 일괄 적재 경로.
+
+    fhir_resources 는 (user_id, fhir_id), 매핑 테이블은 resource_id 기준으로
+    이미 존재하는 행을 한 번에 조회하고, 없는 행만 배치 insert 한다.
+    적재 캐시에 있고 내용 해시가 같은 리소스는 조회 없이 건너뛰고, 내용이 바뀐 리소스는 갱신한다.
+    """
+    return _ingest_bulk_many([(user_id, resources)])[0]
+
+def _ingest_bulk_many(groups: list) -> list:
+    """여러 (user_id, resources) 묶음을 함께 적재하고 묶음별 results 목록을 돌려준다.
+
+    insert/upsert 와 매핑 테이블 조회는 사용자 구분 없이 배치로 묶고,
+    fhir_resources 존재 확인만 사용자별로 조회한다.
+    """
+    # 1) 원본 리소스: 같은 사용자의 중복 fhir_id 는 한 번만 저장 (fhir_id 가 없으면 각각 저장)
+    group_keys = []
+    first = {}
+    for g, (user_id, resources) in enumerate(groups):
+        keys = [
+            (user_id, res.get("id") if res.get("id") is not None else ("#", g, i))
+            for i, res in enumerate(resources)
+        ]
+        group_keys.append(keys)
+        for key, res in zip(keys, resources):
+            first.setdefault(key, res)
+    fhir_ids = {}
+    for user_id, fid in first:
+        if not isinstance(fid, tuple):
+            fhir_ids.setdefault(user_id, []).append(fid)
+    hashes = {key: ingest_cache.resource_hash(first[key]) for key in first if not isinstance(key[1], tuple)}
+
+    resource_ids = {}
+    unchanged = set()
+    changed = set()
+    for user_id, fids in fhir_ids.items():
+        for fid, (resource_id, content_hash, _) in ingest_index.lookup(user_id, fids).items():
+            key = (user_id, fid)
+            resource_ids[key] = resource_id
+            (unchanged if content_hash == hashes[key] else changed).add(key)
+
+        misses = [fid for fid in fids if (user_id, fid) not in resource_ids]
+        for chunk in _chunks(misses):
             existing = supabase.table("fhir_resources") \
-                .select("id") \
+                .select("id, fhir_id, data") \
                 .eq("user_id", user_id) \
-                .eq("fhir_id", fhir_id_val) \
+                .in_("fhir_id", chunk) \
                 .execute()
-            if existing.data:
-                resource_id = existing.data[0]["id"]
-            else:
-                insert_fhir = supabase.table("fhir_resources").insert({
-                    "user_id": user_id,
-                    "resource_type": resource_type,
-                    "fhir_id": fhir_id_val,
-                    "data": res
-                }).execute()
-                resource_id = insert_fhir.data[0]["id"]
-
-            # 리소스 타입별 매핑
-            if resource_type == "MedicationDispense":
-                # medication 정보
-                med_ref = res.get("medicationReference", {})
-                med_res = med_ref.get("resource", {})
-                coding = med_res.get("code", {}).get("coding", [{}])[0]
-                medication_code = coding.get("code")
-                print("medication_code", medication_code)
-                medication_name = coding.get("display")
-                print("medication_name", medication_name)
-                # pharmacy name 추출 (performer 배열의 actor.resource.name)
-                pharmacy_name = None
-                perf = res.get("performer", [])
-                if isinstance(perf, list) and perf:
-                    actor = perf[0].get("actor", {})
-                    org = actor.get("resource", {})
-                    pharmacy_name = org.get("name")
-                print("pharmacy_name", pharmacy_name)
-                when_prepared = res.get("whenPrepared", "").split("T")[0]
-                print("when_prepared", when_prepared)
-                days_supply = res.get("daysSupply", {}).get("value")
-
-                # 나이 계산 (주민등록번호 앞 7자리 이용)
-                age = None
-                subj = res.get("subject", {})
-                pat = subj.get("resource", {})
-                ident_list = pat.get("identifier", [])
-                rrn_val = None
-                for ident in ident_list:
-                    if ident.get("system") == "http://mois.go.kr/rnn":
-                        rrn_val = ident.get("value", "")
-                        break
-                if rrn_val:
-                    digits = re.sub(r"\D", "", rrn_val)
-                    if len(digits) >= 7:
-                        yy = int(digits[0:2])
-                        mm = int(digits[2:4])
-                        dd = int(digits[4:6])
-                        code = digits[6]
-                        year = 1900 + yy if code in ("1", "2") else 2000 + yy
-                        dob = datetime(year, mm, dd).date()
-                        prep_date = datetime.fromisoformat(when_prepared).date()
-                        age = prep_date.year - dob.year - ((prep_date.month, prep_date.day) < (dob.month, dob.day))
-
-                print({
-                    "user_id": user_id,
-                    "resource_id": resource_id,
-                    "medication_code": medication_code,
-                    "medication_name": medication_name,
-                    "pharmacy_name": pharmacy_name,
-                    "when_prepared": when_prepared,
-                    "days_supply": days_supply,
-                    "age": age,
-                })
-
-                # idempotent: 이미 삽입된 매핑은 건너뜀
-                md_exists = supabase.table("medication_dispenses") \
-                    .select("id") \
-                    .eq("resource_id", resource_id) \
-                    .execute()
-                if not md_exists.data:
-                    supabase.table("medication_dispenses").insert({
-                        "user_id": user_id,
-                        "resource_id": resource_id,
-                        "medication_code": medication_code,
-                        "medication_name": medication_name,
-                        "pharmacy_name": pharmacy_name,
-                        "when_prepared": when_prepared,
-                        "days_supply": days_supply,
-                        "age": age,
-                    }).execute()
-            elif resource_type == "ExplanationOfBenefit":
-                claim_type_coding = res.get("type", {}).get("coding", [{}])[0]
-                claim_type = claim_type_coding.get("code") or claim_type_coding.get("display")
-                # created_date: billablePeriod.start 우선 사용
-                billable = res.get("billablePeriod", {})
-                created_date = billable.get("start", res.get("created", "")).split("T")[0]
-                copay_amount = None
-                benefit_amount = None
-                totals = res.get("total", [])
-                if isinstance(totals, list):
-                    for t in totals:
-                        cat = t.get("category", {}).get("coding", [{}])[0]
-                        code_key = cat.get("code")
-                        val = t.get("amount", {}).get("value")
-                        if code_key == "copay":
-                            copay_amount = val
-                        elif code_key == "benefit":
-                            benefit_amount = val
-                # idempotent: 이미 삽입된 매핑은 건너뜀
-                tc_exists = supabase.table("treatment_claims") \
-                    .select("id") \
-                    .eq("resource_id", resource_id) \
-                    .execute()
-                if not tc_exists.data:
-                    supabase.table("treatment_claims").insert({
-                        "user_id": user_id,
-                        "resource_id": resource_id,
-                        "claim_type": claim_type,
-                        "created_date": created_date,
-                        "copay_amount": copay_amount,
-                        "benefit_amount": benefit_amount
-                    }).execute()
-            elif resource_type == "Immunization":
-                vc = res.get("vaccineCode", {}).get("coding", [{}])[0]
-                vaccine_name = vc.get("display")
-                occurrence_date = res.get("occurrenceDateTime", "").split("T")[0]
-                # dose number 체크
-                dose_number = res.get("doseNumber")
-                if not dose_number:
-                    prot = res.get("protocolApplied", [])
-                    if isinstance(prot, list) and prot:
-                        dose_number = prot[0].get("doseNumberPositiveInt") or prot[0].get("doseNumber")
-
-                # performer name
-                perf_name = None
-                p_list = res.get("performer", [])
-                if isinstance(p_list, list) and p_list:
-                    actor = p_list[0].get("actor", {})
-                    org = actor.get("resource", {})
-                    perf_name = org.get("name")
-
-                # idempotent: 이미 삽입된 매핑은 건너뜀
-                im_exists = supabase.table("immunizations") \
-                    .select("id") \
-                    .eq("resource_id", resource_id) \
-                    .execute()
-                if not im_exists.data:
-                    supabase.table("immunizations").insert({
-                        "user_id": user_id,
-                        "resource_id": resource_id,
-                        "vaccine_name": vaccine_name,
-                        "occurrence_date": occurrence_date,
-                        "dose_number": dose_number,
-                        "performer_name": perf_name
-                    }).execute()
-            else:
-                # 지원하지 않는 리소스 타입은 건너뜀
+            for r in existing.data or []:
+                key = (user_id, r["fhir_id"])
+                if key in resource_ids:
+                    continue
+                resource_ids[key] = r["id"]
+                if ingest_cache.resource_hash(r.get("data") or {}) != hashes[key]:
+                    changed.add(key)
+
+    pending = [key for key in first if key not in resource_ids]
+    for chunk in _chunks(pending):
+        insert_fhir = supabase.table("fhir_resources").insert([
+            {
+                "user_id": key[0],
+                "resource_type": first[key].get("resourceType"),
+                "fhir_id": first[key].get("id"),
+                "data": first[key],
+            }
+            for key in chunk
+        ]).execute()
+        for key, r in zip(chunk, insert_fhir.data):
+            resource_ids[key] = r["id"]
+    inserted = {resource_ids[key] for key in pending}
+
+    for chunk in _chunks(sorted(changed, key=str)):
+        supabase.table("fhir_resources").upsert([
+            {
+                "id": resource_ids[key],
+                "user_id": key[0],
+                "resource_type": first[key].get("resourceType"),
+                "fhir_id": key[1],
+                "data": first[key],
+            }
+            for key in chunk
+        ], on_conflict="id").execute()
+    changed_ids = {resource_ids[key] for key in changed}
+
+    # 2) 리소스 타입별 매핑을 메모리에서 추출기 묶음 단위로 수행 (변경 없는 캐시 리소스는 매핑도 이미 존재)
+    group_results = []
+    pending_by_extractor = {}
+    seen = set()
+    for (user_id, resources), keys in zip(groups, group_keys):
+        results = []
+        for key, res in zip(keys, resources):
+            resource_type = res.get("resourceType")
+            resource_id = resource_ids[key]
+            extractor = fhir_extract.get(resource_type)
+            if extractor is None:
                 continue
-
+            if key not in unchanged and (extractor.table, resource_id) not in seen:
+                seen.add((extractor.table, resource_id))
+                pending_by_extractor.setdefault(extractor, []).append((user_id, resource_id, res))
             results.append({"resource_type": resource_type, "resource_id": resource_id})
+        group_results.append(results)
+    rows_by_table = {}
+    for extractor, pending in pending_by_extractor.items():
+        records = extractor.extract_batch([res for _, _, res in pending])
+        rows = rows_by_table.setdefault(extractor.table, {})
+        for (user_id, resource_id, _), record in zip(pending, records):
+            rows[resource_id] = {"user_id": user_id, "resource_id": resource_id, **record.to_row()}
+
+    # 3) 매핑 테이블별로 이미 존재하는 resource_id 를 제외하고 배치 insert (내용이 바뀐 행은 갱신)
+    updates = {}
+    for table, rows in rows_by_table.items():
+        for chunk in _chunks([rid for rid in rows if rid not in inserted]):
+            exists = supabase.table(table).select("resource_id").in_("resource_id", chunk).execute()
+            for r in exists.data or []:
+                row = rows.pop(r["resource_id"], None)
+                if row is not None and r["resource_id"] in changed_ids:
+                    updates.setdefault(table, []).append(row)
+    # 쓰기 전에 요약 재계산 표시 (쓰기나 갱신이 실패해도 다음 적재에서 다시 갱신된다)
+    dirty_users = {row["user_id"] for rows in updates.values() for row in rows}
+    dirty_users.update(row["user_id"] for rows in rows_by_table.values() for row in rows.values())
+    if dirty_users:
+        cohort_stats.mark_dirty(supabase, dirty_users)
+    for table, rows in updates.items():
+        for row in rows:
+            row["change_seq"] = export_delta.next_change_seq()
+            supabase.table(table).update(row).eq("resource_id", row["resource_id"]).execute()
+    for table, rows in rows_by_table.items():
+        for chunk in _chunks(list(rows.values())):
+            seq = export_delta.next_change_seq()
+            supabase.table(table).insert([{**row, "change_seq": seq} for row in chunk]).execute()
+
+    logger.debug(
+        "일괄 적재: 묶음 %d개, 신규 리소스 %d개, 변경 %d개, 매핑 insert %s",
+        len(groups), len(pending), len(changed), {table: len(rows) for table, rows in rows_by_table.items()},
+    )
+
+    # 4) 표시된 사용자만 코호트 요약 갱신 (이전 적재에서 갱신이 실패한 사용자 포함)
+    cohort_stats.refresh_dirty(supabase, [user_id for user_id, _ in groups])
+
+    for user_id, fids in fhir_ids.items():
+        ingest_index.record(
+            user_id,
+            {fid: (resource_ids[(user_id, fid)], hashes[(user_id, fid)], first[(user_id, fid)].get("resourceType"))
+             for fid in fids},
+            updated=sum(1 for key in changed if key[0] == user_id),
+        )
+    return group_results
+
+def _write_ingest_jobs(jobs: list) -> list:
+    """비동기 적재 작업 묶음을 한 번의 일괄 쓰기로 처리 (워커에서 I/O 스레드로 실행)"""
+    groups = []
+    for job in jobs:
+        job.user_id = _get_or_create_user(job.name_hash, job.full_name)
+        groups.append((job.user_id, job.resources))
+    return _ingest_bulk_many(groups)
+
+async def _run_ingest_jobs(jobs: list) -> list:
+    return await run_io(_write_ingest_jobs, jobs)
+
+# 비동기 적재 큐와 백그라운드 워커 (큐가 가득 차면 503 으로 재시도 요청)
+ingest_workers = ingest_jobs.IngestWorkers(
+    _run_ingest_jobs,
+    queue=ingest_jobs.MemoryJobQueue(
+        max_depth=int(os.getenv("INGEST_QUEUE_DEPTH", "1000")),
+        shards=int(os.getenv("INGEST_WORKERS", "4")),
+    ),
+    store=ingest_jobs.MemoryJobStore(max_jobs=int(os.getenv("INGEST_JOB_HISTORY", "10000"))),
+    batch_resources=int(os.getenv("INGEST_JOB_BATCH_RESOURCES", "1000")),
+    linger=float(os.getenv("INGEST_JOB_LINGER", "0.05")),
+)
+
+@app.post("/ingest-fhir")
+async def ingest_fhir(
+    request: FHIRIngestRequest,
+    bulk: bool = Query(False, description="테이블별 일괄(batch) 적재 모드"),
+    run_async: bool = Query(False, alias="async", description="큐에 넣고 작업 ID 를 바로 반환 (GET /ingest-jobs/{id})"),
+):
+    if run_async:
+        resources = _split_resources(request.resource)
+        try:
+            job = ingest_workers.submit(request.name_hash, request.full_name, resources)
+        except ingest_jobs.QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        return JSONResponse(status_code=202, content={"status": "queued", "job_id": job.id})
+    try:
+        # 1) 사용자 조회 또는 생성
+        user_id = await run_io(_get_or_create_user, request.name_hash, request.full_name)
+
+        # 2) 원본 FHIR 리소스 저장 및 매핑 (publicData 처리)
+        resources = _split_resources(request.resource)
+        if bulk:
+            results = await run_io(_ingest_bulk, user_id, resources)
+        else:
+            results = await run_io(_ingest_per_resource, user_id, resources)
+
+        # 결과는 이미 JSON 타입이므로 jsonable_encoder 를 거치지 않고 바로 직렬화한다
+        return FastJSONResponse({"status": "success", "user_id": user_id, "results": results})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {"status": "success", "user_id": user_id, "results": results}
+# 스트리밍 적재 진행 상황 (ingest_id -> 진행 정보), 최근 항목만 보관
+INGEST_PROGRESS_LIMIT = int(os.getenv("INGEST_PROGRESS_LIMIT", "1000"))
+ingest_progress = OrderedDict()
+
+def _track_progress(ingest_id: str, progress: dict):
+    ingest_progress[ingest_id] = progress
+    ingest_progress.move_to_end(ingest_id)
+    while len(ingest_progress) > INGEST_PROGRESS_LIMIT:
+        ingest_progress.popitem(last=False)
+
+@app.post("/ingest-fhir/stream")
+async def ingest_fhir_stream(
+    request: Request,
+    name_hash: Optional[str] = Query(None, description="본문에 name_hash 가 없을 때 사용"),
+    full_name: Optional[str] = Query(None),
+    ingest_id: Optional[str] = Query(None, description="진행 상황 조회용 ID (GET /ingest-fhir/stream/{ingest_id})"),
+):
+    """FHIR 번들을 받는 대로 리소스 단위로 파싱하여 INGEST_BATCH_SIZE 크기의 버퍼가 찰 때마다 적재한다.
+
+    본문 전체를 메모리에 올리지 않으므로 번들 크기와 무관하게 메모리 사용량이 일정하다.
+    JSON(publicData 번들 또는 /ingest-fhir 요청 본문) 과 NDJSON(Content-Type: application/x-ndjson) 을 지원하며,
+    응답에는 리소스별 결과 목록 대신 타입별 건수를 돌려준다.
+    본문의 name_hash 가 리소스 뒤에 있으면 그때까지 리소스를 모아 두므로, 큰 번들은 name_hash 를
+    쿼리 파라미터로 주거나 본문 앞쪽에 두어야 메모리 사용량이 일정하다.
+    """
+    ingest_id = ingest_id or uuid.uuid4().hex
+    mapped = Counter()
+    progress = {"ingest_id": ingest_id, "status": "running", "bytes_read": 0, "resources": 0, "batches": 0, "mapped": mapped}
+    _track_progress(ingest_id, progress)
+
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    bundle = fhir_stream.BundleStream(request.stream(), ndjson=ndjson)
+    user_id = None
+
+    async def flush(batch):
+        nonlocal user_id
+        if user_id is None:
+            user_hash = bundle.meta.get("name_hash") or name_hash
+            if not user_hash:
+                raise HTTPException(status_code=400, detail="name_hash 가 필요합니다.")
+            user_id = await run_io(_get_or_create_user, user_hash, bundle.meta.get("full_name") or full_name)
+        results = await run_io(_ingest_bulk, user_id, batch)
+        mapped.update(r["resource_type"] for r in results)
+        progress["batches"] += 1
+
+    batch = []
+    pending = None
+    try:
+        async for res in bundle:
+            batch.append(res)
+            progress["resources"] += 1
+            progress["bytes_read"] = bundle.bytes_read
+            # name_hash 가 아직 나오지 않았으면(본문에서 리소스 뒤에 있는 경우) 나올 때까지 모은다
+            if len(batch) >= INGEST_BATCH_SIZE and (user_id is not None or bundle.meta.get("name_hash") or name_hash):
+                # 직전 배치 쓰기가 끝나야 다음 배치를 보낸다 (버퍼는 최대 두 배치)
+                if pending is not None:
+                    await pending
+                pending = asyncio.ensure_future(flush(batch))
+                batch = []
+        if pending is not None:
+            await pending
+            pending = None
+        if batch or user_id is None:
+            await flush(batch)
+        progress.update(status="done", bytes_read=bundle.bytes_read)
+        return {
+            "status": "success",
+            "ingest_id": ingest_id,
+            "user_id": user_id,
+            "resources": progress["resources"],
+            "batches": progress["batches"],
+            "mapped": dict(mapped),
+        }
+    except fhir_stream.BundleFormatError as e:
+        progress["status"] = "failed"
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
+        progress["status"] = "failed"
         raise
     except Exception as e:
+        progress["status"] = "failed"
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+@app.get("/ingest-jobs/{job_id}")
+async def ingest_job_status(job_id: str):
+    """비동기 적재 작업 상태 조회 (queued / running / done / failed)"""
+    job = ingest_workers.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="해당 적재 작업을 찾을 수 없습니다.")
+    return job.to_dict()
+
+@app.get("/ingest-fhir/stream/{ingest_id}")
+async def ingest_fhir_stream_progress(ingest_id: str):
+    """스트리밍 적재 진행 상황 조회"""
+    progress = ingest_progress.get(ingest_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="해당 적재 작업을 찾을 수 없습니다.")
+    return {**progress, "mapped": dict(progress["mapped"])}
+
+@app.get("/fhir-index")
+async def fhir_index_files():
+    """fhir/ 디렉터리 인덱스의 파일별 환자와 리소스 타입별 건수"""
+    files = await run_io(fhir_dir_index.patients)
+    return {"index": fhir_dir_index.stats(), "files": files}
+
+@app.get("/fhir-index/resources")
+async def fhir_index_resources(
+    patient: str = Query(..., description="환자 이름, MHID 또는 파일 이름"),
+    resource_type: Optional[List[str]] = Query(None, description="이 타입의 리소스만 (여러 개 가능)"),
+):
+    """fhir/ 디렉터리 인덱스에서 한 환자의 리소스를 돌려준다"""
+    resources = await run_io(fhir_dir_index.resources, patient, resource_type)
+    if not resources and not await run_io(fhir_dir_index.select, patient):
+        raise HTTPException(status_code=404, detail="해당 환자의 FHIR 파일을 찾을 수 없습니다.")
+    return {"patient": patient, "count": len(resources), "resources": resources}
 
 @app.delete("/debug/clear-data")
 async def clear_data():
@@ -490,12 +1231,98 @@ async def clear_data():
         ]
         results = {}
         for tbl in tables:
-            res = supabase.table(tbl).delete().neq("id", 0).execute()
+            # 지연 초기화되는 클라이언트 생성과 쿼리 구성까지 I/O 스레드에서 수행
+            res = await run_io(lambda tbl=tbl: supabase.table(tbl).delete().neq("id", 0).execute())
             results[tbl] = len(res.data) if res.data else 0
+        await run_io(cohort_stats.clear_summaries, supabase)
+        # users 는 남아 있으므로 사용자 ID 캐시는 유지하고 적재 리소스 캐시만 비운다
+        ingest_index.clear(users=False)
         return {"status": "cleared", "deleted_rows": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"데이터 삭제 오류: {str(e)}")
 
+@app.post("/debug/rebuild-cohort-summaries")
+async def rebuild_cohort_summaries():
+    """디버깅용: 기존 데이터로 코호트 요약 테이블을 다시 만든다 (요약 도입 이전 데이터 백필)"""
+    try:
+        users = await run_io(cohort_stats.rebuild_summaries, supabase)
+        return {"status": "rebuilt", "users": users}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"요약 재생성 오류: {str(e)}")
+
+def _backfill_dispense_ages(db) -> dict:
+    """저장된 MedicationDispense 원본으로 medication_dispenses.age 를 다시 계산한다.
+
+    생년월일 규칙이 바뀌면(성별 코드 5, 6 을 1900년대로) 이전에 적재된 행의 나이가 남고, 적재
+    캐시는 내용이 같은 리소스를 다시 쓰지 않으므로 재적재로는 고쳐지지 않는다. 바뀐 행만 갱신하고
+    (change_seq 포함, delta 내보내기에 다시 나간다) 해당 사용자의 코호트 요약을 다시 계산한다.
+    """
+    extractor = fhir_extract.get("MedicationDispense")
+    scanned = updated = 0
+    dirty = set()
+    rows = export_stream.iter_rows(db, "fhir_resources", "id,data",
+                                   [lambda q: q.eq("resource_type", "MedicationDispense")])
+    while True:
+        batch = list(itertools.islice(rows, INGEST_BATCH_SIZE))
+        if not batch:
+            break
+        scanned += len(batch)
+        ages = {
+            row["id"]: record.age
+            for row, record in zip(batch, extractor.extract_batch([row["data"] for row in batch]))
+        }
+        stored = db.table("medication_dispenses").select("id,user_id,resource_id,age") \
+            .in_("resource_id", list(ages)).execute().data or []
+        changed = [r for r in stored if r["age"] != ages[r["resource_id"]]]
+        if not changed:
+            continue
+        # 쓰기 전에 요약 재계산 표시 (적재 경로와 같은 순서)
+        cohort_stats.mark_dirty(db, {r["user_id"] for r in changed})
+        dirty.update(r["user_id"] for r in changed)
+        by_age = {}
+        for r in changed:
+            by_age.setdefault(ages[r["resource_id"]], []).append(r["id"])
+        for age, ids in by_age.items():
+            for chunk in _chunks(ids):
+                db.table("medication_dispenses") \
+                    .update({"age": age, "change_seq": export_delta.next_change_seq()}).in_("id", chunk).execute()
+        updated += len(changed)
+    cohort_stats.refresh_dirty(db, dirty)
+    return {"resources": scanned, "updated": updated, "users": len(dirty)}
+
+@app.post("/debug/backfill-dispense-ages")
+async def backfill_dispense_ages():
+    """디버깅용: 저장된 원본으로 투약 기록의 나이를 다시 계산하고 코호트 요약을 갱신한다 (생년월일 규칙 변경 백필)"""
+    try:
+        return {"status": "backfilled", **await run_io(_backfill_dispense_ages, supabase)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"나이 백필 오류: {str(e)}")
+
+@app.get("/debug/ingest-cache")
+async def ingest_cache_stats():
+    """디버깅용: 적재 캐시(사용자 ID, 적재된 리소스) 적중률 조회"""
+    return ingest_index.stats()
+
+@app.get("/debug/ingest-jobs")
+async def ingest_jobs_stats():
+    """디버깅용: 비동기 적재 큐 깊이와 처리 건수 조회"""
+    return ingest_workers.stats()
+
+@app.get("/debug/report-batches")
+async def report_batches_stats():
+    """디버깅용: 보고서 일괄 생성 큐 깊이, 재시도/실패 수, 레이트 리밋 대기 시간 조회"""
+    return report_batches.stats()
+
+@app.get("/debug/pdf-cache")
+async def pdf_cache_stats():
+    """디버깅용: PDF 추출 결과 캐시 크기와 적중률 조회"""
+    return pdf_text_cache.stats()
+
+@app.get("/debug/report-cache")
+async def report_cache_stats():
+    """디버깅용: 건강 보고서 캐시 적중률/항목 수 조회"""
+    return {"prompt_version": REPORT_PROMPT_VERSION, **health_report_cache.stats()}
+
 # PROResponse 모델 및 /pro-responses 엔드포인트 추가
 class PROResponse(BaseModel):
     user_id: str
@@ -505,10 +1332,11 @@ class PROResponse(BaseModel):
 async def create_pro_response(request: PROResponse):
     """PRO 설문 응답을 받아 pro_responses 테이블에 저장"""
     try:
-        insert_res = supabase.table("pro_responses").insert({
+        insert_res = await run_io(lambda: supabase.table("pro_responses").insert({
             "user_id": request.user_id,
-            "response": request.response
-        }).execute()
+            "response": request.response,
+            "change_seq": export_delta.next_change_seq(),
+        }).execute())
         pro_id = insert_res.data[0]["id"]
         return {"status": "success", "id": pro_id}
     except Exception as e:
@@ -520,107 +1348,90 @@ async def export_data(
     max_age: Optional[int]      = Query(None, description="medication_dispenses age <= max_age"),
     med_codes: Optional[List[str]] = Query(None, description="filter medication_code list"),
     is_csv: bool                 = Query(False, description="CSV 출력 여부"),
+    format: Optional[str]        = Query(None, pattern="^(csv|xlsx|parquet|arrow|ndjson)$",
+                                         description="출력 형식 (기본: is_csv 에 따라 csv 또는 xlsx, delta 이면 ndjson)"),
+    delta: bool                  = Query(False, description="직전 커서 이후 생기거나 바뀐 행만 (ndjson/parquet/arrow)"),
+    cursor: Optional[str]        = Query(None, description="직전 응답의 X-Export-Cursor (없으면 처음부터)"),
+    layout: str                  = Query("wide", pattern="^(wide|long)$",
+                                         description="CSV 레이아웃: wide(사용자당 한 행) 또는 long(레코드당 한 행)"),
 ):
-    """PRO 응답과 EHR(예방접종, 투약, 청구) 데이터를 CSV 또는 Excel로 다운로드"""
-    try:
-        # PRO responses
-        pro_resp = supabase.table("pro_responses").select("*").execute()
-        pro_rows = pro_resp.data or []
-        # PRO 응답의 hashed user_id 목록
-        hashed_ids = list({r.get("user_id") for r in pro_rows if r.get("user_id")})
-        # users 매핑
-        users_map_resp = supabase.table("users").select("id, name_hash").in_("name_hash", hashed_ids).execute()
-        mapping = {u.get("name_hash"): u.get("id") for u in (users_map_resp.data or [])}
-        print("mapping", mapping)
-        ehr_user_ids = [mapping[h] for h in hashed_ids if mapping.get(h) is not None]
-        print("ehr_user_ids", ehr_user_ids)
-        # EHR 데이터 조회
-        immun_rows = meds_rows = tc_rows = []
-        if ehr_user_ids:
-            immun_rows = (supabase.table("immunizations").select("*").in_("user_id", ehr_user_ids).execute().data or [])
-            print("immun_rows", immun_rows)
-            meds_q = supabase.table("medication_dispenses").select("*").in_("user_id", ehr_user_ids)
-            print("meds_q", meds_q)
-            if min_age is not None: meds_q = meds_q.gte("age", min_age)
-            if max_age is not None: meds_q = meds_q.lte("age", max_age)
-            if med_codes:        meds_q = meds_q.in_("medication_name", med_codes)
-            meds_rows = (meds_q.execute().data or [])
-            tc_rows  = (supabase.table("treatment_claims").select("*").in_("user_id", ehr_user_ids).execute().data or [])
-
-        # CSV 출력
-        if is_csv:
-            # 해시된 user_id -> 정수 id 매핑 리스트
-            pairs = [(h, mapping[h]) for h in hashed_ids if h in mapping]
-            # aggregator keyed by 정수 user_id
-            agg = {uid: {"response": None, "immun": [], "meds": [], "tc": []} for _, uid in pairs}
-            # PRO 응답 채우기
-            for r in pro_rows:
-                h = r.get("user_id")
-                uid = mapping.get(h)
-                if uid in agg:
-                    agg[uid]["response"] = r.get("response")
-            # EHR 데이터 채우기
-            for r in immun_rows:
-                uid = r.get("user_id")
-                if uid in agg:
-                    agg[uid]["immun"].append(r)
-            for r in meds_rows:
-                uid = r.get("user_id")
-                if uid in agg:
-                    agg[uid]["meds"].append(r)
-            for r in tc_rows:
-                uid = r.get("user_id")
-                if uid in agg:
-                    agg[uid]["tc"].append(r)
-            # 최대 길이 계산
-            max_im = max((len(v["immun"]) for v in agg.values()), default=0)
-            max_md = max((len(v["meds"])  for v in agg.values()), default=0)
-            max_tc = max((len(v["tc"])    for v in agg.values()), default=0)
-            # 컬럼명 생성
-            cols = ["user_id", "response"]
-            cols += [f"immun_{i+1}" for i in range(max_im)]
-            cols += [f"meds_{i+1}"   for i in range(max_md)]
-            cols += [f"tc_{i+1}"     for i in range(max_tc)]
-            # 행 생성
-            rows = []
-            for uid in agg:
-                row = {"user_id": uid, "response": json.dumps(agg[uid]["response"], ensure_ascii=False)}
-                for i in range(max_im):
-                    val = agg[uid]["immun"][i] if i < len(agg[uid]["immun"]) else None
-                    row[f"immun_{i+1}"] = json.dumps(val, ensure_ascii=False) if val is not None else ""
-                for i in range(max_md):
-                    val = agg[uid]["meds"][i] if i < len(agg[uid]["meds"]) else None
-                    row[f"meds_{i+1}"]   = json.dumps(val, ensure_ascii=False) if val is not None else ""
-                for i in range(max_tc):
-                    val = agg[uid]["tc"][i]   if i < len(agg[uid]["tc"])   else None
-                    row[f"tc_{i+1}"]     = json.dumps(val, ensure_ascii=False) if val is not None else ""
-                rows.append(row)
-            df_flat = pd.DataFrame(rows, columns=cols)
-            buf = BytesIO()
-            df_flat.to_csv(buf, index=False, encoding='utf-8-sig')
-            buf.seek(0)
+    """PRO 응답과 EHR(예방접종, 투약, 청구) 데이터를 CSV, Excel, Parquet, Arrow IPC 로 다운로드
+
+    CSV/Parquet/Arrow 는 사용자 배치 단위로 만들어지는 대로 스트리밍한다. 응답이 시작된 뒤에
+    발생한 오류는 상태 코드로 알릴 수 없으므로 연결이 끊기는 것으로 나타난다.
+
+    CSV 는 layout=long 이면 레코드당 한 행으로 내보낸다 (export_stream 참고).
+    delta=true 이면 cursor 이후에 바뀐 행만 보내고 다음 요청에 쓸 커서를 X-Export-Cursor 헤더로
+    돌려준다 (export_delta 참고).
+    """
+    filters = export_stream.ehr_filters(min_age, max_age, med_codes)
+    if delta:
+        fmt = format or "ndjson"
+        if fmt not in ("ndjson", "parquet", "arrow"):
+            raise HTTPException(status_code=400, detail="delta 내보내기는 ndjson, parquet, arrow 형식만 지원합니다.")
+        try:
+            since = export_delta.decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        until = export_delta.cursor_upper_bound()
+        headers = {"X-Export-Cursor": export_delta.encode_cursor(until)}
+        if fmt == "ndjson":
             return StreamingResponse(
-                buf,
-                media_type='text/csv',
-                headers={"Content-Disposition": "attachment; filename=export.csv"},
+                iter_io(export_delta.iter_ndjson, supabase, since, until, filters),
+                media_type="application/x-ndjson",
+                headers={**headers, "Content-Disposition": "attachment; filename=export-delta.ndjson"},
             )
-
-        # Excel 출력 (4개 시트)
-        df_pro   = pd.DataFrame(pro_rows)
-        df_immun = pd.DataFrame(immun_rows)
-        df_meds  = pd.DataFrame(meds_rows)
-        df_tc    = pd.DataFrame(tc_rows)
-        buf = BytesIO()
-        with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-            df_pro.to_excel(writer, index=False, sheet_name="PRO Responses")
-            df_immun.to_excel(writer, index=False, sheet_name="Immunizations")
-            df_meds.to_excel(writer, index=False, sheet_name="MedicationDispenses")
-            df_tc.to_excel(writer, index=False, sheet_name="TreatmentClaims")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={"Content-Disposition":"attachment; filename=export.xlsx"})
+        import export_columnar
+        filename = f"export-delta.{export_columnar.FILE_EXTENSIONS[fmt]}"
+        return StreamingResponse(
+            iter_io(export_columnar.iter_columnar_delta, supabase, fmt, since, until, filters),
+            media_type=export_columnar.MEDIA_TYPES[fmt],
+            headers={**headers, "Content-Disposition": f"attachment; filename={filename}"},
+        )
+    fmt = format or ("csv" if is_csv else "xlsx")
+    if fmt == "ndjson":
+        raise HTTPException(status_code=400, detail="ndjson 형식은 delta=true 에서만 지원합니다.")
+    if fmt in ("parquet", "arrow"):
+        # pyarrow / openpyxl 은 해당 형식을 처음 요청할 때 불러온다 (앱 시작 시간에서 제외)
+        import export_columnar
+        filename = f"export.{export_columnar.FILE_EXTENSIONS[fmt]}"
+        return StreamingResponse(
+            iter_io(export_columnar.iter_columnar, supabase, fmt, filters),
+            media_type=export_columnar.MEDIA_TYPES[fmt],
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+    if fmt == "csv":
+        rows = export_stream.iter_long_csv if layout == "long" else export_stream.iter_wide_csv
+        return StreamingResponse(
+            iter_io(rows, supabase, filters),
+            media_type='text/csv',
+            headers={"Content-Disposition": "attachment; filename=export.csv"},
+        )
+    try:
+        # Excel 출력 (4개 시트): 임시 파일에 쓴 뒤 스트리밍
+        import export_excel
+        path = await run_io(export_excel.build_workbook, supabase, filters)
+        return StreamingResponse(export_excel.iter_file(path), media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={"Content-Disposition":"attachment; filename=export.xlsx"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Export 오류: {str(e)}")
 
+@app.get("/cohort-stats")
+async def get_cohort_stats(
+    min_age: Optional[int]      = Query(None, description="medication_dispenses age >= min_age"),
+    max_age: Optional[int]      = Query(None, description="medication_dispenses age <= max_age"),
+    med_codes: Optional[List[str]] = Query(None, description="filter medication_code list"),
+    age_band: Optional[int]     = Query(None, ge=1, le=100, description="나이 구간 폭 (기본 10)"),
+):
+    """코호트 집계: 약물별 조제 건수/days_supply 합, 청구 유형별 copay/benefit 합, 백신 접종률, 나이 구간 히스토그램
+
+    적재 때 갱신되는 사용자별 요약 테이블에서 집계하므로 원본 행을 내려받지 않는다.
+    필터(export-data 와 같은 의미)가 있으면 조건에 맞는 조제 이력이 있는 사용자가 코호트가 된다.
+    """
+    try:
+        return await run_io(cohort_stats.cohort_stats, supabase, min_age, max_age, med_codes, age_band)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"코호트 집계 오류: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
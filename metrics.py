@@ -0,0 +1,274 @@
+"""단계별 계측과 Prometheus /metrics 노출.
+
+외부 의존성 없이 Counter / Histogram 을 프로세스 내에 모으고 Prometheus 텍스트 형식
+(0.0.4)으로 내보낸다. 계측하는 단계:
+
+- piethon_stage_seconds{stage}: pdf_decrypt, pdf_parse, json_decode, export_serialize_<형식>
+- piethon_db_seconds{table, op}: 저장소 왕복(execute) 한 번 (instrument_storage 로 감싼 클라이언트)
+- piethon_llm_seconds{model, mode} / piethon_llm_tokens_total{model, kind}: LLM 호출 지연과 토큰 수
+- piethon_http_request_seconds{method, route, status}: 요청 전체
+
+METRICS_TIMING_HEADER=1 이면 요청 안에서 기록된 단계 시간을 Server-Timing 응답 헤더로
+돌려준다. 스트리밍 응답은 헤더를 먼저 보내므로 본문 생성 중의 단계는 헤더에 포함되지 않는다.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "0") == "1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._render_items(items)
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_items(self, items):
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [버킷별 개수..., +Inf 개수, 합계]
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[i] += 1
+            state[-1] += value
+
+    def _render_items(self, items):
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), state[:-1]):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {state[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """등록된 모든 지표를 Prometheus 텍스트 형식으로"""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("piethon_stage_seconds", "Time spent per processing stage", ["stage"])
+DB_SECONDS = Histogram("piethon_db_seconds", "Storage round trip latency", ["table", "op"])
+DB_ERRORS = Counter("piethon_db_errors_total", "Failed storage round trips", ["table", "op"])
+LLM_SECONDS = Histogram("piethon_llm_seconds", "LLM call latency", ["model", "mode"])
+LLM_TOKENS = Counter("piethon_llm_tokens_total", "LLM tokens used", ["model", "kind"])
+HTTP_SECONDS = Histogram("piethon_http_request_seconds", "HTTP request latency", ["method", "route", "status"])
+
+
+# --- 요청별 단계 시간 (Server-Timing) ---------------------------------------
+class _Breakdown:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}  # 이름 -> [합계(초), 횟수]
+
+    def add(self, name, seconds):
+        with self._lock:
+            acc = self.stages.setdefault(name, [0.0, 0])
+            acc[0] += seconds
+            acc[1] += 1
+
+    def header(self, total) -> str:
+        with self._lock:
+            parts = [f'{name};dur={s * 1000:.2f};desc="x{n}"' for name, (s, n) in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_breakdown = contextvars.ContextVar("metrics_breakdown", default=None)
+
+
+def _note(name, seconds):
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.add(name, seconds)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    _note(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """with 블록의 실행 시간을 stage 로 기록"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_llm(model, mode, seconds, usage=None):
+    """LLM 호출 한 번의 지연과 (있으면) usage 의 토큰 수를 기록"""
+    LLM_SECONDS.observe(seconds, model=model, mode=mode)
+    _note(f"llm_{mode}", seconds)
+    if usage is not None:
+        LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+        LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+
+
+# --- 저장소 계측 ------------------------------------------------------------
+_OPS = ("select", "insert", "upsert", "update", "delete")
+
+
+class _InstrumentedQuery:
+    """쿼리 빌더를 감싸 execute() 한 번을 (table, op) 왕복으로 기록한다"""
+
+    __slots__ = ("_query", "_table", "_op")
+
+    def __init__(self, query, table, op="select"):
+        self._query = query
+        self._table = table
+        self._op = op
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if not callable(attr):
+            # postgrest 의 not_ 처럼 속성으로 빌더를 돌려주는 경우
+            return _InstrumentedQuery(attr, self._table, self._op) if hasattr(attr, "execute") else attr
+        op = name if name in _OPS else self._op
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _InstrumentedQuery(result, self._table, op) if hasattr(result, "execute") else result
+        return call
+
+    def execute(self):
+        start = time.perf_counter()
+        try:
+            return self._query.execute()
+        except Exception:
+            DB_ERRORS.inc(table=self._table, op=self._op)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            DB_SECONDS.observe(seconds, table=self._table, op=self._op)
+            _note(f"db_{self._op}_{self._table}", seconds)
+
+
+class InstrumentedStorage:
+    """저장소 클라이언트의 table() 과 rpc() 를 계측하고 나머지 속성은 그대로 넘긴다.
+
+    rpc 는 클라이언트에 있을 때만 노출한다 (getattr 로 지원 여부를 확인하는 코드가 있으므로).
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return _InstrumentedQuery(self._client.table(name), name)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == "rpc":
+            return lambda fn, params=None: _InstrumentedQuery(attr(fn, params or {}), fn, "rpc")
+        return attr
+
+
+def instrument_storage(client):
+    return InstrumentedStorage(client)
+
+
+# --- HTTP 미들웨어 ----------------------------------------------------------
+class MetricsMiddleware:
+    """요청 지연을 라우트 템플릿별로 기록하고, 켜져 있으면 Server-Timing 헤더를 붙이는 ASGI 미들웨어"""
+
+    def __init__(self, app, timing_header: bool = None):
+        self.app = app
+        self.timing_header = METRICS_TIMING_HEADER if timing_header is None else timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        breakdown = _Breakdown()
+        token = _breakdown.set(breakdown)
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.timing_header:
+                    header = breakdown.header(time.perf_counter() - start)
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _breakdown.reset(token)
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
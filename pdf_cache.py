@@ -0,0 +1,140 @@
+"""/extract 결과(페이지별 텍스트) 캐시.
+
+같은 비밀번호 PDF 를 다시 올리면 복호화와 파싱 없이 저장된 텍스트를 돌려준다.
+키는 파일 바이트의 SHA-256 과 비밀번호의 HMAC-SHA256 을 묶은 해시다. HMAC 키는 프로세스마다
+새로 만드는 난수라 키만으로는 비밀번호를 대입해 볼 수 없고, 비밀번호 원문은 어디에도 저장하지 않는다.
+비밀번호가 틀리면 키가 달라 캐시를 거치지 않고 복호화 단계에서 그대로 실패한다.
+
+메모리 LRU 이며 저장된 텍스트의 총 크기(UTF-8 바이트)가 PDF_CACHE_MAX_BYTES 를 넘으면 오래된
+항목부터 지운다. 한 항목이 한도보다 크면 저장하지 않는다. 0 이면 비활성화된다.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import metrics
+
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_PASSWORD_KEY = secrets.token_bytes(32)
+
+
+def cache_key(buffer, password: str) -> str:
+    """PDF 바이트(bytes 또는 mmap)와 비밀번호로 캐시 키 생성"""
+    with metrics.timed("pdf_hash"):
+        digest = hashlib.sha256(buffer).hexdigest()
+    secret = hmac.new(_PASSWORD_KEY, password.encode("utf-8"), hashlib.sha256).hexdigest()
+    return hashlib.sha256(f"{digest}:{secret}".encode()).hexdigest()
+
+
+def _size(pages) -> int:
+    return sum(len(text.encode("utf-8")) for text in pages)
+
+
+class PdfTextCache:
+    """키 -> 페이지 텍스트 목록. 총 바이트 수 기준 LRU (스레드 안전)"""
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()  # key -> (페이지 목록, 바이트 수)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> asyncio.Task (같은 파일 동시 추출 방지)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[list]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, pages: list):
+        if not self.enabled:
+            return
+        size = _size(pages)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (pages, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    async def get_or_create(self, key: str, factory, release=None) -> tuple:
+        """(페이지 목록, 캐시 적중 여부). 없으면 factory() 코루틴으로 만들어 저장한다.
+
+        같은 키를 동시에 요청하면 한 번만 추출하고 나머지는 그 결과를 기다린다.
+        추출은 별도 태스크로 실행하므로 처음 요청한 쪽이 취소되어도 기다리던 요청은 결과를 받는다.
+        release 는 factory 가 쓰는 자원(업로드 임시 파일 등)을 정리하는 함수로, 이 호출이 추출을
+        시작했으면 추출 태스크가 끝날 때, 아니면(캐시 적중, 다른 요청의 추출을 기다림) 돌아가기 전에 부른다.
+        """
+        started = False
+        try:
+            pages = self.get(key)
+            if pages is not None:
+                return pages, True
+            pending = self._inflight.get(key)
+            if pending is not None:
+                return await asyncio.shield(pending), True
+            task = asyncio.ensure_future(self._create(key, factory, release))
+            started = True
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            return await asyncio.shield(task), False
+        finally:
+            if release is not None and not started:
+                release()
+
+    async def _create(self, key: str, factory, release) -> list:
+        try:
+            pages = await factory()
+        finally:
+            if release is not None:
+                release()
+        self.set(key, pages)
+        return pages
+
+    def _finish(self, key: str, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 기다리는 요청이 없을 때 "exception was never retrieved" 경고 방지
+        if not task.cancelled():
+            task.exception()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,123 @@
+"""PDF 텍스트 추출: 페이지 구간을 프로세스 풀에 나눠 병렬로 처리한다.
+
+PyPDF2 의 페이지 파싱은 CPU 작업이라 이벤트 루프 스레드나 I/O 스레드에서 돌리면
+다른 요청까지 느려진다. 페이지 수가 적으면 프로세스 간 전송 비용이 더 크므로
+I/O 스레드에서 바로 처리하고, 많으면 구간(chunk) 단위로 워커 프로세스에 분배한다.
+"""
+import asyncio
+import io
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+from clients import run_io
+
+# 페이지 추출용 워커 프로세스 수
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# 이 페이지 수 미만이면 프로세스 풀을 쓰지 않는다
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+
+_pool = None
+
+
+class PDFPasswordError(Exception):
+    """암호화된 PDF 의 비밀번호가 틀린 경우"""
+
+
+def _reader(stream, password):
+    # PyPDF2 는 /extract 를 처음 처리할 때 불러온다 (앱 시작 시간에서 제외)
+    from PyPDF2 import PdfReader
+    reader = PdfReader(stream)
+    if reader.is_encrypted and reader.decrypt(password) == 0:
+        raise PDFPasswordError("비밀번호가 올바르지 않습니다.")
+    return reader
+
+
+@contextmanager
+def _open(source, password):
+    """source 는 PDF 바이트 또는 파일 경로. 파일은 통째로 읽지 않고 mmap 으로 연다"""
+    if isinstance(source, (bytes, bytearray)):
+        yield _reader(io.BytesIO(source), password)
+        return
+    with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield _reader(mm, password)
+
+
+def page_count(source, password) -> int:
+    """비밀번호를 검증하고 페이지 수를 돌려준다 (문서 열기와 복호화를 pdf_decrypt 로 기록)"""
+    with metrics.timed("pdf_decrypt"), _open(source, password) as reader:
+        return len(reader.pages)
+
+
+def extract_range(source, password, start: int, stop: int) -> list:
+    """[start, stop) 구간 페이지의 텍스트 목록 (워커 프로세스에서 실행)"""
+    with _open(source, password) as reader:
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _get_pool(workers):
+    global _pool
+    if _pool is None or _pool._max_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        # I/O 스레드가 떠 있는 프로세스를 fork 하지 않도록 spawn 사용
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _ranges(pages: int, workers: int):
+    size = -(-pages // workers)
+    return [(start, min(start + size, pages)) for start in range(0, pages, size)]
+
+
+async def iter_pages(source, password, workers=None):
+    """페이지 텍스트를 페이지 순서대로 내보낸다. 앞 구간이 끝나는 대로 바로 전달된다.
+
+    비밀번호가 틀리면 첫 항목을 내보내기 전에 PDFPasswordError 를 던진다.
+    """
+    workers = workers or PDF_WORKERS
+    pages = await run_io(page_count, source, password)
+    if workers <= 1 or pages < PDF_PARALLEL_MIN_PAGES:
+        with metrics.timed("pdf_parse"):
+            texts = await run_io(extract_range, source, password, 0, pages)
+        for text in texts:
+            yield text
+        return
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool(workers)
+    # 첫 페이지가 빨리 도착하도록 워커 수의 두 배로 잘게 나눈다
+    futures = [
+        loop.run_in_executor(pool, extract_range, source, password, start, stop)
+        for start, stop in _ranges(pages, workers * 2)
+    ]
+    # 워커 프로세스의 지표는 모이지 않으므로 구간 결과를 기다린 시간을 pdf_parse 로 기록한다
+    try:
+        for future in futures:
+            with metrics.timed("pdf_parse"):
+                texts = await future
+            for text in texts:
+                yield text
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+async def extract_pages(source, password, workers=None) -> list:
+    """전체 페이지 텍스트 목록 (페이지 순서)"""
+    return [text async for text in iter_pages(source, password, workers)]
+
+
+async def extract_text(source, password, workers=None) -> str:
+    """전체 페이지 텍스트를 페이지 순서대로 한 번에 이어 붙여 돌려준다"""
+    return "".join(await extract_pages(source, password, workers))
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,303 @@
+"""여러 사용자의 건강 보고서 일괄 생성.
+
+POST /health-report/batch 는 name_hash 목록(저장된 fhir_resources 사용)이나 업로드된 번들을
+받아 작업 ID 를 바로 돌려준다. 모든 배치 작업이 공유하는 워커 REPORT_BATCH_CONCURRENCY 개가
+큐에서 항목을 하나씩 꺼내 처리하므로, 코호트 전체 시간은 사용자 수가 아니라
+(사용자 수 / 동시성) x 보고서 한 건 시간에 비례한다.
+
+LLM 호출 전에는 분당 요청 수(REPORT_BATCH_RPM)와 분당 토큰 수(REPORT_BATCH_TPM) 토큰 버킷을
+통과해야 한다. 토큰은 프롬프트 추정치 + REPORT_BATCH_COMPLETION_TOKENS 로 미리 빼고, 응답의
+usage 로 보정한다. 일시적 오류(429, 5xx, 연결/타임아웃)는 지수 백오프(+지터, Retry-After 우선)로
+최대 REPORT_BATCH_MAX_RETRIES 번 재시도한다.
+
+대기 중인 항목(업로드 번들은 원문 텍스트를 들고 있다)은 REPORT_BATCH_QUEUE_DEPTH 개까지만 받고,
+넘치면 submit 이 QueueFullError 를 던져 클라이언트에게 재시도를 요청한다(backpressure).
+
+결과(항목별 보고서/오류)는 작업 저장소(ingest_jobs.JobStore)에 남아 GET 으로 조회하고,
+생성된 보고서는 보고서 캐시에도 넣어 같은 입력의 /health-report 요청이 재사용한다.
+기본 저장소(MemoryJobStore)는 프로세스 메모리에만 있으므로 작업 상태와 결과는 재시작하면
+사라지고, 워커 프로세스가 여럿이면 작업을 제출한 프로세스에서만 조회된다. 여러 워커로 띄울 때는
+공유 JobStore 를 넘기거나, 조회를 제출한 프로세스로 보내야 한다.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from collections import Counter
+
+from clients import run_io
+from ingest_jobs import MemoryJobStore, QueueFullError
+from report_mapreduce import count_tokens
+
+logger = logging.getLogger(__name__)
+
+REPORT_BATCH_CONCURRENCY = int(os.getenv("REPORT_BATCH_CONCURRENCY", "4"))
+# 대기 중인 항목 수 상한 (모든 배치 작업 합계)
+REPORT_BATCH_QUEUE_DEPTH = int(os.getenv("REPORT_BATCH_QUEUE_DEPTH", "1000"))
+# 0 이면 제한 없음
+REPORT_BATCH_RPM = int(os.getenv("REPORT_BATCH_RPM", "500"))
+REPORT_BATCH_TPM = int(os.getenv("REPORT_BATCH_TPM", "200000"))
+# 호출 전 토큰 버킷에서 미리 빼는 응답 토큰 추정치 (추론 토큰 포함)
+REPORT_BATCH_COMPLETION_TOKENS = int(os.getenv("REPORT_BATCH_COMPLETION_TOKENS", "4000"))
+REPORT_BATCH_MAX_RETRIES = int(os.getenv("REPORT_BATCH_MAX_RETRIES", "5"))
+REPORT_BATCH_BACKOFF_BASE = float(os.getenv("REPORT_BATCH_BACKOFF_BASE", "1.0"))
+REPORT_BATCH_BACKOFF_MAX = float(os.getenv("REPORT_BATCH_BACKOFF_MAX", "60"))
+
+
+class RateLimiter:
+    """분당 요청 수(rpm)와 분당 토큰 수(tpm) 토큰 버킷 (0 이면 해당 제한 없음).
+
+    acquire 는 도착 순서대로 대기하므로 큰 요청이 작은 요청들에 밀려 굶지 않는다.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int):
+        # 버킷보다 큰 요청은 버킷이 가득 찼을 때 보낸다
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = (1 - self._requests) * 60 / self.rpm
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if wait <= 0:
+                    break
+                self.waited += wait
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self._requests -= 1
+            self._tokens -= tokens
+
+    def settle(self, estimated: int, actual):
+        """호출 후 실제 토큰 사용량으로 보정 (추정보다 많이 썼으면 더 빼고, 적으면 돌려준다)"""
+        if self.tpm and actual:
+            self._refill()
+            self._tokens = min(self.tpm, self._tokens - (actual - min(estimated, self.tpm)))
+
+
+def is_transient(error) -> bool:
+    """재시도하면 성공할 수 있는 LLM 오류인지 (429 는 할당량 소진이 아닐 때만)"""
+    import openai
+    if isinstance(error, openai.APIConnectionError):  # APITimeoutError 포함
+        return True
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return getattr(error, "code", None) != "insufficient_quota"
+    return status in (408, 409) or (status is not None and status >= 500)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error=None) -> float:
+    """attempt(1부터) 번째 재시도 전 대기 시간: Retry-After 가 있으면 그 값, 없으면 full jitter 지수 백오프"""
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return min(retry_after, REPORT_BATCH_BACKOFF_MAX)
+    return random.uniform(0, min(REPORT_BATCH_BACKOFF_MAX, REPORT_BATCH_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+class BatchItem:
+    """배치 작업의 사용자(또는 업로드 번들) 하나"""
+
+    def __init__(self, label, name_hash=None, text=None):
+        self.label = label
+        self.name_hash = name_hash
+        self.text = text
+        self.status = "queued"
+        self.attempts = 0
+        self.cached = False
+        self.report = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self, report: bool = True) -> dict:
+        out = {
+            "label": self.label,
+            "name_hash": self.name_hash,
+            "status": self.status,
+            "attempts": self.attempts,
+            "cached": self.cached,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if report:
+            out["report"] = self.report
+        return out
+
+
+class ReportBatchJob:
+    def __init__(self, items, digest=True, refresh=False):
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.digest = digest
+        self.refresh = refresh
+        self.remaining = len(items)
+        self.status = "queued" if items else "done"
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None if items else self.queued_at
+
+    def to_dict(self, reports: bool = True) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": len(self.items),
+            "counts": dict(Counter(item.status for item in self.items)),
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "items": [item.to_dict(reports) for item in self.items],
+        }
+
+
+class ReportBatchRunner:
+    """배치 항목을 처리하는 워커 풀 (모든 작업이 워커와 레이트 리미터를 공유).
+
+    prepare(item, digest) 는 (캐시 키, LLM messages) 를, complete(messages) 는 (보고서, usage) 를
+    돌려주는 블로킹 함수다. cache 가 있으면 refresh 가 아닌 항목은 캐시를 먼저 확인한다.
+    """
+
+    def __init__(self, prepare, complete, cache=None, store=None, concurrency: int = None,
+                 limiter: RateLimiter = None, max_retries: int = None, max_depth: int = None):
+        self.prepare = prepare
+        self.complete = complete
+        self.cache = cache
+        self.store = store or MemoryJobStore()
+        self.concurrency = concurrency or REPORT_BATCH_CONCURRENCY
+        self.limiter = limiter or RateLimiter(REPORT_BATCH_RPM, REPORT_BATCH_TPM)
+        self.max_retries = REPORT_BATCH_MAX_RETRIES if max_retries is None else max_retries
+        self.max_depth = REPORT_BATCH_QUEUE_DEPTH if max_depth is None else max_depth
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self.reports = 0
+        self.failures = 0
+        self.retries = 0
+        self.cache_hits = 0
+
+    def check_room(self, count: int):
+        """항목 count 개를 더 넣을 수 없으면 QueueFullError"""
+        if self._queue.qsize() + count > self.max_depth:
+            raise QueueFullError("보고서 일괄 생성 대기열이 가득 찼습니다.")
+
+    def submit(self, items, digest: bool = True, refresh: bool = False) -> ReportBatchJob:
+        """작업의 항목을 모두 큐에 넣는다. 자리가 모자라면 아무것도 넣지 않고 QueueFullError"""
+        self.check_room(len(items))
+        job = ReportBatchJob(items, digest, refresh)
+        self.store.save(job)
+        for item in items:
+            self._queue.put_nowait((job, item))
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while True:
+            job, item = await self._queue.get()
+            if job.started_at is None:
+                job.status = "running"
+                job.started_at = time.time()
+            item.status = "running"
+            item.started_at = time.time()
+            try:
+                item.report = await self._generate(job, item)
+                item.status = "done"
+                self.reports += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("보고서 일괄 생성 항목 %s 실패: %s", item.label, e)
+                item.status = "failed"
+                item.error = str(getattr(e, "detail", None) or e)
+                self.failures += 1
+            item.finished_at = time.time()
+            item.text = None
+            job.remaining -= 1
+            if job.remaining == 0:
+                job.status = "done"
+                job.finished_at = item.finished_at
+            self.store.save(job)
+
+    def _prepare(self, item, digest: bool):
+        """(캐시 키, messages, 추정 토큰 수). 프롬프트 토큰 계산도 블로킹이므로 I/O 스레드에서 한다"""
+        key, messages = self.prepare(item, digest)
+        estimated = sum(count_tokens(m["content"]) for m in messages) + REPORT_BATCH_COMPLETION_TOKENS
+        return key, messages, estimated
+
+    async def _generate(self, job, item):
+        key, messages, estimated = await run_io(self._prepare, item, job.digest)
+        if self.cache is not None and not job.refresh:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                item.cached = True
+                self.cache_hits += 1
+                return cached
+
+        while True:
+            item.attempts += 1
+            await self.limiter.acquire(estimated)
+            try:
+                report, usage = await run_io(self.complete, messages)
+            except Exception as e:
+                if not is_transient(e) or item.attempts > self.max_retries:
+                    raise
+                self.retries += 1
+                item.status = "retrying"
+                await asyncio.sleep(backoff_delay(item.attempts, e))
+                item.status = "running"
+                continue
+            self.limiter.settle(estimated, getattr(usage, "total_tokens", None))
+            if self.cache is not None:
+                await self.cache.aset(key, report)
+            return report
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "workers": len(self._tasks),
+            "reports": self.reports,
+            "failures": self.failures,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "rate_limit_wait_seconds": round(self.limiter.waited, 3),
+        }
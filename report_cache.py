@@ -0,0 +1,268 @@
+"""생성된 건강 보고서 캐시.
+
+키는 정규화된 FHIR 입력, 프롬프트 템플릿 버전, 분석 기준일 등을 묶은 해시이며
+(`make_key`), 메모리 LRU 계층과 선택적인 디스크 계층을 TTL 과 함께 사용한다.
+디스크 계층은 파일 크기 합이 max_disk_bytes 를 넘으면 오래 쓰지 않은 파일부터 지운다.
+
+get/set 은 디스크 계층의 파일 I/O 를 하는 블로킹 함수이므로 이벤트 루프에서는 aget/aset 을 쓴다.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from clients import run_io
+
+
+def content_hash(text: str) -> str:
+    """저장된 FHIR 텍스트 하나의 정규화 해시 (fhir/ 디렉터리 인덱스).
+
+    JSON 이면 키 정렬·공백 제거한 형태로 직렬화해서 해시하므로 들여쓰기나
+    키 순서만 다른 파일은 같은 해시가 된다.
+    """
+    try:
+        normalized = json.dumps(json.loads(text), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        normalized = text.strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def bytes_hash(data) -> str:
+    """업로드 원본 바이트(bytes 또는 mmap)의 해시.
+
+    디코딩이나 JSON 파싱 없이 만들 수 있어 업로드의 캐시 키에 쓴다 (content_hash 와 달리
+    공백이나 키 순서만 다른 파일은 다른 해시가 된다).
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_key(source_hashes, **params) -> str:
+    """입력 해시 목록(순서 무관)과 프롬프트 버전·기준일 등의 파라미터로 캐시 키 생성"""
+    payload = json.dumps({"inputs": sorted(source_hashes), **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """LRU 메모리 계층 + 선택적 디스크 계층, TTL 만료, 적중/실패 카운터"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 86400, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._mem = OrderedDict()  # key -> (만료 시각, 보고서)
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> asyncio.Task (동일 키 동시 생성 방지)
+        self._disk = None  # key -> 파일 크기 (오래 쓰지 않은 순서). 처음 디스크를 쓸 때 디렉터리를 훑어 만든다
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    # --- 디스크 계층 ----------------------------------------------------
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_index(self):
+        """디스크 항목 목록 (self._lock 안에서 호출). 이전 프로세스가 남긴 파일은 수정 시각 순으로 넣는다"""
+        if self._disk is None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            found = []
+            for root, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    if name.endswith(".json"):
+                        try:
+                            st = os.stat(os.path.join(root, name))
+                        except OSError:
+                            continue
+                        found.append((st.st_mtime, name[:-5], st.st_size))
+            self._disk = OrderedDict((key, size) for _, key, size in sorted(found))
+            self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+    def _disk_forget(self, key):
+        size = self._disk_index().pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _disk_remove(self, key):
+        with self._lock:
+            self._disk_forget(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires", 0) <= time.time():
+            self._disk_remove(key)
+            return None
+        with self._lock:
+            if key in self._disk_index():
+                self._disk.move_to_end(key)
+        return entry
+
+    def _disk_set(self, key, expires, report):
+        data = json.dumps({"expires": expires, "report": report}, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_forget(key)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            evicted = []
+            while self._disk_bytes > self.max_disk_bytes:
+                old, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    # --- 조회/저장 ------------------------------------------------------
+    def _mem_get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._mem[key]
+                self.evictions += 1
+            if not self.disk_dir:
+                self.misses += 1
+        return None
+
+    def _disk_lookup(self, key: str) -> Optional[str]:
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._put_mem(key, entry["expires"], entry["report"])
+        return entry["report"]
+
+    def get(self, key: str) -> Optional[str]:
+        """블로킹 조회 (디스크 계층 포함). 이벤트 루프에서는 aget"""
+        report = self._mem_get(key)
+        if report is None and self.disk_dir:
+            report = self._disk_lookup(key)
+        return report
+
+    async def aget(self, key: str) -> Optional[str]:
+        """메모리 계층은 바로, 디스크 계층은 I/O 스레드에서 조회한다"""
+        report = self._mem_get(key)
+        if report is None and self.disk_dir:
+            report = await run_io(self._disk_lookup, key)
+        return report
+
+    def _put_mem(self, key, expires, report):
+        self._mem[key] = (expires, report)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key: str, report: str):
+        """블로킹 저장 (디스크 계층 포함). 이벤트 루프에서는 aset"""
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._put_mem(key, expires, report)
+        if self.disk_dir:
+            self._disk_set(key, expires, report)
+
+    async def aset(self, key: str, report: str):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._put_mem(key, expires, report)
+        if self.disk_dir:
+            await run_io(self._disk_set, key, expires, report)
+
+    async def get_or_create(self, key: str, factory, release=None):
+        """캐시에 없으면 factory() 코루틴으로 생성해 저장. 같은 키의 동시 요청은 한 번만 생성한다.
+
+        생성은 별도 태스크로 실행하므로 처음 요청한 쪽이 취소되어도 기다리던 요청은 결과를 받는다.
+        release 는 factory 가 쓰는 자원(업로드 임시 파일 등)을 정리하는 함수로, 이 호출이 생성을
+        시작했으면 생성 태스크가 끝날 때, 아니면 돌아가기 전에 부른다 (pdf_cache 와 같은 규칙).
+        """
+        started = False
+        try:
+            report = await self.aget(key)
+            if report is not None:
+                return report
+            pending = self._inflight.get(key)
+            if pending is not None:
+                return await asyncio.shield(pending)
+            task = asyncio.ensure_future(self._create(key, factory, release))
+            started = True
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            return await asyncio.shield(task)
+        finally:
+            if release is not None and not started:
+                release()
+
+    async def _create(self, key: str, factory, release):
+        try:
+            report = await factory()
+        finally:
+            if release is not None:
+                release()
+        await self.aset(key, report)
+        return report
+
+    def _finish(self, key: str, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 기다리는 요청이 없을 때 "exception was never retrieved" 경고 방지
+        if not task.cancelled():
+            task.exception()
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._mem),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk_dir": self.disk_dir,
+                "disk_entries": len(self._disk) if self._disk is not None else None,
+                "disk_bytes": self._disk_bytes if self._disk is not None else None,
+                "max_disk_bytes": self.max_disk_bytes,
+                "disk_evictions": self.disk_evictions,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
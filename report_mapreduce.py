@@ -0,0 +1,207 @@
+"""큰(또는 여러 개의) FHIR 입력을 위한 map-reduce 건강 보고서 생성.
+
+원본 JSON 전체를 하나의 프롬프트에 붙이는 대신 입력을 청크로 나눈다: 파일 하나가 토큰 예산
+(REPORT_CHUNK_TOKENS) 안에 들어가면 파일 단위로, 넘으면 리소스를 날짜(월) 순으로 묶어 예산에
+맞게 나눈다. 청크마다 사실 요약(map)을 동시에(최대 REPORT_MAP_CONCURRENCY 개) 만들고,
+요약들을 모아 마지막 호출(reduce)에서 표준 보고서 템플릿으로 작성한다. 요약을 합친 것도
+예산을 넘으면 요약끼리 다시 합치는 중간 단계를 거친다.
+
+청크 예산은 map 프롬프트(지시문)를 붙인 전체가 REPORT_CHUNK_TOKENS 안에 들도록 지시문 토큰을 뺀
+값이다. 모든 단계는 한 사람의 데이터라고 가정하므로 여러 환자의 입력을 함께 넘기면 안 된다.
+
+LLM 호출은 complete(messages, mode) 블로킹 함수로 주입받는다 (main 의 클라이언트/계측 사용).
+토큰 수는 tiktoken 이 있으면 o200k_base 로 세고, 없으면 글자 수로 보수적으로 추정한다.
+"""
+import asyncio
+import functools
+import hashlib
+import os
+
+import fast_json
+import fhir_summary
+from clients import run_io
+
+# 청크 하나(프롬프트 본문)의 최대 토큰 수
+REPORT_CHUNK_TOKENS = int(os.getenv("REPORT_CHUNK_TOKENS", "30000"))
+# 동시에 실행하는 map 호출 수
+REPORT_MAP_CONCURRENCY = int(os.getenv("REPORT_MAP_CONCURRENCY", "4"))
+# tiktoken 이 없을 때 토큰 하나에 해당한다고 보는 글자 수 (한글이 많은 JSON 기준으로 보수적으로)
+_CHARS_PER_TOKEN = 2
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    """tiktoken 인코딩. 처음 토큰을 셀 때 한 번만 불러온다 (인코딩 파일 다운로드가 임포트를 막지 않게)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # 미설치 또는 인코딩 파일을 받을 수 없는 환경
+        return None
+
+MAP_PROMPT = """
+당신은 FHIR 의료 데이터 분석 전문가입니다.
+다음은 한 사람의 FHIR 데이터 중 일부({label}, {window})입니다. 나중에 다른 부분의 요약과 합쳐
+건강 관리 프로필을 작성할 수 있도록, 아래 항목의 사실만 빠짐없이 간결하게 정리해주세요.
+추측이나 해석은 쓰지 마세요.
+
+- 인적 정보: 생년월일/성별(주민등록번호로 추정 가능한 경우)
+- 약물: 약물명별 처방 횟수, 처방 날짜 목록, 총 처방 일수
+- 약국/의료기관: 기관명별 이용 횟수
+- 진료/청구: 날짜, 유형, 본인부담금/공단부담금
+- 예방접종: 백신명, 접종일, 차수
+
+=== FHIR 데이터 ===\n"""
+
+COMBINE_PROMPT = """
+다음은 같은 사람의 FHIR 데이터를 부분별로 정리한 요약들입니다. 같은 약물/기관/백신의 횟수와
+일수는 합산하고 날짜 목록은 합쳐서, 같은 항목 구성의 요약 하나로 정리해주세요.
+
+=== 부분 요약 ===\n"""
+
+REDUCE_PROMPT = """
+당신은 FHIR 의료 데이터 분석 전문가입니다.
+다음은 개인 의료 데이터(FHIR)를 부분별로 나눠 정리한 요약입니다. 같은 약물의 처방 횟수와 복용
+일수는 부분 요약들을 합산하여 사용하고, 흥미로운 건강 관리 프로필을 작성해주세요.
+
+=== 부분 요약 ===\n"""
+
+# 프롬프트나 청크 예산이 바뀌면 map-reduce 보고서의 캐시 키가 달라지도록 (main._report_cache_key)
+PROMPT_VERSION = hashlib.sha256(
+    "\0".join([MAP_PROMPT, COMBINE_PROMPT, REDUCE_PROMPT, str(REPORT_CHUNK_TOKENS)]).encode("utf-8")
+).hexdigest()[:16]
+
+# map 프롬프트 지시문 토큰을 셀 때 쓰는 가장 긴 형태의 기간 표시
+_LONGEST_WINDOW = "0000-00 ~ 0000-00 및 날짜 없는 리소스"
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // _CHARS_PER_TOKEN)
+
+
+# 리소스 날짜로 쓸 필드 (앞에서부터 처음 값이 있는 것)
+_DATE_FIELDS = ("whenPrepared", "whenHandedOver", "occurrenceDateTime", "effectiveDateTime",
+                "recordedDate", "created", "date", "issued")
+
+
+def _resource_month(res) -> str:
+    for field in _DATE_FIELDS:
+        value = res.get(field)
+        if isinstance(value, str) and len(value) >= 7:
+            return value[:7]
+    for field in ("billablePeriod", "period"):
+        start = (res.get(field) or {}).get("start")
+        if isinstance(start, str) and len(start) >= 7:
+            return start[:7]
+    return ""
+
+
+def _dump(resources) -> str:
+    return fast_json.dumps(resources)
+
+
+def _window(months) -> str:
+    dated = sorted(m for m in months if m)
+    if not dated:
+        return "날짜 없음"
+    span = dated[0] if dated[0] == dated[-1] else f"{dated[0]} ~ {dated[-1]}"
+    return span + (" 및 날짜 없는 리소스" if "" in months else "")
+
+
+def split_chunks(label: str, text: str, budget: int = None) -> list:
+    """(label, window, 청크 텍스트) 목록. 예산 안이면 파일 전체가 청크 하나다.
+
+    예산을 넘으면 리소스를 월 순으로 정렬해 앞에서부터 예산이 찰 때까지 묶는다.
+    리소스 하나가 예산보다 크면 그 리소스만 단독 청크가 된다.
+    """
+    budget = budget or REPORT_CHUNK_TOKENS
+    if count_tokens(text) <= budget:
+        return [(label, "전체", text)]
+    resources = list(fhir_summary.iter_resources(fast_json.loads(text)))
+    resources.sort(key=_resource_month)
+
+    chunks = []
+    current, months, used = [], set(), 2  # 2: 배열 괄호
+    for res in resources:
+        size = count_tokens(_dump(res)) + 1
+        if current and used + size > budget:
+            chunks.append((label, _window(months), _dump(current)))
+            current, months, used = [], set(), 2
+        current.append(res)
+        months.add(_resource_month(res))
+        used += size
+    if current:
+        chunks.append((label, _window(months), _dump(current)))
+    return chunks
+
+
+def _pack(notes, budget):
+    """요약 목록을 예산 안의 묶음들로 나눈다"""
+    groups, current, used = [], [], 0
+    for note in notes:
+        size = count_tokens(note)
+        if current and used + size > budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(note)
+        used += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def _bounded(coros, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+def _map_budget(label, budget):
+    """map 프롬프트 지시문을 뺀 청크 본문 예산 (최소 1)"""
+    return max(budget - count_tokens(MAP_PROMPT.format(label=label, window=_LONGEST_WINDOW)), 1)
+
+
+def _split_source(label, load, budget):
+    return split_chunks(label, load(), _map_budget(label, budget))
+
+
+async def build_reduce_prompt(sources, complete, budget: int = None, concurrency: int = None) -> str:
+    """sources[(label, 로더)] 를 map(+ 필요하면 combine) 한 뒤 reduce 프롬프트를 돌려준다.
+
+    로더는 파일 텍스트를 돌려주는 함수이고, 파일은 한 번에 하나씩 읽어 청크로 나눈다.
+    complete(messages, mode) 는 LLM 호출 결과 텍스트를 돌려주는 블로킹 함수다.
+    """
+    budget = budget or REPORT_CHUNK_TOKENS
+    concurrency = concurrency or REPORT_MAP_CONCURRENCY
+
+    chunks = []
+    for label, load in sources:
+        chunks += await run_io(_split_source, label, load, budget)
+
+    def summarize_chunk(label, window, text):
+        prompt = MAP_PROMPT.format(label=label, window=window) + text
+        return complete([{"role": "user", "content": prompt}], "map")
+
+    notes = await _bounded(
+        [run_io(summarize_chunk, label, window, text) for label, window, text in chunks], concurrency)
+    notes = [f"[{label} / {window}]\n{note}" for (label, window, _), note in zip(chunks, notes)]
+
+    # 요약을 합친 것이 (reduce 지시문을 빼고) 예산을 넘으면 요약끼리 합치는 단계를 반복
+    reduce_budget = max(budget - count_tokens(REDUCE_PROMPT), 1)
+    combine_budget = max(budget - count_tokens(COMBINE_PROMPT), 1)
+    while len(notes) > 1 and count_tokens("\n\n".join(notes)) > reduce_budget:
+        groups = _pack(notes, combine_budget)
+        if len(groups) == len(notes):
+            break  # 요약 하나하나가 이미 예산 크기: 더 줄일 수 없음
+        notes = await _bounded(
+            [run_io(complete, [{"role": "user", "content": COMBINE_PROMPT + "\n\n".join(g)}], "combine")
+             for g in groups],
+            concurrency,
+        )
+    return REDUCE_PROMPT + "\n\n".join(notes)
@@ -0,0 +1,68 @@
+"""Supabase 스키마 확인.
+
+Supabase(Postgres) 스키마 변경은 supabase/migrations/ 의 SQL 파일로 관리한다. 파일 이름 앞의
+시각이 버전이며, 배포할 때 앱을 띄우기 전에 `supabase db push` 로 (CLI 를 쓰지 않으면 psql 로
+파일 이름 순서대로) 적용한다. 모든 파일은 여러 번 실행해도 되도록 if not exists / or replace 로
+작성한다. SQLite 백엔드는 storage_sqlite 가 연결할 때 같은 컬럼을 만든다.
+
+앱 시작 시 check() 가 코드가 쓰는 컬럼과 rpc 함수가 있는지 확인하고, 빠진 것이 있으면 적용할
+마이그레이션 파일을 알려주는 RuntimeError 로 시작을 막는다 (요청 처리 중 500 으로 드러나지 않게).
+저장소에 연결하지 못하는 등 다른 오류는 경고만 남기고 넘어간다.
+"""
+import logging
+import os
+
+import cohort_stats
+import export_delta
+
+logger = logging.getLogger("piethon")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "supabase", "migrations")
+
+# (마이그레이션 파일, 테이블, 컬럼)
+REQUIRED_COLUMNS = [
+    ("20261018062414_cohort_summaries.sql", table, "id,user_id") for table in cohort_stats.SUMMARY_TABLES
+] + [
+    ("20261018064414_export_delta_change_seq.sql", table, "id,change_seq") for table in export_delta.CHANGE_TABLES
+] + [
+    ("20261018071444_cohort_summary_refresh.sql", "users", "id,summary_dirty"),
+]
+# (마이그레이션 파일, 함수, 아무것도 바꾸지 않는 확인용 인자)
+REQUIRED_FUNCTIONS = [
+    ("20261018071444_cohort_summary_refresh.sql", "refresh_cohort_summaries", {"user_ids": []}),
+    # 빈 나이 범위: 요약 테이블을 훑지 않는다
+    ("20261018071444_cohort_summary_refresh.sql", "cohort_stats_summary",
+     {"p_min_age": 1, "p_max_age": 0, "p_med_names": None, "p_age_band": cohort_stats.COHORT_AGE_BAND}),
+]
+
+# PostgREST/Postgres 의 "없는 컬럼/테이블/함수" 오류 코드
+_MISSING_CODES = {"42703", "42P01", "42883", "PGRST202", "PGRST204", "PGRST205"}
+
+
+def _probe(migration, run, what, missing):
+    try:
+        run().execute()
+    except Exception as e:
+        if str(getattr(e, "code", "")) not in _MISSING_CODES:
+            raise
+        missing.append(f"{what} ({migration}): {getattr(e, 'message', None) or e}")
+
+
+def check(db):
+    """빠진 컬럼/함수가 있으면 RuntimeError (블로킹: I/O 스레드에서 호출)"""
+    missing = []
+    try:
+        for migration, table, columns in REQUIRED_COLUMNS:
+            _probe(migration, lambda: db.table(table).select(columns).limit(1), f"{table}.{columns}", missing)
+        rpc = getattr(db, "rpc", None)
+        for migration, function, params in REQUIRED_FUNCTIONS if rpc is not None else ():
+            _probe(migration, lambda: rpc(function, params), f"함수 {function}", missing)
+    except Exception:
+        logger.warning("Supabase 스키마를 확인하지 못했습니다 (확인 없이 시작)", exc_info=True)
+        return
+    if missing:
+        raise RuntimeError(
+            "Supabase 스키마에 필요한 컬럼/함수가 없습니다. "
+            f"{MIGRATIONS_DIR} 의 마이그레이션을 적용한 뒤 다시 시작하세요 (supabase db push).\n- "
+            + "\n- ".join(missing)
+        )
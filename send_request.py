@@ -1,3 +1,5 @@
+import os
+
 import requests
 
 def extract_pdf(file_path, password, url='http://localhost:8000/extract'):
@@ -16,8 +18,34 @@ def extract_pdf(file_path, password, url='http://localhost:8000/extract'):
         print('JSON 파싱 실패, 응답:', response.text)
 
 
+
+def extract_pdf_batch(file_paths, password, url='http://localhost:8000/extract/batch'):
+    """여러 PDF 를 한 요청으로 보낸다 (파일마다 비밀번호가 다르면 password 에 리스트를 넘긴다)"""
+    passwords = password if isinstance(password, list) else [password]
+    handles = [open(path, 'rb') for path in file_paths]
+    try:
+        files = [('files', (os.path.basename(path), f, 'application/pdf')) for path, f in zip(file_paths, handles)]
+        response = requests.post(url, files=files, data={'passwords': passwords})
+    finally:
+        for f in handles:
+            f.close()
+    try:
+        response.raise_for_status()
+        for result in response.json()['results']:
+            if result['status'] == 'done':
+                print(f"[{result['filename']}] 추출된 내용:\n", result['content'])
+            else:
+                print(f"[{result['filename']}] 실패:", result['error'])
+    except requests.exceptions.HTTPError as err:
+        print(f'HTTP error: {err}')
+        print('응답 바디:', response.text)
+    except ValueError:
+        print('JSON 파싱 실패, 응답:', response.text)
+
+
 if __name__ == '__main__':
     # 여기에 PDF 파일 경로와 비밀번호를 입력하세요.
     PDF_PATH = 'pbh2.pdf'
     PASSWORD = '0000'
-    extract_pdf(PDF_PATH, PASSWORD) 
\ No newline at end of file
+    extract_pdf(PDF_PATH, PASSWORD)
+    # 여러 파일은 한 요청으로: extract_pdf_batch(['pbh1.pdf', 'pbh2.pdf'], PASSWORD) 
\ No newline at end of file
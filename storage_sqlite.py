@@ -0,0 +1,455 @@
+"""SQLite 저장소 백엔드 (STORAGE_BACKEND=sqlite).
+
+main.py 와 export 모듈이 사용하는 Supabase(PostgREST) 쿼리 빌더의 부분집합
+(`table().select/insert/upsert/update/delete` + eq/neq/in_/gt/gte/lt/lte/order/limit/range
++ `execute().data`)을 로컬 SQLite 파일 위에서 그대로 제공한다. 네트워크 없이 단일 노드로
+배포하거나 프로세스 내 지연으로 벤치마크할 때 사용한다.
+
+export 용 사용자 배치 조회(export_user_batches)는 PRO 최신 응답과 users 조인을, 코호트 집계
+(cohort_stats)는 요약 테이블의 GROUP BY 를, 요약 갱신(refresh_summaries)은 한 트랜잭션의
+DELETE + INSERT ... SELECT 를 SQL 로 수행한다.
+"""
+import sqlite3
+import threading
+
+import fast_json
+
+# 테이블 -> [(컬럼, 타입)]. id 는 모든 테이블의 INTEGER PRIMARY KEY
+SCHEMA = {
+    "users": [
+        ("name_hash", "TEXT UNIQUE"),
+        ("full_name", "TEXT"),
+        ("summary_dirty", "INTEGER NOT NULL DEFAULT 0"),  # cohort_stats 요약 재계산 표시
+    ],
+    "fhir_resources": [
+        ("user_id", "INTEGER"),
+        ("resource_type", "TEXT"),
+        ("fhir_id", "TEXT"),
+        ("data", "TEXT"),
+    ],
+    "medication_dispenses": [
+        ("user_id", "INTEGER"),
+        ("resource_id", "INTEGER"),
+        ("medication_code", "TEXT"),
+        ("medication_name", "TEXT"),
+        ("pharmacy_name", "TEXT"),
+        ("when_prepared", "TEXT"),
+        ("days_supply", "NUMERIC"),
+        ("age", "INTEGER"),
+        ("change_seq", "INTEGER NOT NULL DEFAULT 0"),  # export_delta 변경 번호
+    ],
+    "treatment_claims": [
+        ("user_id", "INTEGER"),
+        ("resource_id", "INTEGER"),
+        ("claim_type", "TEXT"),
+        ("created_date", "TEXT"),
+        ("copay_amount", "NUMERIC"),
+        ("benefit_amount", "NUMERIC"),
+        ("change_seq", "INTEGER NOT NULL DEFAULT 0"),  # export_delta 변경 번호
+    ],
+    "immunizations": [
+        ("user_id", "INTEGER"),
+        ("resource_id", "INTEGER"),
+        ("vaccine_name", "TEXT"),
+        ("occurrence_date", "TEXT"),
+        ("dose_number", "INTEGER"),
+        ("performer_name", "TEXT"),
+        ("change_seq", "INTEGER NOT NULL DEFAULT 0"),  # export_delta 변경 번호
+    ],
+    "pro_responses": [
+        ("user_id", "TEXT"),  # name_hash
+        ("response", "TEXT"),
+        ("change_seq", "INTEGER NOT NULL DEFAULT 0"),  # export_delta 변경 번호
+    ],
+    # cohort_stats 요약 테이블 (적재 때 사용자별로 갱신)
+    "medication_summaries": [
+        ("user_id", "INTEGER"),
+        ("medication_code", "TEXT"),
+        ("medication_name", "TEXT"),
+        ("age", "INTEGER"),
+        ("dispense_count", "INTEGER"),
+        ("days_supply_total", "NUMERIC"),
+    ],
+    "claim_summaries": [
+        ("user_id", "INTEGER"),
+        ("claim_type", "TEXT"),
+        ("claim_count", "INTEGER"),
+        ("copay_total", "NUMERIC"),
+        ("benefit_total", "NUMERIC"),
+    ],
+    "immunization_summaries": [
+        ("user_id", "INTEGER"),
+        ("vaccine_name", "TEXT"),
+        ("dose_count", "INTEGER"),
+        ("last_date", "TEXT"),
+    ],
+}
+# jsonb 에 해당하는 컬럼 (TEXT 로 저장하고 읽을 때 복원)
+JSON_COLUMNS = {"fhir_resources": {"data"}, "pro_responses": {"response"}}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_fhir_resources_user_fhir ON fhir_resources (user_id, fhir_id)",
+    "CREATE INDEX IF NOT EXISTS idx_medication_dispenses_user ON medication_dispenses (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_medication_dispenses_resource ON medication_dispenses (resource_id)",
+    "CREATE INDEX IF NOT EXISTS idx_medication_dispenses_age ON medication_dispenses (age)",
+    "CREATE INDEX IF NOT EXISTS idx_treatment_claims_user ON treatment_claims (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_treatment_claims_resource ON treatment_claims (resource_id)",
+    "CREATE INDEX IF NOT EXISTS idx_immunizations_user ON immunizations (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_immunizations_resource ON immunizations (resource_id)",
+    "CREATE INDEX IF NOT EXISTS idx_pro_responses_user ON pro_responses (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_medication_dispenses_change ON medication_dispenses (change_seq)",
+    "CREATE INDEX IF NOT EXISTS idx_treatment_claims_change ON treatment_claims (change_seq)",
+    "CREATE INDEX IF NOT EXISTS idx_immunizations_change ON immunizations (change_seq)",
+    "CREATE INDEX IF NOT EXISTS idx_pro_responses_change ON pro_responses (change_seq)",
+    "CREATE INDEX IF NOT EXISTS idx_medication_summaries_user ON medication_summaries (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_claim_summaries_user ON claim_summaries (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_immunization_summaries_user ON immunization_summaries (user_id)",
+]
+
+
+class StorageError(Exception):
+    pass
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, db, table):
+        if table not in SCHEMA:
+            raise StorageError(f"알 수 없는 테이블: {table}")
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns = None
+        self._payload = None
+        self._where = []
+        self._params = []
+        self._order = []
+        self._limit = None
+        self._offset = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+
+    def _col(self, name):
+        name = name.strip()
+        if name not in self._db.columns[self._table]:
+            raise StorageError(f"{self._table} 에 없는 컬럼: {name}")
+        return f'"{name}"'
+
+    # --- 연산 -----------------------------------------------------------
+    def select(self, columns="*", **kwargs):
+        self._op = "select"
+        if columns.strip() != "*":
+            self._columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._op = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict="", ignore_duplicates=False, **kwargs):
+        self._op = "upsert"
+        self._payload = payload
+        self._on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()] or ["id"]
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload, **kwargs):
+        self._op = "update"
+        self._payload = payload
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    # --- 필터 -----------------------------------------------------------
+    def _filter(self, col, op, val):
+        if val is None and op in ("=", "!="):
+            self._where.append(f"{self._col(col)} IS {'NOT ' if op == '!=' else ''}NULL")
+        else:
+            self._where.append(f"{self._col(col)} {op} ?")
+            self._params.append(self._db.encode(self._table, col, val))
+        return self
+
+    def eq(self, col, val):
+        return self._filter(col, "=", val)
+
+    def neq(self, col, val):
+        return self._filter(col, "!=", val)
+
+    def gt(self, col, val):
+        return self._filter(col, ">", val)
+
+    def gte(self, col, val):
+        return self._filter(col, ">=", val)
+
+    def lt(self, col, val):
+        return self._filter(col, "<", val)
+
+    def lte(self, col, val):
+        return self._filter(col, "<=", val)
+
+    def in_(self, col, values):
+        values = list(values)
+        if not values:
+            self._where.append("0")
+            return self
+        self._where.append(f"{self._col(col)} IN ({', '.join('?' * len(values))})")
+        self._params.extend(self._db.encode(self._table, col, v) for v in values)
+        return self
+
+    def order(self, col, desc=False, **kwargs):
+        self._order.append(f"{self._col(col)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    # --- 실행 -----------------------------------------------------------
+    def _where_sql(self):
+        return f" WHERE {' AND '.join(self._where)}" if self._where else ""
+
+    def _returning(self):
+        if self._columns is None:
+            return " RETURNING *"
+        return f" RETURNING {', '.join(self._col(c) for c in self._columns)}"
+
+    def _rows(self):
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        return [{k: self._db.encode(self._table, k, v) for k, v in row.items()} for row in payload]
+
+    def execute(self):
+        table = f'"{self._table}"'
+        if self._op == "select":
+            cols = "*" if self._columns is None else ", ".join(self._col(c) for c in self._columns)
+            sql = f"SELECT {cols} FROM {table}{self._where_sql()}"
+            if self._order:
+                sql += f" ORDER BY {', '.join(self._order)}"
+            if self._limit is not None:
+                sql += f" LIMIT {int(self._limit)}"
+                if self._offset:
+                    sql += f" OFFSET {int(self._offset)}"
+            return _Result(self._db.query(self._table, sql, self._params))
+
+        if self._op in ("insert", "upsert"):
+            statements = []
+            for row in self._rows():
+                cols = list(row)
+                sql = f"INSERT INTO {table} ({', '.join(self._col(c) for c in cols)}) " \
+                      f"VALUES ({', '.join('?' * len(cols))})"
+                if self._op == "upsert":
+                    target = ", ".join(self._col(c) for c in self._on_conflict)
+                    updates = [c for c in cols if c not in self._on_conflict]
+                    if self._ignore_duplicates or not updates:
+                        sql += f" ON CONFLICT ({target}) DO NOTHING"
+                    else:
+                        sets = ", ".join(f"{self._col(c)} = excluded.{self._col(c)}" for c in updates)
+                        sql += f" ON CONFLICT ({target}) DO UPDATE SET {sets}"
+                statements.append((sql + self._returning(), [row[c] for c in cols]))
+            # 행마다 RETURNING 을 받아 입력 순서대로 돌려준다 (한 트랜잭션)
+            return _Result(self._db.run_many(self._table, statements))
+
+        if self._op == "update":
+            row = self._rows()[0]
+            sets = ", ".join(f"{self._col(c)} = ?" for c in row)
+            sql = f"UPDATE {table} SET {sets}{self._where_sql()}{self._returning()}"
+            return _Result(self._db.run_many(self._table, [(sql, list(row.values()) + self._params)]))
+
+        if self._op == "delete":
+            sql = f"DELETE FROM {table}{self._where_sql()}{self._returning()}"
+            return _Result(self._db.run_many(self._table, [(sql, self._params)]))
+
+        raise StorageError(f"지원하지 않는 연산: {self._op}")
+
+
+class SQLiteClient:
+    """`supabase.Client` 대신 clients.supabase 로 쓰는 SQLite 클라이언트 (스레드 안전)"""
+
+    def __init__(self, path: str = "piethon.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self.columns = {t: {"id", "created_at", *(c for c, _ in cols)} for t, cols in SCHEMA.items()}
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for name, cols in SCHEMA.items():
+                defs = ", ".join(f'"{c}" {t}' for c, t in cols)
+                self._conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" (id INTEGER PRIMARY KEY, {defs}, '
+                    f"created_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+                )
+                # 이전 버전에서 만든 파일: 나중에 추가된 컬럼을 덧붙인다
+                existing = {r["name"] for r in self._conn.execute(f'PRAGMA table_info("{name}")')}
+                for c, t in cols:
+                    if c not in existing:
+                        self._conn.execute(f'ALTER TABLE "{name}" ADD COLUMN "{c}" {t}')
+            for sql in INDEXES:
+                self._conn.execute(sql)
+
+    def table(self, name):
+        return _Query(self, name)
+
+    # --- 값 변환 --------------------------------------------------------
+    def encode(self, table, col, value):
+        if isinstance(value, (dict, list)) or (col in JSON_COLUMNS.get(table, ()) and value is not None):
+            return fast_json.dumps(value)
+        return value
+
+    def _decode(self, table, row):
+        out = dict(row)
+        for col in JSON_COLUMNS.get(table, ()):
+            if out.get(col) is not None:
+                out[col] = fast_json.loads(out[col])
+        return out
+
+    # --- 실행 -----------------------------------------------------------
+    def query(self, table, sql, params):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._decode(table, r) for r in rows]
+
+    def run_many(self, table, statements):
+        out = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    out.extend(self._conn.execute(sql, params).fetchall())
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return [self._decode(table, r) for r in out]
+
+    # --- export 푸시다운 ------------------------------------------------
+    def export_user_batches(self, filters=None, columns="*", batch_size=200, ehr_tables=()):
+        """export_stream.iter_user_batches 와 같은 배치를 SQL 조인으로 만든다.
+
+        사용자별 최신 PRO 응답과 users 매핑을 한 쿼리로 가져오고(name_hash keyset),
+        배치마다 EHR 테이블을 필터와 함께 user_id IN (...) 으로 조회한다.
+        """
+        filters = filters or {}
+        cursor = ""
+        while True:
+            latest = self.query("pro_responses", """
+                SELECT p.user_id AS name_hash, p.response AS response, u.id AS uid
+                FROM pro_responses p
+                JOIN (SELECT user_id, MAX(id) AS id FROM pro_responses
+                      WHERE user_id > ? GROUP BY user_id ORDER BY user_id LIMIT ?) latest ON p.id = latest.id
+                LEFT JOIN users u ON u.name_hash = p.user_id
+                ORDER BY p.user_id
+            """, [cursor, batch_size])
+            if not latest:
+                return
+            cursor = latest[-1]["name_hash"]
+            users = [u for u in latest if u["uid"] is not None]
+            if not users:
+                continue
+            ids = [u["uid"] for u in users]
+            groups = {uid: {table: [] for table in ehr_tables} for uid in ids}
+            for table in ehr_tables:
+                q = self.table(table).select(columns).in_("user_id", ids)
+                for apply in filters.get(table, ()):
+                    q = apply(q)
+                for r in q.order("user_id").order("id").execute().data:
+                    groups[r["user_id"]][table].append(r)
+            yield [(u["uid"], u["response"], groups[u["uid"]]) for u in users]
+
+    def refresh_summaries(self, user_ids):
+        """cohort_stats.refresh_summaries 와 같은 요약을 한 트랜잭션 안에서 교체한다"""
+        ids = list(user_ids)
+        marks = ", ".join("?" for _ in ids)
+        statements = [(f'DELETE FROM "{table}" WHERE user_id IN ({marks})', ids)
+                      for table in ("medication_summaries", "claim_summaries", "immunization_summaries")]
+        statements += [
+            (f"""INSERT INTO medication_summaries
+                     (user_id, medication_code, medication_name, age, dispense_count, days_supply_total)
+                 SELECT user_id, medication_code, medication_name, age, COUNT(*), TOTAL(days_supply)
+                 FROM medication_dispenses WHERE user_id IN ({marks})
+                 GROUP BY user_id, medication_code, medication_name, age""", ids),
+            (f"""INSERT INTO claim_summaries (user_id, claim_type, claim_count, copay_total, benefit_total)
+                 SELECT user_id, claim_type, COUNT(*), TOTAL(copay_amount), TOTAL(benefit_amount)
+                 FROM treatment_claims WHERE user_id IN ({marks})
+                 GROUP BY user_id, claim_type""", ids),
+            (f"""INSERT INTO immunization_summaries (user_id, vaccine_name, dose_count, last_date)
+                 SELECT user_id, vaccine_name, COUNT(*), MAX(NULLIF(occurrence_date, ''))
+                 FROM immunizations WHERE user_id IN ({marks})
+                 GROUP BY user_id, vaccine_name""", ids),
+        ]
+        self.run_many("medication_summaries", statements)
+
+    def cohort_stats(self, min_age=None, max_age=None, med_codes=None, age_band=10):
+        """cohort_stats.cohort_stats 와 같은 결과를 요약 테이블 GROUP BY 로 만든다"""
+        where, params = [], []
+        if min_age is not None:
+            where.append("age >= ?")
+            params.append(min_age)
+        if max_age is not None:
+            where.append("age <= ?")
+            params.append(max_age)
+        if med_codes:
+            where.append(f"medication_name IN ({', '.join('?' for _ in med_codes)})")
+            params.extend(med_codes)
+        meds_where = f"WHERE {' AND '.join(where)}" if where else ""
+        if where:
+            cohort = f"SELECT DISTINCT user_id FROM medication_summaries {meds_where}"
+        else:
+            cohort = ("SELECT user_id FROM medication_summaries UNION SELECT user_id FROM claim_summaries "
+                      "UNION SELECT user_id FROM immunization_summaries")
+        cohort_params = list(params) if where else []
+
+        with self._lock:
+            run = self._conn.execute
+            cohort_users = run(f"SELECT COUNT(*) FROM ({cohort})", cohort_params).fetchone()[0]
+            meds = run(f"""
+                SELECT medication_code, medication_name, SUM(dispense_count) AS dispenses,
+                       COUNT(DISTINCT user_id) AS users, TOTAL(days_supply_total) AS days_supply_total
+                FROM medication_summaries {meds_where}
+                GROUP BY medication_code, medication_name
+            """, params).fetchall()
+            bands = run(f"""
+                SELECT CASE WHEN age IS NULL THEN NULL ELSE (age / ?) * ? END AS low,
+                       SUM(dispense_count) AS dispenses, COUNT(DISTINCT user_id) AS users
+                FROM medication_summaries {meds_where}
+                GROUP BY low
+            """, [age_band, age_band, *params]).fetchall()
+            claims = run(f"""
+                SELECT claim_type, SUM(claim_count) AS claims, COUNT(DISTINCT user_id) AS users,
+                       TOTAL(copay_total) AS copay_total, TOTAL(benefit_total) AS benefit_total
+                FROM claim_summaries WHERE user_id IN ({cohort})
+                GROUP BY claim_type
+            """, cohort_params).fetchall()
+            vaccines = run(f"""
+                SELECT vaccine_name, SUM(dose_count) AS doses, COUNT(DISTINCT user_id) AS users
+                FROM immunization_summaries WHERE user_id IN ({cohort})
+                GROUP BY vaccine_name
+            """, cohort_params).fetchall()
+        return {
+            "cohort_users": cohort_users,
+            "medications": [dict(r) for r in meds],
+            "age_bands": [
+                {"band": None if r["low"] is None else f"{r['low']}-{r['low'] + age_band - 1}",
+                 "dispenses": r["dispenses"], "users": r["users"]}
+                for r in bands
+            ],
+            "claims": [dict(r) for r in claims],
+            "vaccines": [dict(r) for r in vaccines],
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,20 @@
+-- cohort_stats: 사용자별 요약 테이블
+create table if not exists medication_summaries (
+  id bigint generated by default as identity primary key,
+  user_id bigint references users(id) on delete cascade,
+  medication_code text, medication_name text, age int,
+  dispense_count int not null, days_supply_total numeric
+);
+create index if not exists idx_medication_summaries_user on medication_summaries (user_id);
+create table if not exists claim_summaries (
+  id bigint generated by default as identity primary key,
+  user_id bigint references users(id) on delete cascade,
+  claim_type text, claim_count int not null, copay_total numeric, benefit_total numeric
+);
+create index if not exists idx_claim_summaries_user on claim_summaries (user_id);
+create table if not exists immunization_summaries (
+  id bigint generated by default as identity primary key,
+  user_id bigint references users(id) on delete cascade,
+  vaccine_name text, dose_count int not null, last_date text
+);
+create index if not exists idx_immunization_summaries_user on immunization_summaries (user_id);
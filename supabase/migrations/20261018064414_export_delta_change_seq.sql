@@ -0,0 +1,9 @@
+-- export_delta: 변경 번호 컬럼 (기존 행은 0 이므로 첫 전체 동기화에 포함된다)
+alter table pro_responses add column if not exists change_seq bigint not null default 0;
+create index if not exists idx_pro_responses_change on pro_responses (change_seq);
+alter table immunizations add column if not exists change_seq bigint not null default 0;
+create index if not exists idx_immunizations_change on immunizations (change_seq);
+alter table medication_dispenses add column if not exists change_seq bigint not null default 0;
+create index if not exists idx_medication_dispenses_change on medication_dispenses (change_seq);
+alter table treatment_claims add column if not exists change_seq bigint not null default 0;
+create index if not exists idx_treatment_claims_change on treatment_claims (change_seq);
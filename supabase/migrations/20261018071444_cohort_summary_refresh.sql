@@ -0,0 +1,70 @@
+-- cohort_stats: 요약 재계산 표시와 저장소 안에서 갱신/집계하는 함수 (rpc)
+alter table users add column if not exists summary_dirty bigint not null default 0;
+
+-- 사용자별 요약 교체. 같은 사용자를 동시에 갱신하면 advisory lock 으로 직렬화한다 (id 순서로 잠가 교착 방지)
+create or replace function refresh_cohort_summaries(user_ids bigint[]) returns void
+language plpgsql as $$
+declare
+  uid bigint;
+begin
+  for uid in select distinct u from unnest(user_ids) u order by u loop
+    perform pg_advisory_xact_lock(hashtextextended('cohort_summaries:' || uid, 0));
+  end loop;
+  delete from medication_summaries where user_id = any(user_ids);
+  delete from claim_summaries where user_id = any(user_ids);
+  delete from immunization_summaries where user_id = any(user_ids);
+  insert into medication_summaries (user_id, medication_code, medication_name, age, dispense_count, days_supply_total)
+    select user_id, medication_code, medication_name, age, count(*),
+           coalesce(sum(nullif(days_supply::text, '')::numeric), 0)
+    from medication_dispenses where user_id = any(user_ids)
+    group by user_id, medication_code, medication_name, age;
+  insert into claim_summaries (user_id, claim_type, claim_count, copay_total, benefit_total)
+    select user_id, claim_type, count(*),
+           coalesce(sum(nullif(copay_amount::text, '')::numeric), 0),
+           coalesce(sum(nullif(benefit_amount::text, '')::numeric), 0)
+    from treatment_claims where user_id = any(user_ids)
+    group by user_id, claim_type;
+  insert into immunization_summaries (user_id, vaccine_name, dose_count, last_date)
+    select user_id, vaccine_name, count(*), max(nullif(occurrence_date::text, ''))
+    from immunizations where user_id = any(user_ids)
+    group by user_id, vaccine_name;
+end $$;
+
+-- cohort_stats() 와 같은 키의 집계 결과 (p_med_names 가 null 이면 약품 필터 없음)
+create or replace function cohort_stats_summary(p_min_age int, p_max_age int, p_med_names text[], p_age_band int)
+returns json language sql stable as $$
+  with meds as (
+    select * from medication_summaries
+    where (p_min_age is null or age >= p_min_age)
+      and (p_max_age is null or age <= p_max_age)
+      and (p_med_names is null or medication_name = any(p_med_names))
+  ), cohort as (
+    select user_id from meds
+    union
+    select user_id from claim_summaries
+    where p_min_age is null and p_max_age is null and p_med_names is null
+    union
+    select user_id from immunization_summaries
+    where p_min_age is null and p_max_age is null and p_med_names is null
+  )
+  select json_build_object(
+    'cohort_users', (select count(*) from cohort),
+    'medications', coalesce((select json_agg(m) from (
+      select medication_code, medication_name, sum(dispense_count) as dispenses,
+             count(distinct user_id) as users, coalesce(sum(days_supply_total), 0) as days_supply_total
+      from meds group by medication_code, medication_name) m), '[]'::json),
+    'age_bands', coalesce((select json_agg(b) from (
+      select case when low is null then null else low || '-' || (low + p_age_band - 1) end as band,
+             dispenses, users
+      from (select (age / p_age_band) * p_age_band as low, sum(dispense_count) as dispenses,
+                   count(distinct user_id) as users
+            from meds group by 1) x) b), '[]'::json),
+    'claims', coalesce((select json_agg(c) from (
+      select claim_type, sum(claim_count) as claims, count(distinct user_id) as users,
+             coalesce(sum(copay_total), 0) as copay_total, coalesce(sum(benefit_total), 0) as benefit_total
+      from claim_summaries where user_id in (select user_id from cohort) group by claim_type) c), '[]'::json),
+    'vaccines', coalesce((select json_agg(v) from (
+      select vaccine_name, sum(dose_count) as doses, count(distinct user_id) as users
+      from immunization_summaries where user_id in (select user_id from cohort) group by vaccine_name) v), '[]'::json)
+  )
+$$;
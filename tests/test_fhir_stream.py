@@ -0,0 +1,143 @@
+"""fhir_stream.BundleStream 파서 테스트: 필드 순서, 청크 경계, 잘못된 입력.
+
+실행: python -m pytest tests
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fhir_stream  # noqa: E402
+
+RESOURCES = [
+    {"resourceType": "MedicationDispense", "id": "md-1", "medicationCodeableConcept": {"text": "타이레놀정 500mg"},
+     "daysSupply": {"value": 3}},
+    {"resourceType": "Immunization", "id": "im-1", "vaccineCode": {"text": "인플루엔자"}, "doseNumber": 1.5e1},
+    {"resourceType": "Patient", "id": "p-1", "name": [{"text": "홍길동"}], "active": True, "deceased": None},
+]
+
+
+def _chunks(data: bytes, size: int):
+    async def gen():
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+    return gen()
+
+
+def parse(body, size=1 << 16, ndjson=False):
+    """(리소스 목록, meta). body 는 dict 또는 문자열"""
+    text = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)
+
+    async def run():
+        stream = fhir_stream.BundleStream(_chunks(text.encode("utf-8"), size), ndjson=ndjson)
+        return [res async for res in stream], stream.meta
+
+    return asyncio.run(run())
+
+
+def _public_data(resources=RESOURCES):
+    return {"publicData": [{"resource": res, "meta": {"source": "phr"}} for res in resources]}
+
+
+# --- 필드 순서 --------------------------------------------------------------
+def test_export_document():
+    resources, meta = parse({"version": 1, **_public_data(), "extra": {"publicData": [1, 2]}})
+    assert resources == RESOURCES
+    assert meta == {}
+
+
+@pytest.mark.parametrize("order", [
+    ("name_hash", "full_name", "resource"),
+    ("resource", "name_hash", "full_name"),
+    ("full_name", "resource", "name_hash"),
+])
+def test_request_body_field_order(order):
+    fields = {"name_hash": "abc", "full_name": "홍길동", "resource": _public_data()}
+    resources, meta = parse({key: fields[key] for key in order})
+    assert resources == RESOURCES
+    assert meta == {"name_hash": "abc", "full_name": "홍길동"}
+
+
+def test_nested_meta_keys_are_ignored():
+    body = {"resource": {"name_hash": "inner", **_public_data()}, "name_hash": "outer"}
+    resources, meta = parse(body)
+    assert resources == RESOURCES
+    assert meta == {"name_hash": "outer"}
+
+
+def test_items_without_resource_are_skipped():
+    body = {"publicData": [{"meta": {}}, 3, {"resource": RESOURCES[0]}, []]}
+    assert parse(body)[0] == [RESOURCES[0]]
+
+
+def test_empty_bundle():
+    assert parse({"publicData": []}) == ([], {})
+    assert parse("{}") == ([], {})
+
+
+# --- 청크 경계 --------------------------------------------------------------
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_chunk_boundaries(size):
+    # 1바이트 청크는 한글(3바이트)과 숫자, 키, 구분자를 모두 청크 경계에서 자른다
+    body = {"name_hash": "abc", "resource": _public_data(), "count": 12345}
+    assert parse(body, size) == parse(body)
+
+
+def test_number_split_across_chunks():
+    text = '{"publicData": [{"resource": {"resourceType": "Observation", "value": 1234567890}}]}'
+    resources, _ = parse(text, size=text.index("4567"))
+    assert resources[0]["value"] == 1234567890
+
+
+def test_whitespace_heavy_body():
+    text = json.dumps({"name_hash": "abc", **_public_data()}, ensure_ascii=False, indent=4)
+    assert parse(text, size=5)[0] == RESOURCES
+
+
+@pytest.mark.parametrize("size", [1, 5, 1 << 16])
+def test_ndjson(size):
+    lines = [json.dumps({"name_hash": "abc", "full_name": "홍길동"}, ensure_ascii=False), ""]
+    lines += [json.dumps(RESOURCES[0], ensure_ascii=False), json.dumps({"resource": RESOURCES[1]}, ensure_ascii=False)]
+    lines += [json.dumps(RESOURCES[2], ensure_ascii=False)]
+    resources, meta = parse("\r\n".join(lines), size, ndjson=True)
+    assert resources == RESOURCES
+    assert meta == {"name_hash": "abc", "full_name": "홍길동"}
+
+
+# --- 잘못된 입력 ------------------------------------------------------------
+@pytest.mark.parametrize("text", [
+    "",
+    "[]",
+    '"publicData"',
+    '{"publicData": [{"resource": {}}',
+    '{"publicData": [{"resource": {}} {"resource": {}}]}',
+    '{"publicData": [{"resource": {"id": 1,}}]}',
+    '{"name_hash" "abc"}',
+    '{"name_hash": "abc" "full_name": "x"}',
+    '{"publicData": []} trailing',
+    '{"publicData": [{"resource": {"id": "끝나지 않은 문자열}]}',
+])
+@pytest.mark.parametrize("size", [1, 1 << 16])
+def test_malformed_json(text, size):
+    with pytest.raises(fhir_stream.BundleFormatError):
+        parse(text, size)
+
+
+@pytest.mark.parametrize("text", ['{"resourceType": "Patient"}\n{oops}', '{"resourceType": "Patient"}\n[1, 2]'])
+def test_malformed_ndjson(text):
+    with pytest.raises(fhir_stream.BundleFormatError, match="2번째 줄"):
+        parse(text, ndjson=True)
+
+
+def test_invalid_utf8():
+    async def run():
+        stream = fhir_stream.BundleStream(_chunks(b'{"publicData": [{"resource": {"id": "\xff"}}]}', 4))
+        return [res async for res in stream]
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
@@ -0,0 +1,94 @@
+"""/extract 결과 캐시 테스트: 같은 PDF 를 동시에 요청할 때 처음 요청이 취소되는 경우.
+
+실행: python -m pytest tests
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CLIENT_WARMUP", "0")
+
+import main  # noqa: E402
+import pdf_cache  # noqa: E402
+import pdf_extract  # noqa: E402
+import uploads  # noqa: E402
+
+PDF = os.path.join(ROOT, "pbh1.pdf")
+PASSWORD = "0000"
+
+
+def _spooled_on_disk(tmp_path, name):
+    """임시 파일로 스풀링된 업로드 (UPLOAD_SPOOL_THRESHOLD 를 넘는 업로드와 같은 형태)"""
+    path = os.path.join(tmp_path, name)
+    shutil.copyfile(PDF, path)
+    return uploads.SpooledUpload(name, os.path.getsize(path), path=path)
+
+
+@pytest.fixture
+def slow_extract(monkeypatch):
+    """추출이 끝나기 전에 요청을 취소할 수 있도록 추출 시작을 늦춘다"""
+    real = pdf_extract.extract_pages
+
+    async def slow(source, password, workers=None):
+        await asyncio.sleep(0.2)
+        return await real(source, password, workers=1)
+
+    monkeypatch.setattr(pdf_extract, "extract_pages", slow)
+    monkeypatch.setattr(main, "pdf_text_cache", pdf_cache.PdfTextCache(64 * 1024 * 1024))
+
+
+def test_cancelled_first_requester_keeps_spooled_file(slow_extract):
+    tmp = tempfile.mkdtemp()
+
+    async def run():
+        first_upload = _spooled_on_disk(tmp, "first.pdf")
+        waiter_upload = _spooled_on_disk(tmp, "waiter.pdf")
+        first_path, waiter_path = first_upload.path, waiter_upload.path
+        first = asyncio.ensure_future(main._extract_pages(first_upload, PASSWORD))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(main._extract_pages(waiter_upload, PASSWORD))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # 추출 중인 파일은 취소된 요청이 지우지 않는다
+        assert os.path.exists(first_path)
+        # 기다리던 요청은 자기 업로드를 바로 정리하고 추출 결과를 받는다
+        pages, cached = await waiter
+        assert pages and cached
+        assert not os.path.exists(waiter_path)
+        # 추출 태스크가 끝나면 넘겨받은 업로드를 닫는다
+        await asyncio.sleep(0)
+        assert not os.path.exists(first_path)
+
+    try:
+        asyncio.run(run())
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_cache_hit_releases_upload(slow_extract):
+    tmp = tempfile.mkdtemp()
+
+    async def run():
+        first = _spooled_on_disk(tmp, "first.pdf")
+        pages, cached = await main._extract_pages(first, PASSWORD)
+        assert not cached and first.path is None
+        again = _spooled_on_disk(tmp, "again.pdf")
+        path = again.path
+        assert await main._extract_pages(again, PASSWORD) == (pages, True)
+        assert not os.path.exists(path)
+
+    try:
+        asyncio.run(run())
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,81 @@
+"""report_cache.ReportCache 테스트: 처음 요청이 취소될 때의 공유 생성, 디스크 계층 크기 제한.
+
+실행: python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CLIENT_WARMUP", "0")
+
+import report_cache  # noqa: E402
+
+
+def test_cancelled_first_requester_keeps_generation():
+    cache = report_cache.ReportCache()
+    calls, released = [], []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "보고서"
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_create("k", generate, release=lambda: released.append("first")))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_create("k", generate, release=lambda: released.append("waiter")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # 생성 중인 요청의 자원은 취소된 요청이 정리하지 않는다
+        assert released == []
+        assert await waiter == "보고서"
+        assert sorted(released) == ["first", "waiter"]
+        assert calls == [1]
+        assert await cache.aget("k") == "보고서"
+        assert not cache._inflight
+
+    asyncio.run(run())
+
+
+def test_failed_generation_is_not_cached():
+    cache = report_cache.ReportCache()
+
+    async def fail():
+        raise RuntimeError("업스트림 오류")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_create("k", fail)
+        assert await cache.get_or_create("k", lambda: asyncio.sleep(0, result="다시")) == "다시"
+
+    asyncio.run(run())
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    report = "가" * 1000
+    entry_size = len(report.encode("utf-8")) + 100
+    cache = report_cache.ReportCache(max_entries=1, disk_dir=str(tmp_path), max_disk_bytes=3 * entry_size)
+
+    async def run():
+        for i in range(3):
+            await cache.aset(f"k{i}", report)
+        # k0 을 다시 읽어 가장 최근에 쓴 항목으로 만든 뒤 k3 을 넣으면 k1 이 지워진다
+        assert await cache.aget("k0") == report
+        await cache.aset("k3", report)
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert stats["disk_entries"] == 3 and stats["disk_bytes"] <= 3 * entry_size
+    assert stats["disk_evictions"] == 1
+    assert not os.path.exists(cache._path("k1"))
+    # 새 프로세스는 남아 있는 파일로 디스크 목록을 다시 만든다
+    reopened = report_cache.ReportCache(disk_dir=str(tmp_path), max_disk_bytes=3 * entry_size)
+    assert reopened.get("k3") == report and reopened.get("k1") is None
+    assert reopened.stats()["disk_entries"] == 3
@@ -0,0 +1,197 @@
+"""업로드 본문 처리: 요청 크기 제한과 임계값 이상 업로드의 디스크 스풀링.
+
+- UploadLimitMiddleware: 경로별 최대 요청 크기를 본문을 받는 도중에 검사해 413 으로 끊는다.
+- spool(): 작은 업로드는 bytes 로, 큰 업로드는 이름 있는 임시 파일로 넘겨
+  PDF/JSON 파서가 mmap 이나 파일 스트림으로 읽게 한다 (요청마다 전체 본문을
+  메모리에 복사하지 않는다).
+"""
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from starlette.formparsers import MultiPartParser
+
+import report_cache
+from clients import run_io
+
+# 이 크기를 넘는 업로드는 메모리 대신 임시 파일에 보관
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(1024 * 1024)))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+# 요청 본문 최대 크기(바이트). 경로별 값이 없으면 MAX_REQUEST_BYTES 사용
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(50 * 1024 * 1024)))
+# 앞에서부터 접두사가 일치하는 첫 항목을 사용하므로 구체적인 경로를 먼저 둔다
+REQUEST_LIMITS = {
+    "/ingest-fhir/stream": int(os.getenv("MAX_INGEST_STREAM_BYTES", str(1024 * 1024 * 1024))),
+    "/extract/batch": int(os.getenv("MAX_PDF_BATCH_BYTES", str(4 * MAX_REQUEST_BYTES))),
+    "/extract": int(os.getenv("MAX_PDF_UPLOAD_BYTES", str(MAX_REQUEST_BYTES))),
+    "/health-report": int(os.getenv("MAX_FHIR_UPLOAD_BYTES", str(MAX_REQUEST_BYTES))),
+    "/ingest-fhir": int(os.getenv("MAX_INGEST_BYTES", str(MAX_REQUEST_BYTES))),
+}
+
+_COPY_CHUNK = 1024 * 1024
+
+# multipart 파서가 업로드 파일을 메모리에 두는 최대 크기도 같은 임계값을 따른다
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_THRESHOLD
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+def request_limit(path: str) -> int:
+    for prefix, limit in REQUEST_LIMITS.items():
+        if path == prefix or path.startswith(prefix + "/"):
+            return limit
+    return MAX_REQUEST_BYTES
+
+
+class UploadLimitMiddleware:
+    """Content-Length 와 실제 수신 바이트를 모두 검사하는 ASGI 미들웨어"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = request_limit(scope["path"])
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await self._reject(send, limit)
+                return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise PayloadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                # 본문 파싱 실패로 앱이 만든 400/500 응답 대신 413 을 보낸다
+                if message["type"] == "http.response.start" and not started:
+                    started = True
+                    await self._reject(send, limit)
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except PayloadTooLarge:
+            if not started:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit):
+        body = json.dumps(
+            {"detail": f"요청 본문이 허용 크기({limit / (1024 * 1024):.1f}MB)를 초과했습니다."},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class SpooledUpload:
+    """스풀링된 업로드. 작으면 data(bytes), 크면 path(임시 파일) 중 하나만 가진다"""
+
+    def __init__(self, filename, size, data=None, path=None):
+        self.filename = filename
+        self.size = size
+        self.data = data
+        self.path = path
+
+    @property
+    def source(self):
+        """pdf_extract 등에 그대로 넘길 수 있는 bytes 또는 파일 경로"""
+        return self.data if self.path is None else self.path
+
+    @contextmanager
+    def buffer(self):
+        """복사 없이 읽을 수 있는 버퍼: bytes 또는 읽기 전용 mmap"""
+        if self.path is None:
+            yield self.data
+            return
+        if self.size == 0:
+            yield b""
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+    def read_text(self, encoding="utf-8") -> str:
+        # mmap 도 버퍼 프로토콜을 지원하므로 bytes 로 복사하지 않고 매핑된 파일에서 바로 디코딩한다
+        with self.buffer() as buf:
+            return str(buf, encoding)
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self.data = None
+
+
+class TextSource:
+    """JSON 업로드를 보고서 경로의 (label, 로더) 로더로 쓰는 래퍼 (fhir_index.IndexedSource 와 같은 속성).
+
+    호출하면 텍스트를 돌려주고, content_hash 는 원본 바이트의 해시라 캐시 키를 만들 때 디코딩이나
+    JSON 파싱을 하지 않는다 (문서는 프롬프트를 만들 때 한 번만 파싱한다). content_hash 는 처음
+    읽을 때 파일을 훑으므로 I/O 스레드에서 읽는다.
+    """
+
+    __slots__ = ("upload", "_hash")
+
+    def __init__(self, upload: SpooledUpload):
+        self.upload = upload
+        self._hash = None
+
+    def __call__(self) -> str:
+        return self.upload.read_text()
+
+    @property
+    def content_hash(self) -> str:
+        if self._hash is None:
+            with self.upload.buffer() as buf:
+                self._hash = report_cache.bytes_hash(buf)
+        return self._hash
+
+
+def _spool_file(fileobj, filename):
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    if size <= UPLOAD_SPOOL_THRESHOLD:
+        return SpooledUpload(filename, size, data=fileobj.read())
+    # 이름 있는 임시 파일로 청크 단위 복사 (프로세스 풀 워커가 경로로 열 수 있도록)
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=UPLOAD_TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(fileobj, out, _COPY_CHUNK)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(filename, size, path=path)
+
+
+async def spool(upload) -> SpooledUpload:
+    """UploadFile 을 SpooledUpload 로 변환. 사용 후 close() 로 임시 파일을 지운다"""
+    return await run_io(_spool_file, upload.file, upload.filename)